@@ -411,7 +411,8 @@ const handleSubmitForGrading = () => {
     questionId: workbenchData.questionId,
     code: workbenchData.code,
     schema: cleanSchema, // Use the clean schema that properly includes attributes
-    relationships: Array.from(relationships.entries())
+    relationships: Array.from(relationships.entries()),
+    async: true // Graded in the background; the result is long-polled below
   };
   
   // Debug serialization
@@ -420,6 +421,26 @@ const handleSubmitForGrading = () => {
   const parsedBack = JSON.parse(serializedData);
   console.log("PARSED BACK SCHEMA (first entity):", parsedBack.schema[0]);
   
+  // Long-poll the grading queue until the submission has been graded,
+  // giving up after MAX_GRADE_POLLS polls of up to 25 seconds each
+  const MAX_GRADE_POLLS = 12;
+  const waitForGrade = (gradeUrl, poll = 1) =>
+    fetch(`http://127.0.0.1:5000${gradeUrl}?wait=25`)
+      .then(response => response.json())
+      .then(result => {
+        if (result.status !== 'queued' && result.status !== 'grading') {
+          return result;
+        }
+        if (poll >= MAX_GRADE_POLLS) {
+          return {
+            ...result,
+            status: 'timeout',
+            error: 'Grading is taking longer than expected. Your submission is saved; please check back later.'
+          };
+        }
+        return waitForGrade(gradeUrl, poll + 1);
+      });
+
   // Send to your backend for grading
   fetch('http://127.0.0.1:5000/api/submit', {
     method: 'POST',
@@ -429,9 +450,39 @@ const handleSubmitForGrading = () => {
     body: JSON.stringify(submissionData),
   })
   .then(response => response.json())
+  .then(data => {
+    if (data && data.retryAfter) {
+      // Grading queue is full
+      return data;
+    }
+    if (data && data.status === 'queued' && data.gradeUrl) {
+      setWorkbenchData(prev => ({
+        ...prev,
+        consoleOutput: prev.consoleOutput + `<br><br><span style='color: #54a0ff'>Submission received, grading...</span>`
+      }));
+      return waitForGrade(data.gradeUrl);
+    }
+    return data;
+  })
   .then(data => {
     console.log('Grading result:', data);
     
+    if (data && data.retryAfter) {
+      setWorkbenchData(prev => ({
+        ...prev,
+        consoleOutput: prev.consoleOutput + `<br><br><span style='color: #ff6b6b'>❌ ${data.error} (retry in ${data.retryAfter}s)</span>`
+      }));
+      return;
+    }
+
+    if (data && (data.status === 'failed' || data.status === 'timeout')) {
+      setWorkbenchData(prev => ({
+        ...prev,
+        consoleOutput: prev.consoleOutput + `<br><br><span style='color: #ff6b6b'>❌ ${data.status === 'failed' ? 'Grading failed. Please try again.' : data.error}</span>`
+      }));
+      return;
+    }
+
     // Extract grade information if available
     if (data && data.grade) {
       // Parse the score and feedback
@@ -852,6 +903,52 @@ const handleSubmitForGrading = () => {
         
         // Set up live validation with backend
         let validationTimeout = null;
+        // Each request carries this editor's session id and an increasing sequence
+        // number so the server can cancel validations a newer one has replaced
+        const validationSessionId = `editor-${Date.now()}-${Math.random().toString(36).slice(2)}`;
+        let validationSeq = 0;
+        
+        // Turn {line, message, severity} entries into Monaco markers under `owner`
+        const showDiagnostics = (owner, errors) => {
+          const model = editor.getModel();
+          if (!model) return;
+          
+          const markers = errors.map(err => ({
+            severity: 
+              err.severity === 'error' ? monaco.MarkerSeverity.Error : 
+              err.severity === 'warning' ? monaco.MarkerSeverity.Warning : 
+              monaco.MarkerSeverity.Info,
+            message: err.message,
+            startLineNumber: err.line,
+            startColumn: 1,
+            endLineNumber: err.line,
+            endColumn: model.getLineMaxColumn(err.line) || 1
+          }));
+          
+          monaco.editor.setModelMarkers(model, owner, markers);
+        };
+        
+        // One long-lived stream per editor: revisions are POSTed, and the server
+        // streams the fast syntax check and then the compiler diagnostics of the newest one
+        const streamUrl = `http://127.0.0.1:5000/api/validate/stream/${validationSessionId}`;
+        const validationStream = typeof EventSource !== 'undefined' ? new EventSource(streamUrl) : null;
+        if (validationStream) {
+          validationStream.addEventListener('syntax', event => {
+            const data = JSON.parse(event.data);
+            if (data.seq !== validationSeq) return;
+            showDiagnostics('backend-syntax', data.errors);
+          });
+          validationStream.addEventListener('diagnostics', event => {
+            const data = JSON.parse(event.data);
+            // A busy server skipped the compiler tier; keep the syntax markers until the next revision
+            if (data.seq !== validationSeq || data.busy) return;
+            // The compiler tier supersedes the syntax tier
+            showDiagnostics('backend-syntax', []);
+            showDiagnostics('backend-validation', data.errors);
+          });
+          editor.onDidDispose(() => validationStream.close());
+        }
+        
         editor.onDidChangeModelContent(() => {
           // Use a debounce mechanism to avoid too many requests
           clearTimeout(validationTimeout);
@@ -860,49 +957,44 @@ const handleSubmitForGrading = () => {
             const code = editor.getValue();
             if (!code.trim()) {
               // Clear markers if code is empty
+              monaco.editor.setModelMarkers(editor.getModel(), 'backend-syntax', []);
               monaco.editor.setModelMarkers(editor.getModel(), 'backend-validation', []);
               return;
             }
             
-            // Determine endpoint based on syntax
-            const endpoint = workbenchData.syntax === SYNTAX_TYPES.JAVA 
-              ? 'http://127.0.0.1:5000/api/validate/java'
-              : 'http://127.0.0.1:5000/api/validate/python';
+            validationSeq += 1;
+            const seq = validationSeq;
+            const language = workbenchData.syntax === SYNTAX_TYPES.JAVA ? 'java' : 'python';
+            
+            if (validationStream && validationStream.readyState === EventSource.OPEN) {
+              // Results arrive on the stream (a refused or reconnecting one validates per request)
+              fetch(streamUrl, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ code, seq, language }),
+              })
+              .catch(error => {
+                console.error('Error sending code for validation:', error);
+              });
+              return;
+            }
             
             // Call the backend validation API
-            fetch(endpoint, {
+            fetch(`http://127.0.0.1:5000/api/validate/${language}`, {
               method: 'POST',
               headers: { 'Content-Type': 'application/json' },
-              body: JSON.stringify({ code }),
+              body: JSON.stringify({ code, sessionId: validationSessionId, seq }),
             })
             .then(response => response.json())
             .then(data => {
-              // Add markers to the editor
-              const model = editor.getModel();
-              if (!model) return;
-              
-              // Clear previous markers
-              monaco.editor.setModelMarkers(model, 'backend-validation', []);
-              
-              // Add new markers
-              const markers = data.errors.map(err => ({
-                severity: 
-                  err.severity === 'error' ? monaco.MarkerSeverity.Error : 
-                  err.severity === 'warning' ? monaco.MarkerSeverity.Warning : 
-                  monaco.MarkerSeverity.Info,
-                message: err.message,
-                startLineNumber: err.line,
-                startColumn: 1,
-                endLineNumber: err.line,
-                endColumn: model.getLineMaxColumn(err.line) || 1
-              }));
-              
-              monaco.editor.setModelMarkers(model, 'backend-validation', markers);
+              // Ignore replies for code that has changed since, and busy (429) replies
+              if (data.superseded || data.busy || seq !== validationSeq) return;
+              showDiagnostics('backend-validation', data.errors);
             })
             .catch(error => {
               console.error('Error validating code:', error);
             });
-          }, 1000); // 1 second delay after typing stops
+          }, 400); // Short delay; the server drops revisions that have been replaced
         });
       }}
     />
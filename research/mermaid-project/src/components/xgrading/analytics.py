@@ -0,0 +1,310 @@
+import json
+import re
+from collections import Counter
+
+import click
+from flask import jsonify, request
+from sqlalchemy import func, select, tuple_
+
+from models import (db, upsert, AttemptBucket, Grade, GradedSubmission, MissingItem, QuestionAnalytics,
+                    ScoreBucket, StudentAttempts, Submission)
+
+# Per-question analytics, maintained as submissions and grades are recorded.
+#
+#   GET /api/analytics/<question>           score histogram, most commonly missing
+#                                           items, attempts per student
+#   flask --app server analytics-rebuild    recompute from the stored history
+#
+# Every count is a row incremented with an upsert in the same transaction as the
+# submission or grade it comes from, so all server processes share one set of
+# aggregates and the endpoint reads a handful of small rows however many
+# submissions there are. Only a submission's current grade counts: what it
+# contributed is kept in `analytics_submission` and taken back out when the
+# submission is regraded.
+
+# Score histogram buckets of 10 points (the last one is 90-100)
+SCORE_BUCKETS = 10
+# Students with this many attempts or more share the last attempts bucket
+ATTEMPT_BUCKETS = 10
+DEFAULT_TOP_ITEMS = 10
+MAX_TOP_ITEMS = 100
+MISSING_KINDS = ('entity', 'attribute', 'relationship', 'method')
+
+# The "✗" feedback items of grade_entities, grade_relationships and grade_methods that
+# report something missing: (kind, pattern, item name from the groups)
+MISSING_PATTERNS = (
+    ('entity', re.compile(r'✗ Missing required entity: (.+)'), lambda m: m.group(1)),
+    ('attribute', re.compile(r'✗ Entity (.+) is missing attribute: (.+)'), lambda m: f"{m.group(1)}.{m.group(2)}"),
+    # Not every grading path lowercases the relationship, so one is counted under one key
+    ('relationship', re.compile(r'✗ Missing relationship: (.+)'), lambda m: m.group(1).lower()),
+    ('method', re.compile(r'✗ Class (.+) is missing required method: (.+)'), lambda m: f"{m.group(1)}.{m.group(2)}"),
+    ('method', re.compile(r'✗ Missing method: (.+) \(class (.+) not found\)'), lambda m: f"{m.group(2)}.{m.group(1)}"),
+)
+
+def missing_items(details):
+    """
+    Extract the missing entities, attributes, relationships and methods from a grade's details.
+
+    Args:
+        details (dict): The "details" of a grade_submission result (may be None)
+    Returns:
+        list: Sorted, distinct [kind, item] pairs
+    """
+    items = set()
+    for section in (details or {}).values():
+        for line in (section or {}).get("feedback") or ():
+            if not line.startswith("✗"):
+                continue
+            for kind, pattern, name in MISSING_PATTERNS:
+                match = pattern.fullmatch(line)
+                if match:
+                    items.add((kind, name(match)[:255]))
+                    break
+    return [list(item) for item in sorted(items)]
+
+def score_bucket(score):
+    return min(max(int(score) // 10, 0), SCORE_BUCKETS - 1)
+
+def _increment(model, rows):
+    """
+    Add rows to a counter table: each row's non-key values are added to the stored row
+    with the same primary key (which is created if it doesn't exist).
+    """
+    keys = [column.name for column in model.__table__.primary_key.columns]
+    # Rows that add nothing (e.g. a regrade that kept its bucket) are skipped
+    rows = [row for row in rows if any(value for name, value in row.items() if name not in keys)]
+    if not rows:
+        return
+    statement = upsert(model)
+    counters = [name for name in rows[0] if name not in keys]
+    statement = statement.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: getattr(model, name) + statement.excluded[name] for name in counters}
+    )
+    db.session.execute(statement, rows)
+
+def count_submissions(submissions):
+    """
+    Count new submissions and each student's attempts. Runs in the caller's transaction;
+    the caller commits.
+
+    Args:
+        submissions (list): (question_id, student_id) of each new submission
+    """
+    if not submissions:
+        return
+    attributed = Counter(question_id for question_id, student_id in submissions if student_id)
+    # Written first: SQLite takes the write lock here, so the attempt counts read
+    # below can't change before this transaction commits
+    _increment(QuestionAnalytics, [
+        {"question_id": question_id, "submissions": count, "student_submissions": attributed[question_id],
+         "students": 0, "graded": 0, "score_sum": 0.0}
+        for question_id, count in Counter(question_id for question_id, _ in submissions).items()
+    ])
+
+    added = Counter((question_id, student_id) for question_id, student_id in submissions if student_id)
+    keys = list(added)
+    previous = {}
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        rows = StudentAttempts.query.filter(
+            tuple_(StudentAttempts.question_id, StudentAttempts.student_id).in_(chunk)
+        ).all()
+        previous.update({(row.question_id, row.student_id): row.attempts for row in rows})
+
+    buckets = Counter()
+    new_students = Counter()
+    for (question_id, student_id), count in added.items():
+        old = previous.get((question_id, student_id), 0)
+        if old:
+            buckets[(question_id, min(old, ATTEMPT_BUCKETS))] -= 1
+        else:
+            new_students[question_id] += 1
+        buckets[(question_id, min(old + count, ATTEMPT_BUCKETS))] += 1
+
+    _increment(StudentAttempts, [
+        {"question_id": question_id, "student_id": student_id, "attempts": count}
+        for (question_id, student_id), count in added.items()
+    ])
+    _increment(AttemptBucket, [
+        {"question_id": question_id, "attempts": attempts, "students": count}
+        for (question_id, attempts), count in buckets.items()
+    ])
+    _increment(QuestionAnalytics, [
+        {"question_id": question_id, "submissions": 0, "student_submissions": 0, "students": count,
+         "graded": 0, "score_sum": 0.0}
+        for question_id, count in new_students.items()
+    ])
+
+def count_grades(grades):
+    """
+    Make these grades the current grades of their submissions in the analytics. Runs in
+    the caller's transaction, after the grades themselves have been written; the caller commits.
+
+    Args:
+        grades (list): (submission_id, question_id, score, details) of each grade
+    """
+    grades = [grade for grade in grades if grade[2] is not None]
+    if not grades:
+        return
+    db.session.flush()
+
+    current = {}
+    ids = list({grade[0] for grade in grades})
+    graded_ids = set(ids)
+    for start in range(0, len(ids), 500):
+        rows = GradedSubmission.query.filter(GradedSubmission.submission_id.in_(ids[start:start + 500])).all()
+        current.update({row.submission_id: (row.question_id, row.score, json.loads(row.missing)) for row in rows})
+
+    buckets = Counter()
+    items = Counter()
+    graded = Counter()
+    score_sums = Counter()
+    for submission_id, question_id, score, details in grades:
+        old = current.get(submission_id)
+        if old is not None:
+            old_question, old_score, old_missing = old
+            buckets[(old_question, score_bucket(old_score))] -= 1
+            graded[old_question] -= 1
+            score_sums[old_question] -= old_score
+            for kind, item in old_missing:
+                items[(old_question, kind, item)] -= 1
+        missing = missing_items(details)
+        buckets[(question_id, score_bucket(score))] += 1
+        graded[question_id] += 1
+        score_sums[question_id] += score
+        for kind, item in missing:
+            items[(question_id, kind, item)] += 1
+        current[submission_id] = (question_id, score, missing)
+
+    _increment(ScoreBucket, [
+        {"question_id": question_id, "bucket": bucket, "count": count}
+        for (question_id, bucket), count in buckets.items()
+    ])
+    _increment(MissingItem, [
+        {"question_id": question_id, "kind": kind, "item": item, "count": count}
+        for (question_id, kind, item), count in items.items()
+    ])
+    _increment(QuestionAnalytics, [
+        {"question_id": question_id, "submissions": 0, "student_submissions": 0, "students": 0,
+         "graded": graded[question_id], "score_sum": score_sums[question_id]}
+        for question_id in graded
+    ])
+
+    statement = upsert(GradedSubmission)
+    statement = statement.on_conflict_do_update(
+        index_elements=['submission_id'],
+        set_={name: statement.excluded[name] for name in ('question_id', 'score', 'missing')}
+    )
+    db.session.execute(statement, [
+        {"submission_id": submission_id, "question_id": question_id, "score": score, "missing": json.dumps(missing)}
+        for submission_id, (question_id, score, missing) in current.items()
+        if submission_id in graded_ids
+    ])
+
+def question_analytics(question_id, top=DEFAULT_TOP_ITEMS):
+    """
+    Read a question's aggregates: a fixed number of primary-key and index lookups.
+
+    Args:
+        question_id (str): The ID of the question
+        top (int): How many of the most commonly missing items of each kind to return
+    Returns:
+        dict: The analytics
+    """
+    totals = db.session.get(QuestionAnalytics, question_id)
+    histogram = [0] * SCORE_BUCKETS
+    for row in ScoreBucket.query.filter_by(question_id=question_id):
+        histogram[row.bucket] = row.count
+    attempts = {row.attempts: row.students for row in AttemptBucket.query.filter_by(question_id=question_id)}
+
+    missing = {}
+    for kind in MISSING_KINDS:
+        rows = (MissingItem.query.filter(MissingItem.question_id == question_id, MissingItem.kind == kind,
+                                         MissingItem.count > 0)
+                .order_by(MissingItem.count.desc(), MissingItem.item).limit(top).all())
+        missing[kind] = [{"item": row.item, "count": row.count} for row in rows]
+
+    students = totals.students if totals else 0
+    graded = totals.graded if totals else 0
+    return {
+        "questionId": question_id,
+        "submissions": totals.submissions if totals else 0,
+        "graded": graded,
+        "meanScore": round(totals.score_sum / graded, 2) if graded else None,
+        "scoreHistogram": [
+            {"range": f"{bucket * 10}-{bucket * 10 + 9 if bucket < SCORE_BUCKETS - 1 else 100}", "count": count}
+            for bucket, count in enumerate(histogram)
+        ],
+        "missing": missing,
+        "students": students,
+        # Submissions by students after their first (anonymous submissions aren't attributed)
+        "resubmissions": totals.student_submissions - students if totals else 0,
+        "attempts": [
+            {"attempts": f"{count}+" if count == ATTEMPT_BUCKETS else str(count), "students": attempts[count]}
+            for count in sorted(attempts) if attempts[count] > 0
+        ]
+    }
+
+def rebuild_analytics(question_ids=None, batch_size=500):
+    """
+    Recompute the analytics from the submission index and the grades table in one
+    streaming pass. Must run inside an app context, while nothing is being graded.
+
+    Args:
+        question_ids (list): Only these questions (all if empty)
+        batch_size (int): Submissions read and counted per transaction
+    Returns:
+        int: The number of submissions counted
+    """
+    for model in (QuestionAnalytics, ScoreBucket, MissingItem, StudentAttempts, AttemptBucket, GradedSubmission):
+        query = model.query
+        if question_ids:
+            query = query.filter(model.question_id.in_(question_ids))
+        query.delete(synchronize_session=False)
+    db.session.commit()
+
+    # Each submission with its latest grade (if it has one)
+    latest = (select(Grade.submission_id, func.max(Grade.id).label('grade_id'))
+              .group_by(Grade.submission_id).subquery())
+    query = (select(Submission.id, Submission.question_id, Submission.student_id, Submission.score, Grade.details)
+             .outerjoin(latest, latest.c.submission_id == Submission.id)
+             .outerjoin(Grade, Grade.id == latest.c.grade_id)
+             .order_by(Submission.question_id, Submission.timestamp, Submission.seq))
+    if question_ids:
+        query = query.where(Submission.question_id.in_(question_ids))
+
+    counted = 0
+    # Read on a connection of its own so the session can commit between batches
+    with db.engine.connect() as reader:
+        result = reader.execution_options(yield_per=batch_size).execute(query)
+        for rows in result.partitions():
+            count_submissions([(row.question_id, row.student_id) for row in rows])
+            count_grades([(row.id, row.question_id, row.score, json.loads(row.details) if row.details else None)
+                          for row in rows])
+            db.session.commit()
+            counted += len(rows)
+    return counted
+
+def setup_analytics(app):
+    """
+    Register the analytics route and the `flask analytics-rebuild` command.
+
+    Args:
+        app: The Flask application
+    """
+    @app.route('/api/analytics/<question_id>', methods=['GET'])
+    def get_question_analytics(question_id):
+        try:
+            top = min(max(int(request.args.get('top', DEFAULT_TOP_ITEMS)), 1), MAX_TOP_ITEMS)
+        except ValueError:
+            return jsonify({"error": "top must be an integer"}), 400
+        return jsonify(question_analytics(question_id, top))
+
+    @app.cli.command('analytics-rebuild')
+    @click.option('--question', 'questions', multiple=True, help='Question to rebuild (repeatable, default: all).')
+    @click.option('--batch-size', type=int, default=500, show_default=True, help='Submissions per transaction.')
+    def analytics_rebuild_command(questions, batch_size):
+        """Recompute the per-question analytics from the stored submissions and grades."""
+        counted = rebuild_analytics(list(questions), batch_size)
+        click.echo(f"Counted {counted} submissions")
@@ -0,0 +1,331 @@
+"""
+Benchmarks and golden-score regression check for the grading core.
+
+    python bench_grading.py                          # golden check + benchmarks
+    python bench_grading.py --save-baseline          # record this machine's timings
+    python bench_grading.py --max-regression 25      # fail if anything got >25% slower
+
+1. Golden scores: regrades every stored submission (Submissions/*/*.json) and
+   compares the score and hashes of the feedback and details with
+   golden_scores.json. Any difference fails the run. After an intended grading
+   change, rewrite the file with --update-golden.
+
+2. Benchmarks: times parse_mermaid_schema, grade_entities, grade_methods,
+   grade_relationships and generate_feedback on the reference diagram of every
+   question in Questions/ and on generated diagrams of 100 to 5,000 classes,
+   each graded against a perturbed copy of itself (missing, extra and renamed
+   classes, methods and relationships). With a baseline file (bench_baseline.json
+   by default, written by --save-baseline), any stage slower than the baseline by
+   more than --max-regression percent is rerun (--confirm times), and fails the
+   run if it is still slower. Timings only compare on the same machine, so record
+   the baseline where the check runs (e.g. on the CI runner before a change).
+
+Exits with status 1 on any failure, so it can run headless in CI.
+"""
+import argparse
+import contextlib
+import gc
+import glob
+import hashlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+from grading import (DiagramIndex, generate_feedback, get_reference_solution, grade_entities,
+                     grade_methods, grade_relationships, grade_submission)
+from mermaid_parser import parse_mermaid_schema
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_FILE = os.path.join(BASE_DIR, 'golden_scores.json')
+BASELINE_FILE = os.path.join(BASE_DIR, 'bench_baseline.json')
+QUESTIONS_GLOB = os.path.join(BASE_DIR, 'Questions', '*', 'question.html')
+SUBMISSIONS_GLOB = os.path.join(BASE_DIR, 'Submissions', '*', '*.json')
+GENERATED_SIZES = (100, 500, 1000, 5000)
+STAGES = ('parse_mermaid_schema', 'grade_entities', 'grade_methods', 'grade_relationships', 'generate_feedback')
+# Timings below this (seconds) are too noisy to flag as regressions
+MIN_COMPARABLE = 0.0005
+
+@contextlib.contextmanager
+def quiet():
+    # The grading functions print debug output for every entity
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+# ===== GOLDEN SCORES =====
+
+def grade_stored_submissions():
+    """
+    Regrade every stored submission.
+
+    Returns:
+        dict: {submission_id: {score, feedback_sha256, details_sha256}}
+    """
+    results = {}
+    for path in sorted(glob.glob(SUBMISSIONS_GLOB)):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        with quiet():
+            result = grade_submission(data.get('questionId'), data.get('code'), data.get('schema') or [],
+                                      data.get('relationships'))
+        results[os.path.splitext(os.path.basename(path))[0]] = {
+            "score": result.get("score"),
+            "feedback_sha256": digest(result.get("feedback")),
+            "details_sha256": digest(result.get("details"))
+        }
+    return results
+
+def check_golden(update=False):
+    """
+    Returns:
+        bool: Whether every stored submission still grades exactly as recorded
+    """
+    current = grade_stored_submissions()
+    if update or not os.path.exists(GOLDEN_FILE):
+        with open(GOLDEN_FILE, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Golden scores: wrote {len(current)} submissions to {os.path.basename(GOLDEN_FILE)}")
+        return True
+
+    with open(GOLDEN_FILE, 'r') as f:
+        golden = json.load(f)
+    failures = []
+    for submission_id, expected in sorted(golden.items()):
+        actual = current.get(submission_id)
+        if actual is None:
+            print(f"  (skipped {submission_id}: submission file no longer exists)")
+            continue
+        changed = [key for key in expected if expected[key] != actual.get(key)]
+        if changed:
+            failures.append(submission_id)
+            print(f"  CHANGED {submission_id}: {', '.join(changed)} "
+                  f"(score {expected['score']} -> {actual['score']})")
+    new = sorted(set(current) - set(golden))
+    print(f"Golden scores: {len(golden)} recorded, {len(failures)} changed"
+          + (f", {len(new)} new submissions not in the golden file" if new else ""))
+    return not failures
+
+# ===== BENCHMARKS =====
+
+def generate_reference(classes, seed=0):
+    """
+    Build a reference schema of `classes` classes in the <uml-design-elements> format.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for i in range(classes):
+        attributes = ';'.join(f"field{i}_{a}" for a in range(3))
+        lines.append(f"[Class{i}|{attributes}|")
+        lines.extend(f"+void method{i}_{m}(int a, String b);" for m in range(3))
+        lines.append("]")
+    for i in range(1, classes):
+        lines.append(f'[Class{rng.randrange(i)}]o--"0..*"[Class{i}]')
+        if i % 3 == 0:
+            lines.append(f'[Class{i}]*--"1"[Class{rng.randrange(i)}]')
+        if i % 7 == 0:
+            lines.append(f"[Class{rng.randrange(i)}]<|..[Class{i}]")
+    return '\n'.join(lines)
+
+def perturbed_submission(ref_entities, ref_relationships, seed=0):
+    """
+    A submission in the /api/submit shape, derived from a reference: about 10% of
+    classes dropped, 5% extra classes, and some renamed methods and missing relationships.
+
+    Returns:
+        tuple: (schema list, relationships list)
+    """
+    rng = random.Random(seed)
+    schema = []
+    for name, entity in ref_entities.items():
+        if rng.random() < 0.1:
+            continue
+        methods = [dict(method, name=method["name"] + ("X" if rng.random() < 0.1 else ""))
+                   for method in entity["methods"]]
+        schema.append([name, {
+            "entity": entity["entity"],
+            "attribute": {attr: {"attribute": attr, "type": "String"} for attr in entity["attribute"]},
+            "methods": methods
+        }])
+    for i in range(max(1, len(ref_entities) // 20)):
+        schema.append([f"extra{i}", {"entity": f"Extra{i}", "attribute": {}, "methods": []}])
+
+    relationships = []
+    for i, rel in enumerate(ref_relationships):
+        if rng.random() < 0.1:
+            continue
+        relationships.append([f"rel{i}", {
+            "type": rel["type"],
+            "relationA": rel["source"],
+            "relationB": rel["target"],
+            "cardinalityA": rel.get("cardinality", "")
+        }])
+    return schema, relationships
+
+def median_of(repeat, fn, *args):
+    # The median rather than the best run: on a shared machine the fastest run is
+    # as much luck as the slowest, and a lucky baseline makes every later run "slower"
+    times = []
+    result = None
+    for _ in range(repeat):
+        # Like timeit: a collection landing in one run but not another is just noise
+        gc.collect()
+        gc.disable()
+        try:
+            with quiet():
+                start = time.perf_counter()
+                result = fn(*args)
+                times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return statistics.median(times), result
+
+def bench_case(reference_text, marking_criteria, repeat):
+    """
+    Time every grading stage on one reference diagram.
+
+    Returns:
+        dict: {stage: median seconds}
+    """
+    timings = {}
+    timings['parse_mermaid_schema'], (ref_entities, ref_relationships) = median_of(
+        repeat, parse_mermaid_schema, reference_text)
+    schema, relationships = perturbed_submission(ref_entities, ref_relationships)
+
+    submitted_entities = {name: data for name, data in schema}
+    submitted_index = DiagramIndex(submitted_entities)
+    ref_index = DiagramIndex(ref_entities, ref_relationships)
+
+    timings['grade_entities'], entity_result = median_of(
+        repeat, grade_entities, submitted_entities, ref_entities, marking_criteria, ref_relationships,
+        submitted_index, ref_index)
+    timings['grade_methods'], method_result = median_of(
+        repeat, grade_methods, submitted_entities, ref_entities, marking_criteria, submitted_index, ref_index)
+    timings['grade_relationships'], relationship_result = median_of(
+        repeat, grade_relationships, relationships, ref_relationships, marking_criteria, ref_index)
+    timings['generate_feedback'], _ = median_of(repeat, generate_feedback, {
+        "entity_score": entity_result,
+        "relationship_score": relationship_result,
+        "method_score": method_result
+    })
+    return timings
+
+def benchmark_cases(repeat):
+    """
+    Returns:
+        list: (case, reference text, marking criteria, repeats) for every benchmark
+    """
+    cases = []
+    for question_file in sorted(glob.glob(QUESTIONS_GLOB)):
+        question_id = os.path.basename(os.path.dirname(question_file))
+        with quiet():
+            reference = get_reference_solution(question_id)
+        if reference is None or not reference.has_schema:
+            continue
+        cases.append((f"question:{question_id}", reference.reference_schema, reference.marking_criteria, repeat))
+    marking_criteria = {'entity-name': 0.2, 'entity-attributes': 0.1, 'relationship': 0.5, 'cardinality': 0.25,
+                        'extra-entity-penalty': 0.25, 'extra-relationship-penalty': 0.25}
+    for classes in GENERATED_SIZES:
+        # Fewer repeats for the big diagrams; they are far less noisy
+        cases.append((f"generated:{classes}", generate_reference(classes), marking_criteria,
+                      min(repeat, max(5, repeat * 100 // classes))))
+    return cases
+
+def run_benchmarks(cases, results=None):
+    """
+    Run the benchmark cases, keeping the faster timing where results already has one.
+
+    Returns:
+        dict: {case: {stage: median seconds}}
+    """
+    results = results if results is not None else {}
+    for case, reference_text, marking_criteria, repeat in cases:
+        timings = bench_case(reference_text, marking_criteria, repeat)
+        previous = results.get(case, {})
+        results[case] = {stage: min(seconds, previous.get(stage, seconds)) for stage, seconds in timings.items()}
+    return results
+
+def print_benchmarks(results, baseline):
+    print(f"{'case':<22}" + ''.join(f"{stage:>22}" for stage in STAGES))
+    for case, timings in results.items():
+        cells = []
+        for stage in STAGES:
+            cell = f"{timings[stage] * 1000:.3f} ms"
+            old = baseline.get(case, {}).get(stage)
+            if old:
+                cell += f" ({timings[stage] / old - 1:+.0%})"
+            cells.append(f"{cell:>22}")
+        print(f"{case:<22}" + ''.join(cells))
+
+def regressions(results, baseline, max_regression):
+    """
+    Returns:
+        list: (case, stage, old, new) for every timing more than max_regression percent slower
+    """
+    slower = []
+    for case, timings in results.items():
+        for stage, seconds in timings.items():
+            old = baseline.get(case, {}).get(stage)
+            if old and max(old, seconds) >= MIN_COMPARABLE and seconds > old * (1 + max_regression / 100):
+                slower.append((case, stage, old, seconds))
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20, help='Runs per measurement (the median is kept)')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Baseline timings to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='Write this run as the new baseline')
+    parser.add_argument('--max-regression', type=float, default=20,
+                        help='Fail if a timing is this many percent slower than the baseline')
+    parser.add_argument('--confirm', type=int, default=3,
+                        help='Times a case that looks slower is rerun before it counts as a regression')
+    parser.add_argument('--update-golden', action='store_true', help='Rewrite golden_scores.json from this run')
+    parser.add_argument('--skip-golden', action='store_true', help='Only run the benchmarks')
+    parser.add_argument('--skip-bench', action='store_true', help='Only run the golden-score check')
+    args = parser.parse_args()
+
+    ok = True
+    if not args.skip_golden:
+        ok = check_golden(args.update_golden) and ok
+
+    if not args.skip_bench:
+        baseline = {}
+        if os.path.exists(args.baseline) and not args.save_baseline:
+            with open(args.baseline, 'r') as f:
+                baseline = json.load(f)
+        cases = benchmark_cases(args.repeat)
+        results = run_benchmarks(cases)
+        if baseline and not args.save_baseline:
+            # A slowdown has to show up again before it counts: rerun the cases that
+            # look slower and keep their best timings
+            for _ in range(args.confirm):
+                flagged = {case for case, _, _, _ in regressions(results, baseline, args.max_regression)}
+                if not flagged:
+                    break
+                run_benchmarks([c for c in cases if c[0] in flagged], results)
+        print_benchmarks(results, baseline)
+
+        if args.save_baseline:
+            with open(args.baseline, 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+                f.write('\n')
+            print(f"Baseline written to {args.baseline}")
+        elif baseline:
+            slower = regressions(results, baseline, args.max_regression)
+            for case, stage, old, new in slower:
+                print(f"  REGRESSION {case} {stage}: {old * 1000:.3f} ms -> {new * 1000:.3f} ms")
+            print(f"Benchmarks: {len(slower)} timings more than {args.max_regression:g}% slower than the baseline")
+            ok = ok and not slower
+        else:
+            print("Benchmarks: no baseline to compare against (run with --save-baseline)")
+
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
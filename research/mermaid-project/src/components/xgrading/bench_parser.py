@@ -0,0 +1,84 @@
+"""
+Throughput benchmark for mermaid_parser.
+
+    python bench_parser.py --lines 10000 --repeat 5
+
+Parses a generated diagram of roughly --lines lines (classes with attributes and
+methods plus relationships between them), then a set of pathological long lines
+that used to make the regex parser backtrack. Each case is also run at 2x and 4x
+the size to show the time grows linearly.
+"""
+import argparse
+import time
+
+from mermaid_parser import iter_schema, parse_mermaid_schema
+
+def generate_diagram(lines):
+    """
+    Build a schema of about `lines` lines.
+    """
+    out = []
+    index = 0
+    while len(out) < lines:
+        name = f"Class{index}"
+        out.append(f"[{name}|id;name;createdAt;updatedAt|")
+        out.extend(f"+void method{m}(int a, String b);" for m in range(4))
+        out.append("]")
+        if index:
+            out.append(f'[Class{index - 1}]o--"0..*"[{name}]')
+            out.append(f'[{name}]*--"1"[Class{index // 2}]')
+        if index % 5 == 0:
+            out.append(f"[Interface{index}]<|..[{name}]")
+        index += 1
+    return '\n'.join(out[:lines])
+
+def generate_pathological(length):
+    """
+    Lines that make lazy `.*?` patterns retry at every position.
+    """
+    return '\n'.join([
+        '+' + ' a' * (length // 2),                 # method with no parentheses
+        '+ ' + 'x ' * (length // 2) + '(',          # '(' but never a ')'
+        '[' + ']' * length + '<|..',                # implementation without a target
+        '[' + '] o-- "' * (length // 7),            # aggregation with unterminated cardinality
+        '[A]*--"' + '" ' * (length // 2),           # composition without a target
+    ])
+
+def best_of(repeat, fn, *args):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def stream(text):
+    for _ in iter_schema(text.splitlines()):
+        pass
+
+def report(label, text, repeat, fn):
+    seconds = best_of(repeat, fn, text)
+    lines = text.count('\n') + 1
+    print(f"{label:<34} {lines:>8} lines {len(text) / 1e6:>7.2f} MB "
+          f"{seconds * 1000:>9.1f} ms {lines / seconds:>12,.0f} lines/s {len(text) / 1e6 / seconds:>7.1f} MB/s")
+    return seconds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=10000, help='Lines in the generated diagram')
+    parser.add_argument('--line-length', type=int, default=20000, help='Length of the pathological lines')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per case (best is reported)')
+    args = parser.parse_args()
+
+    entities, relationships = parse_mermaid_schema(generate_diagram(args.lines))
+    print(f"Generated diagram: {len(entities)} classes, {len(relationships)} relationships")
+
+    for scale in (1, 2, 4):
+        report(f"parse_mermaid_schema x{scale}", generate_diagram(args.lines * scale), args.repeat, parse_mermaid_schema)
+    for scale in (1, 2, 4):
+        report(f"iter_schema (streaming) x{scale}", generate_diagram(args.lines * scale), args.repeat, stream)
+    for scale in (1, 2, 4):
+        report(f"pathological lines x{scale}", generate_pathological(args.line_length * scale), args.repeat, parse_mermaid_schema)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, upsert, Blob, Submission
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Content-addressed, delta-compressed submission storage.
+#
+# A submission is stored as two blobs: its code, and the rest of its payload
+# (schema, relationships, ...) as compact JSON. Blobs are addressed by the
+# sha256 of their content, so an unchanged resubmission stores nothing new.
+# A changed one is compressed with the same student's previous revision as a
+# preset dictionary (zlib zdict, or a raw-content zstd dictionary when the
+# zstandard package is installed): a near-duplicate costs a few dozen bytes.
+# Reads follow the chain of bases back to a whole blob, and reconstructed
+# content is kept in a small LRU cache, so consecutive revisions decompress once.
+#
+# `flask pack-submissions` (see submission_store.py) moves submissions imported
+# from Submissions/*/*.json into the blob store.
+
+# Codec for new blobs
+BLOB_CODEC = os.environ.get('XGRADING_BLOB_CODEC', 'zstd' if zstandard is not None else 'zlib')
+# Longest delta chain; the next revision is stored whole
+MAX_DELTA_DEPTH = int(os.environ.get('XGRADING_BLOB_MAX_DELTA_DEPTH', '32'))
+# Reconstructed blobs kept in memory
+BLOB_CACHE_SIZE = int(os.environ.get('XGRADING_BLOB_CACHE_SIZE', '1024'))
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 19
+
+# Payload fields stored in the submission row rather than the payload blob
+ROW_FIELDS = ('code', 'questionId', 'studentId', 'timestamp')
+
+def _compress(codec, content, base=None):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd blobs need the zstandard package")
+        dictionary = zstandard.ZstdCompressionDict(base, dict_type=zstandard.DICT_TYPE_RAWCONTENT) if base else None
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dictionary).compress(content)
+    compressor = zlib.compressobj(ZLIB_LEVEL, zdict=base) if base else zlib.compressobj(ZLIB_LEVEL)
+    return compressor.compress(content) + compressor.flush()
+
+def _decompress(codec, data, base=None):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd blobs need the zstandard package")
+        dictionary = zstandard.ZstdCompressionDict(base, dict_type=zstandard.DICT_TYPE_RAWCONTENT) if base else None
+        return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(data)
+    decompressor = zlib.decompressobj(zdict=base) if base else zlib.decompressobj()
+    return decompressor.decompress(data) + decompressor.flush()
+
+class BlobCache:
+    """
+    LRU cache of reconstructed blob content (blobs never change, so it is never invalidated).
+    """
+    def __init__(self, size=BLOB_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, blob_hash):
+        with self._lock:
+            content = self._entries.get(blob_hash)
+            if content is not None:
+                self._entries.move_to_end(blob_hash)
+            return content
+
+    def put(self, blob_hash, content):
+        with self._lock:
+            self._entries[blob_hash] = content
+            self._entries.move_to_end(blob_hash)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+blob_cache = BlobCache()
+
+# Blobs written in a session's open transaction only go into the cache once it
+# commits, so content whose write was rolled back is never served from the cache
+
+def _cached(blob_hash):
+    pending = db.session.info.get('pending_blobs')
+    if pending and blob_hash in pending:
+        return pending[blob_hash]
+    return blob_cache.get(blob_hash)
+
+def _cache(blob_hash, content):
+    pending = db.session.info.get('pending_blobs')
+    if pending is not None:
+        pending[blob_hash] = content
+    else:
+        blob_cache.put(blob_hash, content)
+
+@event.listens_for(Session, 'after_commit')
+def _cache_committed_blobs(session):
+    for blob_hash, content in session.info.pop('pending_blobs', {}).items():
+        blob_cache.put(blob_hash, content)
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_uncommitted_blobs(session):
+    session.info.pop('pending_blobs', None)
+
+def put_blob(content, base_hash=None):
+    """
+    Store content (unless a blob with the same hash exists). Runs in the caller's
+    transaction; the caller commits.
+
+    Args:
+        content (bytes): The content
+        base_hash (str): A similar blob to store it as a delta against, if that is smaller
+    Returns:
+        str: The blob's hash
+    """
+    blob_hash = hashlib.sha256(content).hexdigest()
+    if db.session.get(Blob, blob_hash) is not None:
+        return blob_hash
+
+    data = _compress(BLOB_CODEC, content)
+    base_depth = None
+    if base_hash:
+        base = db.session.get(Blob, base_hash)
+        if base is not None and base.depth < MAX_DELTA_DEPTH:
+            delta = _compress(BLOB_CODEC, content, get_blob(base_hash))
+            if len(delta) < len(data):
+                data, base_depth = delta, base.depth
+    db.session.execute(upsert(Blob).on_conflict_do_nothing(index_elements=['hash']), [{
+        "hash": blob_hash,
+        "base_hash": base_hash if base_depth is not None else None,
+        "depth": base_depth + 1 if base_depth is not None else 0,
+        "codec": BLOB_CODEC,
+        "size": len(content),
+        "data": data
+    }])
+    db.session.info.setdefault('pending_blobs', {})[blob_hash] = content
+    return blob_hash
+
+def get_blob(blob_hash):
+    """
+    Return the content of a stored blob.
+
+    Raises:
+        KeyError: If there is no blob with this hash
+    """
+    content = _cached(blob_hash)
+    if content is not None:
+        return content
+
+    # Walk back to a cached or whole blob, then apply the deltas forwards
+    chain = []
+    base = None
+    while blob_hash is not None:
+        blob = db.session.get(Blob, blob_hash)
+        if blob is None:
+            raise KeyError(blob_hash)
+        chain.append(blob)
+        blob_hash = blob.base_hash
+        if blob_hash is not None:
+            base = _cached(blob_hash)
+            if base is not None:
+                break
+    for blob in reversed(chain):
+        base = _decompress(blob.codec, blob.data, base)
+        _cache(blob.hash, base)
+    return base
+
+def _latest_stored(question_id, student_id):
+    # The student's (or for anonymous submissions, the question's) newest blob-stored submission
+    query = Submission.query.filter(Submission.question_id == question_id, Submission.code_hash.isnot(None))
+    if student_id is not None:
+        query = query.filter_by(student_id=student_id)
+    return query.order_by(Submission.timestamp.desc(), Submission.seq.desc()).first()
+
+def store_payload(submission, data, previous=None):
+    """
+    Store a submission's code and payload as blobs and point the row at them.
+
+    Args:
+        submission (Submission): The (new) submission row
+        data (dict): The submitted payload
+        previous (Submission): Revision to delta against (default: the student's latest)
+    """
+    if previous is None:
+        previous = _latest_stored(submission.question_id, submission.student_id)
+    payload = {key: value for key, value in data.items() if key not in ROW_FIELDS}
+    submission.code_hash = put_blob((data.get('code') or '').encode('utf-8'),
+                                    previous.code_hash if previous else None)
+    submission.payload_hash = put_blob(
+        json.dumps(payload, separators=(',', ':'), sort_keys=True, ensure_ascii=False).encode('utf-8'),
+        previous.payload_hash if previous else None
+    )
+    submission.code = None
+
+def submission_code(submission):
+    """Return the code of a Submission row, wherever it is stored."""
+    if submission.code is not None or submission.code_hash is None:
+        return submission.code or ''
+    return get_blob(submission.code_hash).decode('utf-8')
+
+def load_payload(submission):
+    """
+    Reconstruct the full payload of a blob-stored Submission row.
+    """
+    data = json.loads(get_blob(submission.payload_hash))
+    data.update({
+        "code": submission_code(submission),
+        "questionId": submission.question_id,
+        "timestamp": submission.timestamp
+    })
+    if submission.student_id is not None:
+        data["studentId"] = submission.student_id
+    return data
+
+def pack_submissions(submissions_dir, question_ids=None, delete_files=False, batch_size=200):
+    """
+    Move file-backed submissions into the blob store, each student's revisions in order.
+    Must run inside an app context.
+
+    Returns:
+        dict: Counts and sizes (bytes) before and after
+    """
+    query = Submission.query.filter(Submission.payload_hash.is_(None), Submission.path.isnot(None))
+    if question_ids:
+        query = query.filter(Submission.question_id.in_(question_ids))
+    ids = [row.id for row in query.with_entities(Submission.id)
+           .order_by(Submission.question_id, Submission.student_id, Submission.timestamp, Submission.seq)]
+
+    summary = {"packed": 0, "missing": 0, "file_bytes": 0, "blob_bytes": 0}
+    stored_before = db.session.query(db.func.coalesce(db.func.sum(db.func.length(Blob.data)), 0)).scalar()
+    previous = {}
+    files = []
+    for start in range(0, len(ids), batch_size):
+        for submission in Submission.query.filter(Submission.id.in_(ids[start:start + batch_size])) \
+                .order_by(Submission.question_id, Submission.student_id, Submission.timestamp, Submission.seq):
+            path = os.path.join(submissions_dir, submission.path)
+            try:
+                with open(path, 'rb') as f:
+                    raw = f.read()
+                data = json.loads(raw)
+            except (OSError, ValueError) as e:
+                print(f"Skipping unreadable submission {path}: {e}")
+                summary["missing"] += 1
+                continue
+            key = (submission.question_id, submission.student_id)
+            store_payload(submission, data, previous.get(key))
+            previous[key] = submission
+            if delete_files:
+                submission.path = None
+                files.append(path)
+            summary["packed"] += 1
+            summary["file_bytes"] += len(raw)
+        db.session.commit()
+        # Only deleted once the blobs are committed
+        for path in files:
+            os.remove(path)
+        files = []
+
+    summary["blob_bytes"] = db.session.query(
+        db.func.coalesce(db.func.sum(db.func.length(Blob.data)), 0)).scalar() - stored_before
+    return summary
@@ -0,0 +1,147 @@
+import csv
+import io
+import json
+import time
+from itertools import groupby
+
+from flask import Response, jsonify, request, stream_with_context
+from sqlalchemy import select
+
+from models import db, Grade, Submission
+
+# Gradebook export for the LMS.
+#
+#   GET /api/export/grades?question=Fish+Store&format=csv
+#
+# streams one row per student and question (their latest or best submission) or,
+# with per=submission, one row per submission, with the section scores of its
+# current grade. Rows are read with yield_per and written out as they arrive, so
+# a course-wide export starts downloading at once and is never held in memory.
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+# per=student picks one submission of each student: the newest, or the highest scoring
+EXPORT_SCORES = ('latest', 'best')
+EXPORT_BATCH_SIZE = 500
+
+COLUMNS = ('questionId', 'studentId', 'submissionId', 'timestamp', 'score', 'entityScore',
+           'relationshipScore', 'methodScore', 'referenceVersion', 'gradedAt', 'attempts')
+
+def _export_rows(question_ids=None, student_id=None):
+    # Every submission with its latest grade, in the order of the (student, question, timestamp) index
+    latest_grade = (select(Grade.id).where(Grade.submission_id == Submission.id)
+                    .order_by(Grade.graded_at.desc(), Grade.id.desc()).limit(1)
+                    .correlate(Submission).scalar_subquery())
+    query = (select(Submission.id, Submission.question_id, Submission.student_id, Submission.timestamp,
+                    Submission.score, Grade.entity_score, Grade.relationship_score, Grade.method_score,
+                    Grade.reference_version, Grade.graded_at)
+             .outerjoin(Grade, Grade.id == latest_grade)
+             .order_by(Submission.student_id, Submission.question_id, Submission.timestamp, Submission.seq))
+    if question_ids:
+        query = query.where(Submission.question_id.in_(question_ids))
+    if student_id is not None:
+        query = query.where(Submission.student_id == student_id)
+    return db.session.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+
+def _points(value):
+    # Section scores are sums of fractional marks
+    return round(value, 2) if value is not None else None
+
+def _record(row, attempts=None):
+    return {
+        "questionId": row.question_id,
+        "studentId": row.student_id,
+        "submissionId": row.id,
+        "timestamp": row.timestamp,
+        "score": row.score,
+        "entityScore": _points(row.entity_score),
+        "relationshipScore": _points(row.relationship_score),
+        "methodScore": _points(row.method_score),
+        "referenceVersion": row.reference_version,
+        "gradedAt": row.graded_at,
+        "attempts": attempts
+    }
+
+def export_records(question_ids=None, per='student', score='latest', student_id=None):
+    """
+    Generate the gradebook rows.
+
+    Args:
+        question_ids (list): Only these questions (all if empty)
+        per (str): 'student' for one row per student and question (anonymous
+            submissions are left out), 'submission' for one row per submission
+        score (str): With per='student', which submission counts: 'latest' or 'best'
+        student_id (str): Only this student
+    Yields:
+        dict: One row (see COLUMNS)
+    """
+    rows = _export_rows(question_ids, student_id)
+    if per == 'submission':
+        for row in rows:
+            yield _record(row)
+        return
+
+    # Rows arrive grouped by student and question, so one group is held at a time
+    for (student, _), group in groupby(rows, key=lambda row: (row.student_id, row.question_id)):
+        if student is None:
+            continue
+        chosen = None
+        attempts = 0
+        for row in group:
+            attempts += 1
+            if score == 'latest':
+                chosen = row
+            elif row.score is not None and (chosen is None or row.score >= chosen.score):
+                # Ties go to the later submission
+                chosen = row
+        if chosen is not None:
+            yield _record(chosen, attempts)
+
+def csv_lines(records):
+    """Render records as CSV (header first), one line at a time."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Only the header if there were no records
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+def jsonl_lines(records):
+    """Render records as JSON Lines."""
+    for record in records:
+        yield json.dumps(record) + '\n'
+
+def setup_grade_export_routes(app):
+    """
+    Register the gradebook export route.
+
+    Args:
+        app: The Flask application
+    """
+    @app.route('/api/export/grades', methods=['GET'])
+    def export_grades():
+        question_ids = request.args.getlist('question')
+        export_format = request.args.get('format', 'csv')
+        per = request.args.get('per', 'student')
+        score = request.args.get('score', 'latest')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+        if per not in ('student', 'submission'):
+            return jsonify({"error": "per must be student or submission"}), 400
+        if score not in EXPORT_SCORES:
+            return jsonify({"error": f"score must be one of {', '.join(EXPORT_SCORES)}"}), 400
+
+        records = export_records(question_ids, per, score, request.args.get('studentId'))
+        if export_format == 'csv':
+            body, mimetype, extension = csv_lines(records), 'text/csv', 'csv'
+        else:
+            body, mimetype, extension = jsonl_lines(records), 'application/x-ndjson', 'jsonl'
+        return Response(stream_with_context(body), mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename="grades-{int(time.time())}.{extension}"',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no'
+        })
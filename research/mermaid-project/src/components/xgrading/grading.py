@@ -0,0 +1,740 @@
+import os
+import re
+import hashlib
+import threading
+import time
+from collections import Counter
+from bs4 import BeautifulSoup
+
+from mermaid_parser import parse_mermaid_schema
+from metrics import stage_timer
+
+
+QUESTIONS_DIR = os.path.join(os.path.dirname(__file__), 'Questions')
+
+# ===== NEW GRADING SYSTEM =====
+def extract_reference_data(question_html):
+    """
+    Extract reference schema and marking criteria from question HTML.
+    """
+    print("Extracting reference data from HTML...")
+    
+    # First try to find the UML design elements using BeautifulSoup
+    soup = BeautifulSoup(question_html, 'html.parser')
+    design_elements = soup.find('uml-design-elements')
+    
+    if design_elements:
+        reference_schema = design_elements.text.strip()
+        print(f"Found design elements via BeautifulSoup: {reference_schema[:100]}...")
+    else:
+        # Fallback: use regex to find the design elements
+        import re
+        match = re.search(r'<uml-design-elements>(.*?)</uml-design-elements>', question_html, re.DOTALL)
+        if match:
+            reference_schema = match.group(1).strip()
+            print(f"Found design elements via regex: {reference_schema[:100]}...")
+        else:
+            print("Failed to extract design elements!")
+            reference_schema = None
+    
+    # Extract marking criteria
+    marking_element = soup.find('uml-marking')
+    marking_criteria = {}
+    
+    if marking_element:
+        for attr, value in marking_element.attrs.items():
+            try:
+                marking_criteria[attr] = float(value)
+            except ValueError:
+                marking_criteria[attr] = value
+        print(f"Found marking criteria: {marking_criteria}")
+    else:
+        # Fallback: use default marking criteria
+        print("No marking criteria found, using defaults")
+        marking_criteria = {
+            'entity-name': 0.2,
+            'entity-attributes': 0.1,
+            'relationship': 0.5,
+            'cardinality': 0.25,
+            'extra-entity-penalty': 0.25,
+            'extra-relationship-penalty': 0.25
+        }
+    
+    return reference_schema, marking_criteria
+
+# ===== DIAGRAM INDEX =====
+
+def relationship_key(rel_type, source, target):
+    """
+    Key a (lowercased) relationship for matching; A-B matches B-A.
+    """
+    return (rel_type, frozenset((source, target)))
+
+class DiagramIndex:
+    """
+    Lookups over one diagram (reference or submitted), built once per grade so the
+    grading functions match elements with set/dict lookups instead of nested scans.
+    """
+    def __init__(self, entities, relationships=()):
+        self.entities = entities
+
+        # Lowercased name -> the first entity name spelled that way
+        self.names = {}
+        for name in entities:
+            self.names.setdefault(name.lower(), name)
+
+        # Entity name -> the names of its methods
+        self.method_names = {
+            name: {m.get('name') for m in data.get('methods', [])}
+            for name, data in entities.items()
+        }
+
+        # Interfaces are the sources of implementation relationships
+        self.interfaces = {
+            rel.get('source', '').lower()
+            for rel in relationships if rel.get('type') == 'implementation'
+        }
+        self.relationship_keys = {
+            relationship_key(rel.get('type', '').lower(), rel.get('source', '').lower(), rel.get('target', '').lower())
+            for rel in relationships
+        }
+
+    def find(self, name):
+        """Return the entity name matching name case-insensitively, or None."""
+        return self.names.get(name.lower())
+
+# ===== REFERENCE SOLUTION CACHE =====
+
+# How long (seconds) a cached reference is trusted before question.html is stat'ed again
+REFERENCE_RECHECK_INTERVAL = 2.0
+
+class ReferenceSolution:
+    """
+    The parsed reference solution of a question, shared by every submission.
+
+    Besides the parsed entities/relationships/marking criteria it keeps the
+    DiagramIndex the grading functions would otherwise rebuild per submission.
+    """
+    def __init__(self, question_id, question_file, mtime_ns, size, content_hash,
+                 reference_schema, marking_criteria, ref_entities, ref_relationships, version=None):
+        self.question_id = question_id
+        self.question_file = question_file
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.content_hash = content_hash
+        self.reference_schema = reference_schema
+        self.marking_criteria = marking_criteria
+        self.ref_entities = ref_entities
+        self.ref_relationships = ref_relationships
+        # Version number in the reference store (None when the cache has no store)
+        self.version = version
+        self.checked_at = time.monotonic()
+
+        self.index = DiagramIndex(ref_entities, ref_relationships)
+
+    @property
+    def has_schema(self):
+        return bool(self.reference_schema)
+
+def _question_file(question_id):
+    return os.path.join(QUESTIONS_DIR, question_id, 'question.html')
+
+def load_reference_solution(question_id, question_html, question_file=None, mtime_ns=0, size=0):
+    """
+    Parse a question's HTML into a ReferenceSolution.
+
+    Args:
+        question_id (str): The ID of the question
+        question_html (str): The contents of question.html
+    Returns:
+        ReferenceSolution: The parsed reference solution
+    """
+    content_hash = hashlib.sha256(question_html.encode('utf-8')).hexdigest()
+    with stage_timer('reference_cache', 'extract_reference_data', question=question_id):
+        reference_schema, marking_criteria = extract_reference_data(question_html)
+    ref_entities, ref_relationships = {}, []
+    if reference_schema:
+        with stage_timer('reference_cache', 'parse_mermaid_schema', question=question_id):
+            ref_entities, ref_relationships = parse_mermaid_schema(reference_schema)
+    return ReferenceSolution(question_id, question_file, mtime_ns, size, content_hash,
+                             reference_schema, marking_criteria, ref_entities, ref_relationships)
+
+class ReferenceCache:
+    """
+    Reference solutions keyed by question id.
+
+    An entry is reused while question.html keeps the same mtime/size; when those
+    change the file is re-hashed and only re-parsed if its content really changed.
+
+    With a store (see reference_store.py), new content is first looked up there
+    by its hash, and solutions that had to be parsed are saved to it.
+    """
+    def __init__(self, recheck_interval=REFERENCE_RECHECK_INTERVAL, store=None):
+        self.recheck_interval = recheck_interval
+        self.store = store
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, question_id):
+        entry = self._entries.get(question_id)
+        if entry is not None and time.monotonic() - entry.checked_at < self.recheck_interval:
+            return entry
+        return self._refresh(question_id, entry)
+
+    def _refresh(self, question_id, entry):
+        question_file = _question_file(question_id)
+        try:
+            stat = os.stat(question_file)
+        except OSError:
+            self.invalidate(question_id)
+            return None
+
+        if entry is not None and (entry.mtime_ns, entry.size) == (stat.st_mtime_ns, stat.st_size):
+            entry.checked_at = time.monotonic()
+            return entry
+
+        with stage_timer('reference_cache', 'html_read', question=question_id):
+            with open(question_file, 'r') as f:
+                question_html = f.read()
+        return self.put(question_id, question_html, question_file, stat.st_mtime_ns, stat.st_size)
+
+    def put(self, question_id, question_html, question_file, mtime_ns, size):
+        """
+        Cache the reference solution in question_html, which was read from question_file.
+
+        The cached entry is kept if the content did not change.
+
+        Returns:
+            ReferenceSolution: The cached reference solution
+        """
+        entry = self._entries.get(question_id)
+        content_hash = hashlib.sha256(question_html.encode('utf-8')).hexdigest()
+        if entry is not None and content_hash == entry.content_hash:
+            # Touched but unchanged, keep the parsed entry
+            entry.mtime_ns, entry.size = mtime_ns, size
+            entry.checked_at = time.monotonic()
+            return entry
+
+        store = self.store
+        entry = None
+        if store is not None:
+            with stage_timer('reference_cache', 'store_load', question=question_id):
+                entry = store.load(question_id, content_hash, question_file, mtime_ns, size)
+        if entry is None:
+            print(f"Parsing reference solution for question {question_id}")
+            entry = load_reference_solution(question_id, question_html, question_file, mtime_ns, size)
+            if store is not None:
+                with stage_timer('reference_cache', 'store_save', question=question_id):
+                    entry.version = store.save(entry)
+        with self._lock:
+            self._entries[question_id] = entry
+        return entry
+
+    def invalidate(self, question_id=None):
+        with self._lock:
+            if question_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(question_id, None)
+
+    def preload(self, questions_dir=QUESTIONS_DIR):
+        """
+        Parse every question under questions_dir.
+
+        Returns:
+            list: The question ids that have a reference solution
+        """
+        loaded = []
+        if not os.path.isdir(questions_dir):
+            return loaded
+        for question_id in sorted(os.listdir(questions_dir)):
+            if self.get(question_id) is not None:
+                loaded.append(question_id)
+        return loaded
+
+reference_cache = ReferenceCache()
+
+def get_reference_solution(question_id):
+    """Return the cached ReferenceSolution for a question, or None if it has no question.html."""
+    return reference_cache.get(question_id)
+
+def preload_reference_solutions():
+    loaded = reference_cache.preload()
+    print(f"Preloaded reference solutions: {loaded}")
+    return loaded
+
+def grade_entities(submitted_entities, ref_entities, marking_criteria, ref_relationships,
+                   submitted_index=None, ref_index=None):
+    """
+    Grade the entities in the submission.
+    Args:
+        submitted_entities (dict): The submitted entities
+        ref_entities (dict): The reference entities
+        marking_criteria (dict): The marking criteria
+        ref_relationships (list): The reference relationships to check for interfaces
+        submitted_index (DiagramIndex): Index of submitted_entities (built if not given)
+        ref_index (DiagramIndex): Index of the reference (built if not given)
+    Returns:
+        dict: Grading results for entities
+    """
+    submitted_index = submitted_index or DiagramIndex(submitted_entities)
+    ref_index = ref_index or DiagramIndex(ref_entities, ref_relationships)
+
+    entity_score = 0
+    max_entity_score = 0
+    feedback = []
+    
+    # Points for entity names
+    entity_name_points = marking_criteria.get('entity-name', 0.2)
+    max_entity_score += len(ref_entities) * entity_name_points
+
+    # Check for required entities
+    for entity_name, entity_data in ref_entities.items():
+        if entity_name.lower() in submitted_index.names:
+            entity_score += entity_name_points
+            feedback.append(f"✓ Found required entity: {entity_name}")
+        else:
+            feedback.append(f"✗ Missing required entity: {entity_name}")
+
+    # Points for entity attributes
+    attribute_points = marking_criteria.get('entity-attributes', 0.1)
+    for entity_name, entity_data in ref_entities.items():
+        if entity_name in submitted_entities:
+            ref_attrs = entity_data.get('attribute', {})
+            submitted_attrs = submitted_entities[entity_name].get('attribute', {})
+            max_entity_score += len(ref_attrs) * attribute_points
+            for attr_name in ref_attrs:
+                if attr_name in submitted_attrs:
+                    entity_score += attribute_points
+                    feedback.append(f"✓ Entity {entity_name} has required attribute: {attr_name}")
+                else:
+                    feedback.append(f"✗ Entity {entity_name} is missing attribute: {attr_name}")
+    
+    # NEW CODE: Check for extra attributes
+    extra_attribute_penalty = marking_criteria.get('extra-attribute-penalty', 0.1)
+    extra_attributes = []
+    
+    for entity_name, entity_data in submitted_entities.items():
+        # Find matching reference entity (case-insensitive)
+        matching_ref_entity = ref_index.find(entity_name)
+        
+        if matching_ref_entity:
+            submitted_attrs = entity_data.get('attribute', {})
+            ref_attrs = ref_entities[matching_ref_entity].get('attribute', {})
+            
+            # Check for attributes in submission that aren't in reference
+            for attr_name in submitted_attrs:
+                if attr_name not in ref_attrs:
+                    extra_attributes.append(f"{attr_name} in entity {entity_name}")
+    
+    # Apply penalty for extra attributes
+    if extra_attributes:
+        extra_attr_penalty = min(len(extra_attributes) * extra_attribute_penalty, max_entity_score * 0.3)
+        entity_score = max(0, entity_score - extra_attr_penalty)
+        feedback.append(f"! Found {len(extra_attributes)} extra attributes: {', '.join(extra_attributes)}")
+
+    # Interface names from the reference relationships (e.g., cleanable)
+    interface_entities = ref_index.interfaces
+    print("DEBUG: Interface entities detected:", sorted(interface_entities))
+
+    # Only count as extra if not an interface and not in reference
+    extra_entities = []
+    for entity_name in submitted_entities:
+        entity_name_lower = entity_name.lower()
+        if (entity_name_lower not in ref_index.names and 
+            entity_name_lower not in interface_entities):
+            extra_entities.append(entity_name)
+            print(f"DEBUG: Identified as extra entity: {entity_name}")
+        elif entity_name_lower in interface_entities:
+            print(f"DEBUG: Recognized as interface entity: {entity_name}")
+        else:
+            print(f"DEBUG: Found as regular entity: {entity_name}")
+
+    # Apply penalty for extra entities
+    if extra_entities:
+        extra_entity_penalty = marking_criteria.get('extra-entity-penalty', 0.25)
+        penalty = min(len(extra_entities) * extra_entity_penalty, max_entity_score * 0.5)  # Cap penalty at 50% of max score
+        entity_score = max(0, entity_score - penalty)
+        feedback.append(f"! Found {len(extra_entities)} extra entities: {', '.join(extra_entities)}")
+
+    return {
+        "score": entity_score,
+        "max_score": max_entity_score,
+        "feedback": feedback
+    }
+
+def grade_relationships(submitted_relationships, ref_relationships, marking_criteria, ref_index=None):
+    """
+    Grade the relationships in the submission.
+    
+    Args:
+        submitted_relationships (list): The submitted relationships
+        ref_relationships (list): The reference relationships
+        marking_criteria (dict): The marking criteria
+        ref_index (DiagramIndex): Index of the reference (built if not given)
+    
+    Returns:
+        dict: Grading results for relationships
+    """
+    relationship_score = 0
+    max_relationship_score = 0
+    feedback = []
+    
+    # Points for relationships
+    relationship_points = marking_criteria.get('relationship', 0.5)
+    cardinality_points = marking_criteria.get('cardinality', 0.25)
+    
+    # Convert submitted relationships to a more comparable format with case-insensitive types
+    formatted_submitted_rels = []
+    for rel_key, rel_data in submitted_relationships:
+        # Handle different possible formats from frontend
+        rel_type = rel_data.get('type', '').lower()  # Convert to lowercase
+        source = rel_data.get('relationA', rel_data.get('source', '')).lower()  # Convert to lowercase
+        target = rel_data.get('relationB', rel_data.get('target', '')).lower()  # Convert to lowercase
+        cardinality = rel_data.get('cardinalityA', rel_data.get('cardinality', ''))
+        label = rel_data.get('label', '')
+        
+        formatted_submitted_rels.append({
+            "type": rel_type,
+            "source": source,
+            "target": target,
+            "cardinality": cardinality,
+            "label": label
+        })
+    
+    # How many submitted relationships share each (undirected) key
+    submitted_keys = Counter(
+        relationship_key(sub_rel["type"], sub_rel["source"], sub_rel["target"])
+        for sub_rel in formatted_submitted_rels
+    )
+    ref_index = ref_index or DiagramIndex({}, ref_relationships)
+    
+    # Check for required relationships
+    for ref_rel in ref_relationships:
+        max_relationship_score += relationship_points
+        rel_type = ref_rel.get('type', '').lower()
+        source = ref_rel.get('source', '').lower()
+        target = ref_rel.get('target', '').lower()
+        
+        # Every matching submitted relationship earns the points (duplicates included)
+        matches = submitted_keys.get(relationship_key(rel_type, source, target), 0)
+        for _ in range(matches):
+            relationship_score += relationship_points
+            feedback.append(f"✓ Found relationship: {rel_type} between {source} and {target}")
+        
+        if not matches:
+            feedback.append(f"✗ Missing relationship: {rel_type} between {source} and {target}")
+    
+    # Check for extra relationships (penalty)
+    extra_relationship_penalty = marking_criteria.get('extra-relationship-penalty', 0.25)
+    extra_rels = []
+    
+    for sub_rel in formatted_submitted_rels:
+        # Check if this relationship exists in the reference
+        if relationship_key(sub_rel["type"], sub_rel["source"], sub_rel["target"]) not in ref_index.relationship_keys:
+            print(f"DEBUG: No match found for: {sub_rel.get('type')} between {sub_rel.get('source')} and {sub_rel.get('target')}")
+            extra_rels.append(f"{sub_rel.get('type')} between {sub_rel.get('source')} and {sub_rel.get('target')}")
+    
+    if extra_rels:
+        penalty = min(len(extra_rels) * extra_relationship_penalty, max_relationship_score * 0.5)  # Cap penalty at 50% of max score
+        relationship_score = max(0, relationship_score - penalty)
+        feedback.append(f"! Found {len(extra_rels)} extra relationships: {', '.join(extra_rels)}")
+    
+    return {
+        "score": relationship_score,
+        "max_score": max_relationship_score,
+        "feedback": feedback
+    }
+    
+def grade_methods(submitted_entities, ref_entities, marking_criteria, submitted_index=None, ref_index=None):
+    """
+    Grade the methods in the submission.
+    """
+    submitted_index = submitted_index or DiagramIndex(submitted_entities)
+    ref_index = ref_index or DiagramIndex(ref_entities)
+
+    method_score = 0
+    max_method_score = 0
+    feedback = []
+    
+    # We'll allocate points based on finding required methods in the right classes
+    method_points = 1.0
+    
+    # Check for required methods in each entity
+    for entity_name, entity_data in ref_entities.items():
+        ref_methods = entity_data.get('methods', [])
+        
+        if not ref_methods:
+            continue
+        
+        # Modified: Use case-insensitive lookup for entity names
+        matching_entity = submitted_index.find(entity_name)
+            
+        if matching_entity:
+            submitted_method_names = submitted_index.method_names[matching_entity]
+            
+            # Check each required method
+            for ref_method in ref_methods:
+                max_method_score += method_points
+                
+                # Get method name
+                ref_method_name = ref_method.get('name')
+                
+                # Look for this method in the submitted entity
+                if ref_method_name in submitted_method_names:
+                    method_score += method_points
+                    feedback.append(f"✓ Class {entity_name} has required method: {ref_method_name}")
+                else:
+                    feedback.append(f"✗ Class {entity_name} is missing required method: {ref_method_name}")
+        else:
+            # If the entity is missing, all its methods are missing
+            max_method_score += len(ref_methods) * method_points
+            for ref_method in ref_methods:
+                feedback.append(f"✗ Missing method: {ref_method.get('name')} (class {entity_name} not found)")
+    
+    # NEW CODE: Check for extra methods in each submitted entity
+    extra_method_penalty = marking_criteria.get('extra-method-penalty', 0.25)  # You can add this to marking criteria
+    extra_methods = []
+    
+    for submitted_name, submitted_data in submitted_entities.items():
+        submitted_methods = submitted_data.get('methods', [])
+        
+        # Find the matching reference entity
+        matching_ref_entity = ref_index.find(submitted_name)
+        
+        if matching_ref_entity:
+            ref_method_names = ref_index.method_names[matching_ref_entity]
+            
+            # Check each submitted method to see if it's extra
+            for sub_method in submitted_methods:
+                sub_method_name = sub_method.get('name')
+                if sub_method_name not in ref_method_names:
+                    extra_methods.append(f"{sub_method_name} in class {submitted_name}")
+    
+    # Apply penalty for extra methods
+    if extra_methods:
+        penalty = min(len(extra_methods) * extra_method_penalty, max_method_score * 0.5)  # Cap penalty at 50% of max
+        method_score = max(0, method_score - penalty)
+        feedback.append(f"! Found {len(extra_methods)} extra methods: {', '.join(extra_methods)}")
+    
+    return {
+        "score": method_score,
+        "max_score": max_method_score,
+        "feedback": feedback
+    }
+ 
+def generate_feedback(grading_result):
+    """
+    Generate detailed feedback based on grading results.
+    
+    Args:
+        grading_result (dict): The grading results
+    
+    Returns:
+        str: Detailed feedback
+    """
+    entity_score = grading_result["entity_score"]["score"]
+    entity_max = grading_result["entity_score"]["max_score"]
+    entity_percent = (entity_score / entity_max * 100) if entity_max > 0 else 0
+    
+    relationship_score = grading_result["relationship_score"]["score"]
+    relationship_max = grading_result["relationship_score"]["max_score"]
+    relationship_percent = (relationship_score / relationship_max * 100) if relationship_max > 0 else 0
+    
+    method_score = grading_result["method_score"]["score"]
+    method_max = grading_result["method_score"]["max_score"]
+    method_percent = (method_score / method_max * 100) if method_max > 0 else 0
+    
+    total_score = entity_score + relationship_score + method_score
+    total_max = entity_max + relationship_max + method_max
+    total_percent = (total_score / total_max * 100) if total_max > 0 else 0
+    
+    # Format detailed feedback with consistent formatting
+    feedback = [
+        f"### UML Diagram Grading Results",
+        f"",
+        f"**Overall Score**: {total_score:.1f}/{total_max:.1f} ({total_percent:.1f}%)",
+        f"",
+        f"#### Class Assessment: {entity_score:.1f}/{entity_max:.1f} ({entity_percent:.1f}%)",  # Changed from Entity to Class
+    ]
+    
+    # Add entity feedback items with consistent icons
+    entity_feedback = grading_result["entity_score"]["feedback"]
+    for item in entity_feedback:
+        # Replace Entity with Class in the feedback items
+        modified_item = item.replace("Entity", "Class").replace("entity", "class")
+        if modified_item.startswith("✓"):
+            feedback.append(f"- {modified_item}")
+        elif modified_item.startswith("✗"):
+            feedback.append(f"- {modified_item}")
+        elif modified_item.startswith("!"):
+            feedback.append(f"- {modified_item}")
+        else:
+            feedback.append(f"- {modified_item}")
+    
+    feedback.extend([
+        f"",
+        f"#### Relationship Assessment: {relationship_score:.1f}/{relationship_max:.1f} ({relationship_percent:.1f}%)",
+    ])
+    
+    # Add relationship feedback items with consistent icons
+    relationship_feedback = grading_result["relationship_score"]["feedback"]
+    for item in relationship_feedback:
+        if item.startswith("✓"):
+            feedback.append(f"- {item}")
+        elif item.startswith("✗"):
+            feedback.append(f"- {item}")
+        elif item.startswith("!"):
+            feedback.append(f"- {item}")
+        else:
+            feedback.append(f"- {item}")
+    
+    feedback.extend([
+        f"",
+        f"#### Method Assessment: {method_score:.1f}/{method_max:.1f} ({method_percent:.1f}%)",
+    ])
+    
+    # Add method feedback items with consistent icons
+    method_feedback = grading_result["method_score"]["feedback"]
+    for item in method_feedback:
+        # Replace entity with class in method feedback where relevant
+        modified_item = item.replace("entity", "class")
+        if modified_item.startswith("✓"):
+            feedback.append(f"- {modified_item}")
+        elif modified_item.startswith("✗"):
+            feedback.append(f"- {modified_item}")
+        elif modified_item.startswith("!"):
+            feedback.append(f"- {modified_item}")
+        else:
+            feedback.append(f"- {modified_item}")
+    
+    # Add summary feedback based on score
+    feedback.extend([
+        f"",
+        f"### Summary Feedback",
+    ])
+    
+    if total_percent >= 90:
+        feedback.append("Excellent work! Your UML diagram accurately represents the required system. The classes, relationships, and methods are well-defined and properly structured.")
+    elif total_percent >= 80:
+        feedback.append("Good job! Your UML diagram covers most of the required elements. Review the feedback above to make minor improvements to your design.")
+    elif total_percent >= 70:
+        feedback.append("Your UML diagram is on the right track but needs improvements. Pay attention to the relationship types and make sure all required methods are placed in the correct classes.")
+    elif total_percent >= 60:
+        feedback.append("Your diagram needs substantial improvement. Focus on correctly implementing all the required classes and their relationships. Make sure you've included all required methods.")
+    else:
+        feedback.append("Your diagram requires significant revision. Review the UML notation and make sure you understand the requirements. Start by ensuring you have all the required classes and then focus on their relationships and methods.")
+    
+    return "\n".join(feedback)
+ 
+def grade_submission(question_id, code, schema, relationships, endpoint='grade_submission'):
+    """
+    Grade a UML diagram submission by comparing it to the reference solution.
+    
+    Args:
+        question_id (str): The ID of the question
+        code (str): The submitted code
+        schema (list): The schema as a list of [entity_name, entity_data] pairs
+        relationships (list): The relationships as a list
+        endpoint (str): Endpoint label for the stage timings (see metrics.py)
+    
+    Returns:
+        dict: Grading results with score and feedback
+    """
+    # Get the parsed reference solution (cached per question, see ReferenceCache)
+    with stage_timer(endpoint, 'reference_lookup', question=question_id):
+        reference = get_reference_solution(question_id)
+
+    if reference is None:
+        return {
+            "score": 50,
+            "feedback": "Unable to find reference solution for grading."
+        }
+
+    if not reference.has_schema:
+        return {
+            "score": 50,
+            "feedback": "Reference schema not found in question."
+        }
+
+    ref_entities = reference.ref_entities
+    ref_relationships = reference.ref_relationships
+    marking_criteria = reference.marking_criteria
+
+    # Convert our submitted schema list to a dict for easier access
+    submitted_entities = {name: data for name, data in schema}
+    submitted_index = DiagramIndex(submitted_entities)
+    
+   # Grade entities and methods
+    with stage_timer(endpoint, 'grade_entities', question=question_id):
+        entity_score_result = grade_entities(submitted_entities, ref_entities, marking_criteria, ref_relationships,
+                                             submitted_index, reference.index)
+    with stage_timer(endpoint, 'grade_methods', question=question_id):
+        method_score_result = grade_methods(submitted_entities, ref_entities, marking_criteria,
+                                            submitted_index, reference.index)
+        
+    # Only grade relationships if they were submitted
+    relationship_score_result = {"score": 0, "max_score": 0, "feedback": []}
+    if relationships and len(relationships) > 0:
+        with stage_timer(endpoint, 'grade_relationships', question=question_id):
+            relationship_score_result = grade_relationships(relationships, ref_relationships, marking_criteria,
+                                                            reference.index)
+    else:
+        # Add feedback about missing relationships but don't penalize the entire submission
+        relationship_feedback = ["✗ No relationships defined in the diagram."]
+        for rel in ref_relationships:
+            rel_type = rel.get('type', 'unknown')
+            source = rel.get('source', 'unknown')
+            target = rel.get('target', 'unknown')
+            relationship_feedback.append(f"✗ Missing relationship: {rel_type} between {source} and {target}")
+        
+        relationship_score_result = {
+            "score": 0,
+            "max_score": len(ref_relationships) * marking_criteria.get('relationship', 0.5),
+            "feedback": relationship_feedback
+        }
+    
+    # Ensure entity and method scores aren't zero if entities exist
+    if submitted_entities and entity_score_result["score"] == 0:
+        entity_score_result["score"] = 0.1 * entity_score_result["max_score"]
+    
+    if submitted_entities and method_score_result["score"] == 0:
+        method_score_result["score"] = 0.1 * method_score_result["max_score"]
+    
+    # Update the grading result
+    grading_result = {
+        "entity_score": entity_score_result,
+        "relationship_score": relationship_score_result,
+        "method_score": method_score_result
+    }
+    
+    # Calculate overall score
+    total_score = (
+        grading_result["entity_score"]["score"] +
+        grading_result["relationship_score"]["score"] +
+        grading_result["method_score"]["score"]
+    )
+    
+    # Scale to a 100-point scale
+    total_max = (
+        grading_result["entity_score"]["max_score"] +
+        grading_result["relationship_score"]["max_score"] +
+        grading_result["method_score"]["max_score"]
+    )
+    
+    # Ensure we get at least some credit for having entities
+    if submitted_entities and total_score == 0:
+        total_score = 0.3 * grading_result["entity_score"]["max_score"]
+    
+    normalized_score = 100 * (total_score / total_max) if total_max > 0 else 50
+    
+    # Generate detailed feedback
+    with stage_timer(endpoint, 'generate_feedback', question=question_id):
+        feedback = generate_feedback(grading_result)
+    
+    return {
+        "score": round(normalized_score),
+        "feedback": feedback,
+        "details": grading_result,
+        "referenceVersion": reference.version
+    }
@@ -0,0 +1,508 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import jsonify, request
+
+from http_cache import grade_for_response
+from metrics import question_label, stage_duration, stage_timer
+from pylint_pool import WORKER_START_METHOD
+from submission_store import SUBMISSIONS_DIR, get_submission, load_submission_payload, record_grade
+
+# Background grading for asynchronous submissions.
+#
+# With async submit, /api/submit stores and indexes the payload, puts a grading
+# job on a bounded queue and answers straight away. A few worker threads grade
+# the jobs, either in-process or, with XGRADING_GRADE_PROCESSES, on a process
+# pool, and write the score back to the submission index. Clients fetch the
+# result from /api/submission/<id>/grade, optionally long-polling with ?wait=.
+# When the queue is full, submit answers 503 with a Retry-After header.
+#
+# The queue lives in memory by default. Set XGRADING_GRADE_QUEUE_DB to keep it
+# in SQLite instead: queued jobs then survive a restart and every server process
+# can share one queue. `flask serve` with more than one worker uses
+# instance/grade_queue.db when it is not set, since a result poll can land on
+# any worker.
+
+GRADE_QUEUE_DEPTH = int(os.environ.get('XGRADING_GRADE_QUEUE_DEPTH', '256'))
+GRADE_WORKERS = int(os.environ.get('XGRADING_GRADE_WORKERS', '2'))
+# Grade in this many worker processes instead of the worker threads (0 = in-process)
+GRADE_PROCESSES = int(os.environ.get('XGRADING_GRADE_PROCESSES', '0'))
+# Path of the durable SQLite queue; unset keeps the queue in memory
+GRADE_QUEUE_DB = os.environ.get('XGRADING_GRADE_QUEUE_DB')
+GRADE_QUEUE_DB_MAX = int(os.environ.get('XGRADING_GRADE_QUEUE_DB_MAX', '100000'))
+# Whether /api/submit grades asynchronously when the request doesn't say
+ASYNC_SUBMIT = os.environ.get('XGRADING_ASYNC_SUBMIT', '0') == '1'
+RETRY_AFTER = int(os.environ.get('XGRADING_GRADE_QUEUE_RETRY_AFTER', '5'))
+
+# Finished results the in-memory queue keeps for polling
+RESULTS_KEPT = 4096
+# Longest long-poll (seconds) a client can ask for
+MAX_WAIT = 30
+POLL_INTERVAL = 0.2
+# A job still marked 'grading' after this long belonged to a worker that died
+STALE_JOB_SECONDS = 300
+
+QUEUED, GRADING, DONE, FAILED = 'queued', 'grading', 'done', 'failed'
+
+class QueueFull(Exception):
+    """The grading queue is at its maximum depth."""
+
+def grade_job(question_id, data):
+    """
+    Grade a submission payload (runs in a worker thread or process).
+    """
+    from grading import grade_submission
+    return grade_submission(question_id, data.get('code'), data.get('schema') or [],
+                            data.get('relationships'), endpoint='grading_queue')
+
+def _init_process():
+    from grading import preload_reference_solutions
+    preload_reference_solutions()
+
+class MemoryJobStore:
+    """
+    Jobs and recent results in process memory.
+    """
+    def __init__(self, max_depth=GRADE_QUEUE_DEPTH, results_kept=RESULTS_KEPT):
+        self.max_depth = max_depth
+        self.results_kept = results_kept
+        self._jobs = OrderedDict()
+        self._pending = deque()
+        self._finished = deque()
+        self._condition = threading.Condition()
+
+    def depth(self):
+        return len(self._pending)
+
+    def put(self, job):
+        with self._condition:
+            if len(self._pending) >= self.max_depth:
+                raise QueueFull(f"{len(self._pending)} jobs queued")
+            if self._jobs.get(job["submission_id"], {}).get("state") != QUEUED:
+                self._pending.append(job["submission_id"])
+            self._jobs[job["submission_id"]] = job
+            self._condition.notify_all()
+
+    def claim(self, timeout):
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._pending, timeout):
+                return None
+            job = self._jobs[self._pending.popleft()]
+            job.update(state=GRADING, started_at=time.time())
+            return dict(job)
+
+    def finish(self, submission_id, result=None, error=None):
+        with self._condition:
+            job = self._jobs.get(submission_id)
+            if job is None:
+                return
+            job.update(state=FAILED if error else DONE, result=result, error=error, finished_at=time.time())
+            self._finished.append(submission_id)
+            while len(self._finished) > self.results_kept:
+                old_id = self._finished.popleft()
+                if self._jobs.get(old_id, {}).get("state") in (DONE, FAILED):
+                    del self._jobs[old_id]
+            self._condition.notify_all()
+
+    def get(self, submission_id):
+        with self._condition:
+            job = self._jobs.get(submission_id)
+            return dict(job) if job else None
+
+    def wait(self, submission_id, timeout):
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._jobs.get(submission_id, {}).get("state") not in (QUEUED, GRADING),
+                timeout
+            )
+        return self.get(submission_id)
+
+    def recover(self):
+        return 0
+
+class SQLiteJobStore:
+    """
+    Jobs and results in a SQLite file, shared by every process that opens it.
+    """
+    def __init__(self, db_path, max_depth=GRADE_QUEUE_DEPTH, max_rows=GRADE_QUEUE_DB_MAX):
+        self.db_path = db_path
+        self.max_depth = max_depth
+        self.max_rows = max_rows
+        self._local = threading.local()
+        self._db_ready = False
+        self._finished = 0
+        # Wakes this process's workers/pollers early; other processes are seen by polling
+        self._condition = threading.Condition()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            if not self._db_ready:
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS grading_job ('
+                    ' submission_id TEXT PRIMARY KEY,'
+                    ' question_id TEXT NOT NULL,'
+                    ' path TEXT NOT NULL,'
+                    ' state TEXT NOT NULL,'
+                    ' result TEXT,'
+                    ' error TEXT,'
+                    ' enqueued_at REAL NOT NULL,'
+                    ' started_at REAL,'
+                    ' finished_at REAL)'
+                )
+                connection.execute(
+                    'CREATE INDEX IF NOT EXISTS ix_grading_job_state_enqueued'
+                    ' ON grading_job (state, enqueued_at)'
+                )
+                self._db_ready = True
+            self._local.connection = connection
+        return connection
+
+    def _notify(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    def _wait(self, timeout):
+        with self._condition:
+            self._condition.wait(timeout)
+
+    @staticmethod
+    def _job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def depth(self):
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM grading_job WHERE state = ?', (QUEUED,)
+        ).fetchone()[0]
+
+    def put(self, job):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            depth = connection.execute(
+                'SELECT COUNT(*) FROM grading_job WHERE state = ?', (QUEUED,)
+            ).fetchone()[0]
+            if depth >= self.max_depth:
+                raise QueueFull(f"{depth} jobs queued")
+            connection.execute(
+                'INSERT OR REPLACE INTO grading_job (submission_id, question_id, path, state, enqueued_at)'
+                ' VALUES (?, ?, ?, ?, ?)',
+                (job["submission_id"], job["question_id"], job["path"], QUEUED, job["enqueued_at"])
+            )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        self._notify()
+
+    def _claim_next(self):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            job = self._job(connection.execute(
+                'SELECT * FROM grading_job WHERE state = ? ORDER BY enqueued_at LIMIT 1', (QUEUED,)
+            ).fetchone())
+            if job is not None:
+                job.update(state=GRADING, started_at=time.time())
+                connection.execute(
+                    'UPDATE grading_job SET state = ?, started_at = ? WHERE submission_id = ?',
+                    (GRADING, job["started_at"], job["submission_id"])
+                )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return job
+
+    def claim(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self._claim_next()
+            remaining = deadline - time.monotonic()
+            if job is not None or remaining <= 0:
+                return job
+            self._wait(min(remaining, 1.0))
+
+    def finish(self, submission_id, result=None, error=None):
+        connection = self._connection()
+        connection.execute(
+            'UPDATE grading_job SET state = ?, result = ?, error = ?, finished_at = ? WHERE submission_id = ?',
+            (FAILED if error else DONE, json.dumps(result) if result is not None else None, error,
+             time.time(), submission_id)
+        )
+        self._finished += 1
+        if self._finished % 1000 == 0:
+            # Keep the newest max_rows finished jobs
+            connection.execute(
+                'DELETE FROM grading_job WHERE submission_id IN ('
+                ' SELECT submission_id FROM grading_job WHERE state IN (?, ?)'
+                ' ORDER BY finished_at DESC LIMIT -1 OFFSET ?)',
+                (DONE, FAILED, self.max_rows)
+            )
+        self._notify()
+
+    def get(self, submission_id):
+        return self._job(self._connection().execute(
+            'SELECT * FROM grading_job WHERE submission_id = ?', (submission_id,)
+        ).fetchone())
+
+    def wait(self, submission_id, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(submission_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["state"] not in (QUEUED, GRADING) or remaining <= 0:
+                return job
+            self._wait(min(remaining, POLL_INTERVAL))
+
+    def recover(self):
+        """
+        Requeue jobs whose worker died mid-grade.
+
+        Returns:
+            int: The number of jobs requeued
+        """
+        cursor = self._connection().execute(
+            'UPDATE grading_job SET state = ?, started_at = NULL WHERE state = ? AND started_at < ?',
+            (QUEUED, GRADING, time.time() - STALE_JOB_SECONDS)
+        )
+        return cursor.rowcount
+
+class GradingQueue:
+    """
+    A bounded grading queue and the worker threads that drain it.
+    """
+    def __init__(self, store, workers=GRADE_WORKERS, processes=GRADE_PROCESSES):
+        self.store = store
+        self.workers = workers
+        self.processes = processes
+        self.app = None
+        self.graded = 0
+        self.failed = 0
+        self.rejected = 0
+        self._threads = []
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Started on first use (and again in a forked child) rather than at import
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            recovered = self.store.recover()
+            if recovered:
+                print(f"Requeued {recovered} interrupted grading jobs")
+            if self.processes > 0:
+                # Not fork: see WORKER_START_METHOD in pylint_pool.py
+                self._executor = ProcessPoolExecutor(max_workers=self.processes, initializer=_init_process,
+                                                     mp_context=multiprocessing.get_context(WORKER_START_METHOD))
+            self._threads = [
+                threading.Thread(target=self._work, name=f"grading-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def saturated(self):
+        return self.store.depth() >= self.store.max_depth
+
+    def enqueue(self, submission_id, question_id, path=None):
+        """
+        Queue a stored submission for grading.
+
+        Args:
+            submission_id (str): The submission id
+            question_id (str): The ID of the question
+            path (str): The JSON payload file, if it isn't in the blob store
+        Raises:
+            QueueFull: If the queue is at its maximum depth
+        """
+        self._ensure_started()
+        try:
+            self.store.put({
+                "submission_id": submission_id,
+                "question_id": question_id,
+                "path": os.path.relpath(path, SUBMISSIONS_DIR) if path else '',
+                "state": QUEUED,
+                "result": None,
+                "error": None,
+                "enqueued_at": time.time(),
+                "started_at": None,
+                "finished_at": None
+            })
+        except QueueFull:
+            self.rejected += 1
+            raise
+
+    def _payload(self, job):
+        # Read by the worker thread: the grading processes have no database connection
+        with self.app.app_context():
+            submission = get_submission(job["submission_id"])
+            if submission is not None:
+                return load_submission_payload(submission)
+        with open(os.path.join(SUBMISSIONS_DIR, job["path"]), 'r') as f:
+            return json.load(f)
+
+    def _grade(self, job):
+        data = self._payload(job)
+        if self._executor is not None:
+            return self._executor.submit(grade_job, job["question_id"], data).result()
+        return grade_job(job["question_id"], data)
+
+    def _work(self):
+        while True:
+            try:
+                job = self.store.claim(timeout=1.0)
+                if job is not None:
+                    self._run(job)
+            except sqlite3.Error as e:
+                # Unfinished jobs go back on the queue via recover()
+                print(f"Grading queue error: {e}")
+                time.sleep(1.0)
+
+    def _run(self, job):
+        question_id = job["question_id"]
+        stage_duration.observe(max(0.0, job["started_at"] - job["enqueued_at"]),
+                               endpoint='grading_queue', stage='queue_wait', question=question_label(question_id))
+        try:
+            with stage_timer('grading_queue', 'grade', question=question_id):
+                result = self._grade(job)
+            with self.app.app_context():
+                record_grade(job["submission_id"], question_id, result, 'queue')
+        except Exception as e:
+            print(f"Grading {job['submission_id']} failed: {e}")
+            self.store.finish(job["submission_id"], error=str(e))
+            self.failed += 1
+            return
+        self.store.finish(job["submission_id"], result=result)
+        self.graded += 1
+
+    def result(self, submission_id, wait=0):
+        """
+        Return the job for a submission, waiting up to `wait` seconds for it to finish.
+        """
+        self._ensure_started()
+        if wait > 0:
+            return self.store.wait(submission_id, wait)
+        return self.store.get(submission_id)
+
+    def stats(self):
+        return {
+            "backend": "sqlite" if isinstance(self.store, SQLiteJobStore) else "memory",
+            "depth": self.store.depth(),
+            "max_depth": self.store.max_depth,
+            "workers": self.workers,
+            "processes": self.processes,
+            "graded": self.graded,
+            "failed": self.failed,
+            "rejected": self.rejected
+        }
+
+grading_queue = GradingQueue(SQLiteJobStore(GRADE_QUEUE_DB) if GRADE_QUEUE_DB else MemoryJobStore())
+
+def share_grading_queue(app, workers):
+    """
+    Make sure every server worker sees the same queue, before the workers are started.
+
+    Args:
+        app: The Flask application
+        workers (int): Server worker processes
+    """
+    if workers > 1 and isinstance(grading_queue.store, MemoryJobStore):
+        db_path = os.path.join(app.instance_path, 'grade_queue.db')
+        os.makedirs(app.instance_path, exist_ok=True)
+        print(f"Sharing the grading queue between {workers} workers in {db_path} "
+              f"(set XGRADING_GRADE_QUEUE_DB to move it)")
+        grading_queue.store = SQLiteJobStore(db_path)
+
+def wants_async(data):
+    """
+    Whether a submit request should be graded in the background.
+
+    Clients opt in or out with "async" in the body (or ?async=1); otherwise
+    XGRADING_ASYNC_SUBMIT decides.
+    """
+    requested = data.pop('async', None)
+    if requested is None:
+        requested = request.args.get('async')
+    if requested is None:
+        return ASYNC_SUBMIT
+    return requested in (True, 1, '1', 'true')
+
+def queue_full_response():
+    response = jsonify({
+        "success": False,
+        "error": "The grading queue is full, please submit again shortly.",
+        "retryAfter": RETRY_AFTER
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(RETRY_AFTER)
+    return response
+
+def setup_grading_queue(app):
+    """
+    Set up the grading queue and its result routes.
+
+    Args:
+        app: The Flask application
+    """
+    grading_queue.app = app
+
+    @app.route('/api/submission/<submission_id>/grade', methods=['GET'])
+    def get_submission_grade(submission_id):
+        try:
+            wait = min(float(request.args.get('wait', 0)), MAX_WAIT)
+        except ValueError:
+            return jsonify({"error": "wait must be a number of seconds"}), 400
+
+        job = grading_queue.result(submission_id, wait)
+        if job is None:
+            # Not (or no longer) in the queue: fall back to the index
+            submission = get_submission(submission_id)
+            if submission is None:
+                return jsonify({"error": "Submission not found", "submissionId": submission_id}), 404
+            if submission.score is not None:
+                return jsonify({"submissionId": submission_id, "status": DONE, "grade": {"score": submission.score}})
+            # Stored but never graded (the queue was full, or its job was lost):
+            # queue it again rather than answering "queued" forever
+            try:
+                grading_queue.enqueue(submission_id, submission.question_id,
+                                      os.path.join(SUBMISSIONS_DIR, submission.path) if submission.path else None)
+            except QueueFull:
+                return queue_full_response()
+            job = {"state": QUEUED}
+
+        body = {"submissionId": submission_id, "status": job["state"]}
+        if job["state"] == DONE:
+            body["grade"] = grade_for_response(job["result"])
+            return jsonify(body)
+        if job["state"] == FAILED:
+            body["error"] = job["error"]
+            return jsonify(body)
+
+        response = jsonify(body)
+        response.status_code = 202
+        response.headers['Retry-After'] = '1'
+        return response
+
+    @app.route('/api/grading/queue', methods=['GET'])
+    def grading_queue_stats():
+        return jsonify(grading_queue.stats())
@@ -0,0 +1,118 @@
+import gzip
+import os
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# HTTP-level bandwidth savings.
+#
+# Conditional requests: responses built from content with a known hash carry a
+# strong ETag and a Cache-Control header; a client that sends the same ETag back
+# in If-None-Match gets an empty 304 instead of the body.
+#
+# Compression: JSON/HTML/text bodies above COMPRESS_MIN_SIZE are sent with
+# brotli (when the brotli package is installed) or gzip, whichever the client
+# prefers. Streamed responses (SSE, exports) are never compressed here.
+#
+# Compact grades: ?compact=1 on the grading routes replaces the per-section
+# feedback lists in "details" (already rendered into "feedback") with just the
+# section scores.
+
+# Cache-Control max-age (seconds) for question content; 0 means "revalidate every time"
+QUESTION_MAX_AGE = int(os.environ.get('XGRADING_QUESTION_MAX_AGE', '0'))
+# Bodies smaller than this (bytes) are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.environ.get('XGRADING_COMPRESS_MIN_SIZE', '1024'))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/x-ndjson', 'text/html', 'text/plain', 'text/csv', 'text/css',
+    'application/javascript'
+}
+
+def _encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def not_modified(etag):
+    """
+    Whether the request's If-None-Match already names etag (in any of its encoded variants).
+    """
+    return any(request.if_none_match.contains(variant)
+               for variant in [etag] + [f"{etag}-{encoding}" for encoding in _encodings()])
+
+def cached_response(etag, build, max_age=QUESTION_MAX_AGE):
+    """
+    Answer a GET for content identified by etag.
+
+    Args:
+        etag (str): Strong validator of the content (e.g. its sha256)
+        build (callable): Builds the full response when the client's copy is stale
+        max_age (int): Cache-Control max-age in seconds
+    Returns:
+        Response: A 304 if the client already has this version, else build()'s response
+    """
+    if not_modified(etag):
+        response = Response(status=304)
+    else:
+        response = build()
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={max_age}' if max_age > 0 else 'no-cache'
+    return response
+
+def wants_compact():
+    return request.args.get('compact', '').lower() in ('1', 'true', 'yes')
+
+def compact_grade(grade):
+    """
+    Drop the per-section feedback lists of a grade_submission result.
+    """
+    if not grade or 'details' not in grade:
+        return grade
+    compact = {key: value for key, value in grade.items() if key != 'details'}
+    compact["details"] = {
+        section: {"score": result.get("score"), "max_score": result.get("max_score")}
+        for section, result in grade["details"].items()
+    }
+    return compact
+
+def grade_for_response(grade):
+    """The grade as it should go into a response: compacted if the request asked for it."""
+    return compact_grade(grade) if wants_compact() else grade
+
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    encoding = max(_encodings(), key=lambda e: request.accept_encodings[e])
+    if not request.accept_encodings[encoding]:
+        return response
+
+    if encoding == 'br':
+        response.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+    # The encoded body is a different representation, so it gets its own strong validator
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f"{etag}-{encoding}")
+    return response
+
+def setup_compression(app):
+    """
+    Compress the application's responses.
+
+    Args:
+        app: The Flask application
+    """
+    app.after_request(compress_response)
@@ -0,0 +1,160 @@
+import java.io.BufferedInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.DataInputStream;
+import java.io.IOException;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.net.URI;
+import java.nio.charset.StandardCharsets;
+import java.util.Collections;
+import java.util.List;
+import java.util.Locale;
+
+import javax.tools.Diagnostic;
+import javax.tools.DiagnosticCollector;
+import javax.tools.FileObject;
+import javax.tools.ForwardingJavaFileManager;
+import javax.tools.JavaCompiler;
+import javax.tools.JavaFileObject;
+import javax.tools.SimpleJavaFileObject;
+import javax.tools.StandardJavaFileManager;
+import javax.tools.ToolProvider;
+
+/**
+ * Long-lived javac used by java_compiler.py.
+ *
+ * Reads requests from stdin and compiles them in memory, so the JVM and the
+ * compiler stay warm between requests. Protocol (UTF-8, one request at a time):
+ *
+ *   request:  COMPILE &lt;className&gt; &lt;byteLength&gt;\n&lt;source bytes&gt;
+ *   response: DIAG\t&lt;line&gt;\t&lt;error|warning&gt;\t&lt;message&gt;\n   (zero or more)
+ *             END\t&lt;1 if compiled, else 0&gt;\n
+ *
+ * The server prints READY once the compiler is loaded.
+ */
+public class CompileServer {
+
+    /** Source held in memory instead of a .java file on disk. */
+    static class SourceObject extends SimpleJavaFileObject {
+        private final String code;
+
+        SourceObject(String className, String code) {
+            super(URI.create("string:///" + className + Kind.SOURCE.extension), Kind.SOURCE);
+            this.code = code;
+        }
+
+        @Override
+        public CharSequence getCharContent(boolean ignoreEncodingErrors) {
+            return code;
+        }
+    }
+
+    /** Class files are only needed to prove the code compiles, so drop them. */
+    static class DiscardedOutput extends SimpleJavaFileObject {
+        DiscardedOutput(String className, Kind kind) {
+            super(URI.create("mem:///" + className.replace('.', '/') + kind.extension), kind);
+        }
+
+        @Override
+        public OutputStream openOutputStream() {
+            return new ByteArrayOutputStream();
+        }
+    }
+
+    static class InMemoryFileManager extends ForwardingJavaFileManager<StandardJavaFileManager> {
+        InMemoryFileManager(StandardJavaFileManager fileManager) {
+            super(fileManager);
+        }
+
+        @Override
+        public JavaFileObject getJavaFileForOutput(Location location, String className,
+                                                   JavaFileObject.Kind kind, FileObject sibling) {
+            return new DiscardedOutput(className, kind);
+        }
+    }
+
+    private static String readLine(DataInputStream in) throws IOException {
+        ByteArrayOutputStream buffer = new ByteArrayOutputStream();
+        int b;
+        while ((b = in.read()) != -1 && b != '\n') {
+            buffer.write(b);
+        }
+        if (b == -1 && buffer.size() == 0) {
+            return null;
+        }
+        return buffer.toString(StandardCharsets.UTF_8.name());
+    }
+
+    private static String clean(String message) {
+        // Only the first line, like the "file:line: error: message" line javac prints
+        String firstLine = message.split("\\R", 2)[0];
+        return firstLine.replace('\t', ' ');
+    }
+
+    public static void main(String[] args) throws IOException {
+        JavaCompiler compiler = ToolProvider.getSystemJavaCompiler();
+        PrintStream out = new PrintStream(System.out, false, StandardCharsets.UTF_8.name());
+        if (compiler == null) {
+            out.println("UNAVAILABLE\tno system Java compiler (is this a JRE?)");
+            out.flush();
+            return;
+        }
+
+        StandardJavaFileManager standardManager = compiler.getStandardFileManager(null, Locale.ROOT, StandardCharsets.UTF_8);
+        InMemoryFileManager fileManager = new InMemoryFileManager(standardManager);
+        List<String> options = Collections.singletonList("-proc:none");
+
+        out.println("READY");
+        out.flush();
+
+        DataInputStream in = new DataInputStream(new BufferedInputStream(System.in));
+        String header;
+        while ((header = readLine(in)) != null) {
+            String[] parts = header.trim().split(" ");
+            if (parts.length != 3 || !parts[0].equals("COMPILE")) {
+                out.println("DIAG\t1\terror\tMalformed compile request");
+                out.println("END\t0");
+                out.flush();
+                continue;
+            }
+
+            byte[] source = new byte[Integer.parseInt(parts[2])];
+            in.readFully(source);
+            String className = parts[1];
+            String code = new String(source, StandardCharsets.UTF_8);
+
+            DiagnosticCollector<JavaFileObject> diagnostics = new DiagnosticCollector<>();
+            JavaCompiler.CompilationTask task = compiler.getTask(
+                    null, fileManager, diagnostics, options, null,
+                    Collections.singletonList(new SourceObject(className, code)));
+            boolean success;
+            try {
+                success = task.call();
+            } catch (RuntimeException e) {
+                success = false;
+                out.println("DIAG\t1\terror\tCompiler crashed: " + clean(String.valueOf(e.getMessage())));
+            }
+
+            for (Diagnostic<? extends JavaFileObject> diagnostic : diagnostics.getDiagnostics()) {
+                String severity;
+                switch (diagnostic.getKind()) {
+                    case ERROR:
+                        severity = "error";
+                        break;
+                    case WARNING:
+                    case MANDATORY_WARNING:
+                        severity = "warning";
+                        break;
+                    default:
+                        // Notes are not reported by the javac output parser either
+                        continue;
+                }
+                long line = diagnostic.getLineNumber();
+                out.println("DIAG\t" + (line > 0 ? line : 1) + "\t" + severity + "\t"
+                        + clean(diagnostic.getMessage(Locale.ROOT)));
+            }
+            out.println("END\t" + (success ? "1" : "0"));
+            out.flush();
+        }
+    }
+}
@@ -0,0 +1,260 @@
+import contextlib
+import os
+import queue
+import re
+import subprocess
+import tempfile
+import threading
+import time
+
+from sandbox import SANDBOX_TIMEOUT, SandboxTimeout, limited_command, sandbox
+
+# Warm javac service used by /api/validate/java.
+#
+# Each worker is a long-lived JVM running java/CompileServer.java, which compiles
+# sources in memory with javax.tools and answers over stdin/stdout. The JVM and
+# the compiler classes are loaded once per worker instead of once per keystroke.
+
+JAVA_SOURCE_DIR = os.path.join(os.path.dirname(__file__), 'java')
+JAVA_BUILD_DIR = os.environ.get('XGRADING_JAVA_BUILD_DIR',
+                                os.path.join(tempfile.gettempdir(), 'xgrading-java'))
+JAVA_POOL_SIZE = int(os.environ.get('XGRADING_JAVA_POOL_SIZE', '2'))
+# Seconds a request waits for an idle worker before falling back to plain javac
+JAVA_POOL_WAIT = float(os.environ.get('XGRADING_JAVA_POOL_WAIT', '30'))
+# How often a queued request checks whether it was superseded
+POLL_INTERVAL = 0.05
+
+# Small, quick-starting JVMs: the compiler never needs much heap for student code.
+# Capping the code cache and class space keeps the reserved address space under RLIMIT_AS.
+JVM_OPTIONS = ['-Xshare:auto', '-XX:+UseSerialGC', '-XX:TieredStopAtLevel=1', '-Xmx256m',
+               '-XX:ReservedCodeCacheSize=64m', '-XX:CompressedClassSpaceSize=128m']
+
+PUBLIC_TYPE_PATTERN = re.compile(
+    r'\bpublic\s+(?:(?:abstract|final|sealed|non-sealed|static|strictfp)\s+)*'
+    r'(?:class|interface|enum|record|@interface)\s+(\w+)'
+)
+
+class CompilerUnavailable(Exception):
+    """The warm compiler could not handle a request; callers should fall back to javac."""
+
+def source_class_name(code):
+    """
+    Pick the file name javac expects for the code (the public top-level type).
+    """
+    match = PUBLIC_TYPE_PATTERN.search(code)
+    return match.group(1) if match else 'Main'
+
+class JavaCompilerWorker:
+    """
+    One CompileServer JVM. Not thread-safe; the pool hands each worker to one request at a time.
+    """
+    def __init__(self, class_dir):
+        self.process = subprocess.Popen(
+            # Long-lived, so no CPU limit; each compile has a wall-clock timeout instead
+            limited_command(['java'] + JVM_OPTIONS + ['-cp', class_dir, 'CompileServer']),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        ready = self.process.stdout.readline().decode('utf-8').strip()
+        if ready != 'READY':
+            self.close()
+            raise CompilerUnavailable(f"Compile server failed to start: {ready or 'no output'}")
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def compile(self, code, timeout=SANDBOX_TIMEOUT):
+        """
+        Compile the code in the worker.
+
+        Returns:
+            tuple: (success, errors) where errors is a list of {line, message, severity}
+        Raises:
+            CompilerUnavailable: If the worker failed
+            SandboxTimeout: If the compile ran past the timeout (the worker is killed)
+        """
+        source = code.encode('utf-8')
+        header = f"COMPILE {source_class_name(code)} {len(source)}\n".encode('utf-8')
+        # A compile that runs too long takes the worker down with it
+        timed_out = threading.Event()
+        def expire():
+            timed_out.set()
+            self.process.kill()
+        watchdog = threading.Timer(timeout, expire)
+        watchdog.start()
+        try:
+            self.process.stdin.write(header + source)
+            self.process.stdin.flush()
+
+            errors = []
+            while True:
+                line = self.process.stdout.readline()
+                if not line:
+                    if timed_out.is_set():
+                        raise SandboxTimeout(f"javac did not finish within {timeout:g}s")
+                    raise CompilerUnavailable("Compile server exited")
+                fields = line.decode('utf-8').rstrip('\n').split('\t', 3)
+                if fields[0] == 'END':
+                    return fields[1] == '1', errors
+                if fields[0] == 'DIAG' and len(fields) == 4:
+                    errors.append({
+                        "line": int(fields[1]),
+                        "message": fields[3],
+                        "severity": fields[2]
+                    })
+        except (OSError, ValueError) as e:
+            if timed_out.is_set():
+                raise SandboxTimeout(f"javac did not finish within {timeout:g}s")
+            raise CompilerUnavailable(f"Compile server I/O failed: {e}")
+        finally:
+            watchdog.cancel()
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+class JavaCompilerPool:
+    """
+    A fixed number of warm CompileServer workers shared by all request threads.
+    """
+    def __init__(self, size=JAVA_POOL_SIZE, class_dir=JAVA_BUILD_DIR):
+        self.size = size
+        self.class_dir = class_dir
+        self._idle = queue.Queue()
+        self._workers = 0
+        self._lock = threading.Lock()
+
+    def _build_server(self):
+        source = os.path.join(JAVA_SOURCE_DIR, 'CompileServer.java')
+        compiled = os.path.join(self.class_dir, 'CompileServer.class')
+        if os.path.exists(compiled) and os.path.getmtime(compiled) >= os.path.getmtime(source):
+            return
+        os.makedirs(self.class_dir, exist_ok=True)
+        result = subprocess.run(['javac', '-d', self.class_dir, source], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise CompilerUnavailable(f"Could not build CompileServer: {result.stderr.strip()}")
+
+    def start(self):
+        """
+        Build the compile server if needed and start the workers.
+
+        Raises:
+            CompilerUnavailable: If java/javac are missing or no worker could start
+        """
+        try:
+            self._build_server()
+        except OSError as e:
+            raise CompilerUnavailable(f"javac is not available: {e}")
+
+        failure = None
+        for _ in range(self.size):
+            try:
+                self._idle.put(JavaCompilerWorker(self.class_dir))
+                self._workers += 1
+            except (OSError, CompilerUnavailable) as e:
+                failure = e
+        if self._workers == 0:
+            raise CompilerUnavailable(f"No Java compiler worker could start: {failure}")
+        print(f"Started {self._workers} warm Java compiler workers")
+
+    @property
+    def available(self):
+        return self._workers > 0
+
+    def _checkout(self, ticket=None):
+        deadline = time.monotonic() + JAVA_POOL_WAIT
+        while True:
+            if ticket is not None:
+                # Superseded requests give up their place in the queue
+                ticket.check()
+            try:
+                return self._idle.get(timeout=POLL_INTERVAL if ticket is not None else JAVA_POOL_WAIT)
+            except queue.Empty:
+                if time.monotonic() >= deadline:
+                    raise CompilerUnavailable("All Java compiler workers are busy")
+
+    @contextlib.contextmanager
+    def checkout(self, ticket=None):
+        """
+        Hold an idle worker for the duration of the block, replacing it if it dies.
+
+        Raises:
+            CompilerUnavailable: If no worker became idle within JAVA_POOL_WAIT
+            ValidationSuperseded: If the ticket was superseded while waiting for a worker
+        """
+        if not self.available:
+            raise CompilerUnavailable("No Java compiler workers running")
+        worker = self._checkout(ticket)
+
+        try:
+            yield worker
+        except (CompilerUnavailable, SandboxTimeout) as e:
+            if isinstance(e, SandboxTimeout):
+                sandbox.record_timeout()
+            worker.close()
+            worker = self._replace_worker()
+            raise
+        finally:
+            if worker is not None:
+                self._idle.put(worker)
+
+    def compile(self, code, ticket=None):
+        """
+        Compile code on an idle worker, replacing the worker if it dies.
+
+        A running compile is not interrupted when the ticket is superseded (killing
+        a warm JVM costs more than finishing the compile), but queued ones are dropped.
+
+        Returns:
+            tuple: (success, errors)
+        Raises:
+            CompilerUnavailable: If no worker is available or the worker failed
+            SandboxTimeout: If the compile ran past the sandbox timeout
+            ValidationSuperseded: If the ticket was superseded while waiting for a worker
+        """
+        with self.checkout(ticket) as worker:
+            return worker.compile(code)
+
+    def _replace_worker(self):
+        try:
+            return JavaCompilerWorker(self.class_dir)
+        except (OSError, CompilerUnavailable) as e:
+            print(f"Could not restart Java compiler worker: {e}")
+            with self._lock:
+                self._workers -= 1
+            return None
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._workers = 0
+
+_pool = None
+# Process that started _pool; a forked worker starts its own
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_java_compiler_pool():
+    """
+    Return the process-wide compiler pool, starting it on first use.
+
+    Returns None when the pool is disabled (XGRADING_JAVA_POOL_SIZE=0) or cannot run here.
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                pool = JavaCompilerPool()
+                if pool.size > 0:
+                    try:
+                        pool.start()
+                    except CompilerUnavailable as e:
+                        print(f"Warm Java compiler disabled, using javac per request: {e}")
+                _pool = pool
+                _pool_pid = os.getpid()
+    return _pool if _pool.available else None
@@ -0,0 +1,520 @@
+import hashlib
+import re
+import threading
+import time
+
+from flask import jsonify, request
+
+from grading import grade_submission
+from http_cache import grade_for_response
+from metrics import count_request, stage_timer
+
+# Server-side class-structure extraction for Java submissions.
+#
+# Produces the schema grade_submission consumes, in the shape CodeWorkbench.js
+# builds in the browser (parseCodeToSchema in utils/mermaidUtils.js):
+#
+#   schema:        [[name, {entity, attribute: {attr: {type, attribute}}, methods: [...]}], ...]
+#   relationships: [[key, {type, relationA, relationB, cardinalityA, cardinalityB, label}], ...]
+#
+# Extraction is incremental. The source is split into its top-level type
+# declarations and each block is keyed by a hash of its text with comments and
+# literals blanked out. An editor session keeps the structures of its previous
+# revision, so a new revision only re-extracts the blocks that changed; edits to
+# comments or string contents don't re-extract anything.
+
+# Sessions idle for longer than this (seconds) are forgotten
+SESSION_TTL = 600
+
+PRIMITIVE_TYPES = {"String", "int", "double", "float", "boolean", "char", "long", "short", "byte", "void"}
+COLLECTION_TYPES = {"List", "Set", "Map", "Collection", "ArrayList", "LinkedList", "HashSet", "TreeSet",
+                    "HashMap", "TreeMap", "LinkedHashMap", "Queue", "Deque", "ArrayDeque"}
+MODIFIERS = {"public", "protected", "private", "static", "final", "abstract", "transient", "volatile",
+             "synchronized", "native", "strictfp", "default", "sealed", "non-sealed"}
+
+# Comments, text blocks and string/char literals; each is blanked out before splitting
+_NOISE = re.compile(r'//[^\n]*|/\*(?:.*?\*/|.*)|"""(?:.*?"""|.*)|"(?:\\.|[^"\\\n])*"?|\'(?:\\.|[^\'\\\n])*\'?',
+                    re.DOTALL)
+_STRUCTURE = re.compile(r'[{};]')
+_ANNOTATION = re.compile(r'@(?!interface\b)[\w.]+(?:\s*\([^()]*\))?')
+_TYPE_HEADER = re.compile(r'\b(class|interface|enum|record|@interface)\s+(\w+)')
+_EXTENDS = re.compile(r'\bextends\s+(.+?)(?=\bimplements\b|\bpermits\b|$)', re.DOTALL)
+_IMPLEMENTS = re.compile(r'\bimplements\s+(.+?)(?=\bpermits\b|$)', re.DOTALL)
+_IDENTIFIER = re.compile(r'\w+')
+_TRAILING_NAME = re.compile(r'(\w+)\s*((?:\[\s*\]\s*)*)$')
+_WHITESPACE = re.compile(r'\s+')
+
+def _blank(match):
+    # Keep newlines so offsets and line numbers survive
+    text = match.group(0)
+    return re.sub(r'[^\n]', ' ', text)
+
+def mask_java(code):
+    """
+    Blank out comments and string/char literals, keeping every other character in place.
+    """
+    return _NOISE.sub(_blank, code)
+
+def split_type_declarations(masked):
+    """
+    Split masked Java source into its top-level declarations.
+
+    package/import statements and stray top-level semicolons are dropped.
+
+    Returns:
+        list: The source text of each top-level type declaration
+    """
+    blocks = []
+    depth = 0
+    start = 0
+    for match in _STRUCTURE.finditer(masked):
+        token = match.group(0)
+        if token == '{':
+            depth += 1
+        elif token == '}':
+            depth -= 1
+            if depth == 0:
+                blocks.append(masked[start:match.end()].strip())
+                start = match.end()
+            elif depth < 0:
+                # Unbalanced; start over after the stray brace
+                depth = 0
+                start = match.end()
+        elif depth == 0:
+            start = match.end()
+    if depth > 0:
+        # Unterminated last declaration (the student is still typing)
+        blocks.append(masked[start:].strip())
+    return [block for block in blocks if block]
+
+def split_top_level(text, separator=','):
+    """
+    Split text on separator outside <...>, (...) and {...}.
+    """
+    parts = []
+    depth = 0
+    start = 0
+    for i, ch in enumerate(text):
+        if ch in '<({':
+            depth += 1
+        elif ch in '>)}':
+            depth -= 1
+        elif ch == separator and depth <= 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+def _strip_type_arguments(type_name):
+    return type_name.split('<')[0].strip()
+
+def _squash(text):
+    return _WHITESPACE.sub(' ', text).strip()
+
+def _declaration(text):
+    """
+    Split "modifiers Type name" into (visibility, modifiers, type, name).
+    """
+    text = _squash(_ANNOTATION.sub(' ', text))
+    modifiers = []
+    words = text.split(' ')
+    while words and words[0] in MODIFIERS:
+        modifiers.append(words.pop(0))
+    rest = ' '.join(words)
+    # Type parameters of a generic method: "<T> T first(...)"
+    if rest.startswith('<'):
+        depth = 0
+        for i, ch in enumerate(rest):
+            depth += (ch == '<') - (ch == '>')
+            if depth == 0:
+                rest = rest[i + 1:].strip()
+                break
+    match = _TRAILING_NAME.search(rest)
+    if not match:
+        return None
+    type_name = _squash(rest[:match.start()] + match.group(2).replace(' ', ''))
+    visibility = next((m for m in modifiers if m in ('public', 'protected', 'private')), 'package')
+    return visibility, modifiers, type_name, match.group(1)
+
+def parse_parameter(parameter):
+    """
+    Format a Java parameter ("final List<Fish> fish") the way the browser does ("fish: List<Fish>").
+    """
+    declaration = _declaration(parameter)
+    if declaration is None or not declaration[2]:
+        return _squash(parameter)
+    _, _, type_name, name = declaration
+    return f"{name}: {type_name}"
+
+def parse_method_header(header, class_name, is_interface):
+    """
+    Parse the header of a member with a parameter list.
+
+    Returns:
+        dict: {visibility, returnType, name, parameters, methodType[, propertyName]},
+            or None for constructors and anything else that is not a method
+    """
+    paren = header.find('(')
+    close = header.rfind(')')
+    if paren == -1 or close < paren:
+        return None
+    declaration = _declaration(header[:paren])
+    if declaration is None:
+        return None
+    visibility, modifiers, return_type, name = declaration
+    if not return_type or name == class_name or return_type in ('new', 'return'):
+        return None
+
+    parameters = [parse_parameter(p) for p in split_top_level(header[paren + 1:close])]
+    if is_interface and visibility == 'package':
+        visibility = 'public'
+
+    method = {
+        "visibility": visibility,
+        "returnType": return_type,
+        "name": name,
+        "parameters": parameters,
+        "methodType": "regular"
+    }
+    if is_interface and 'default' not in modifiers and 'static' not in modifiers:
+        method["methodType"] = "abstract"
+    elif 'abstract' in modifiers:
+        method["methodType"] = "abstract"
+    elif name.startswith('get') and not parameters and return_type != 'void':
+        method["methodType"] = "getter"
+        method["propertyName"] = name[3:4].lower() + name[4:]
+    elif name.startswith('set') and len(parameters) == 1:
+        method["methodType"] = "setter"
+        method["propertyName"] = name[3:4].lower() + name[4:]
+    return method
+
+def parse_fields(statement):
+    """
+    Parse a field declaration ("private int a, b = 2;").
+
+    Returns:
+        list: (type, name) for each declared variable, [] if the statement is not a field
+    """
+    declarators = split_top_level(statement)
+    if not declarators:
+        return []
+    first = declarators[0].split('=', 1)[0]
+    declaration = _declaration(first)
+    if declaration is None or not declaration[2] or '(' in first:
+        return []
+    _, _, type_name, name = declaration
+    fields = [(type_name, name)]
+    for declarator in declarators[1:]:
+        match = _TRAILING_NAME.search(declarator.split('=', 1)[0].strip())
+        if match:
+            fields.append((type_name + match.group(2).replace(' ', ''), match.group(1)))
+    return fields
+
+def field_relationship(class_name, field_type):
+    """
+    The relationship a field of field_type implies, as (target, type, cardinalityB), or None.
+    """
+    base_type = _strip_type_arguments(field_type).rstrip('[] ')
+    if base_type in COLLECTION_TYPES:
+        arguments = field_type[field_type.find('<') + 1:field_type.rfind('>')] if '<' in field_type else ''
+        items = [_strip_type_arguments(a) for a in split_top_level(arguments)]
+        # A Map aggregates its values
+        item = items[-1] if items else ''
+        if item and _IDENTIFIER.fullmatch(item) and item not in PRIMITIVE_TYPES:
+            return item, 'aggregation', 'many'
+        return None
+    if field_type.endswith(']'):
+        if base_type in PRIMITIVE_TYPES or not _IDENTIFIER.fullmatch(base_type):
+            return None
+        return base_type, 'aggregation', 'many'
+    if base_type in PRIMITIVE_TYPES or base_type == class_name or not _IDENTIFIER.fullmatch(base_type):
+        return None
+    return base_type, 'composition', '1'
+
+class TypeStructure:
+    """
+    The extracted structure of one top-level type declaration.
+    """
+    def __init__(self, name, kind, parent, interfaces, attributes, methods):
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.interfaces = interfaces
+        self.attributes = attributes  # {name: type}
+        self.methods = methods
+
+    def entity(self):
+        return {
+            "entity": normalize_entity_name(self.name),
+            "attribute": {name: {"type": type_name, "attribute": name}
+                          for name, type_name in self.attributes.items()},
+            "methods": self.methods,
+            "parent": normalize_entity_name(self.parent) if self.parent else None,
+            "isInterface": self.kind == 'interface'
+        }
+
+    def relationships(self):
+        relationships = []
+        for interface in self.interfaces:
+            relationships.append([f"{self.name}-implements-{interface}", {
+                "type": "implementation",
+                "relationA": self.name,
+                "relationB": interface,
+                "label": "implements"
+            }])
+        seen = set()
+        for type_name in self.attributes.values():
+            implied = field_relationship(self.name, type_name)
+            if implied is None or implied[0] in seen:
+                continue
+            target, rel_type, cardinality = implied
+            seen.add(target)
+            relationships.append([f"{self.name}-{target}", {
+                "type": rel_type,
+                "relationA": self.name,
+                "relationB": target,
+                "cardinalityA": "1",
+                "cardinalityB": cardinality,
+                "label": rel_type.capitalize()
+            }])
+        return relationships
+
+def normalize_entity_name(name):
+    # Same as normalizeEntityName in utils/mermaidUtils.js
+    return _WHITESPACE.sub('', name).lower()
+
+def _type_names(clause):
+    return [_strip_type_arguments(name) for name in split_top_level(clause)]
+
+def extract_type(block):
+    """
+    Extract the structure of one (masked) top-level type declaration.
+
+    Returns:
+        TypeStructure: The type's structure, or None if the block declares no type
+    """
+    brace = block.find('{')
+    header = block if brace == -1 else block[:brace]
+    header_match = _TYPE_HEADER.search(_ANNOTATION.sub(' ', header))
+    if not header_match:
+        return None
+    kind, name = header_match.groups()
+    if kind == '@interface':
+        kind = 'interface'
+    rest = _ANNOTATION.sub(' ', header)[header_match.end():]
+
+    attributes = {}
+    if kind == 'record' and '(' in rest:
+        components = rest[rest.find('(') + 1:rest.rfind(')')]
+        for component in split_top_level(components):
+            declaration = _declaration(component)
+            if declaration and declaration[2]:
+                attributes[declaration[3]] = declaration[2]
+        rest = rest[rest.rfind(')') + 1:]
+
+    # Drop the type's own type parameters before looking for extends/implements
+    rest = re.sub(r'^\s*<.*?>(?=\s*(?:extends|implements|permits|\(|$))', ' ', rest, flags=re.DOTALL)
+    parent = None
+    interfaces = []
+    extends = _EXTENDS.search(rest)
+    if extends:
+        names = _type_names(extends.group(1))
+        if kind == 'interface':
+            interfaces = names
+        elif names:
+            parent = names[0]
+    implements = _IMPLEMENTS.search(rest)
+    if implements:
+        interfaces.extend(_type_names(implements.group(1)))
+
+    methods = []
+    if brace != -1:
+        is_interface = kind == 'interface'
+        for member_kind, text in iter_members(block[brace + 1:], constants_first=kind == 'enum'):
+            if member_kind == 'method':
+                method = parse_method_header(text, name, is_interface)
+                if method:
+                    methods.append(method)
+            elif not is_interface:
+                # Interface "fields" are constants, not attributes
+                for type_name, field_name in parse_fields(text):
+                    attributes.setdefault(field_name, type_name)
+    return TypeStructure(name, kind, parent, interfaces, attributes, methods)
+
+def iter_members(body, constants_first=False):
+    """
+    Walk the members of a type body (the text after its opening brace).
+
+    Yields:
+        tuple: ('field', statement) or ('method', header) for each member declared
+            directly in the body; nested types and initializer blocks are skipped
+    """
+    depth = 0
+    start = 0
+    header = None  # Text before the '{' that opened the current member body
+    in_constants = constants_first
+    for match in _STRUCTURE.finditer(body):
+        token = match.group(0)
+        if token == '{':
+            if depth == 0:
+                header = body[start:match.start()]
+            depth += 1
+        elif token == '}':
+            depth -= 1
+            if depth < 0:
+                # End of the type body
+                return
+            if depth == 0 and header is not None:
+                text = _ANNOTATION.sub(' ', header).strip()
+                if '=' in text.split('(', 1)[0] or in_constants:
+                    # Field initialized with an array literal or anonymous class; wait for ';'
+                    # (or an enum constant with a body)
+                    header = None
+                    continue
+                header = None
+                start = match.end()
+                if '(' in text and not _TYPE_HEADER.search(text.split('(', 1)[0]):
+                    yield 'method', text
+        elif depth == 0:
+            statement = _ANNOTATION.sub(' ', body[start:match.start()]).strip()
+            start = match.end()
+            if in_constants:
+                in_constants = False
+                continue
+            if not statement:
+                continue
+            if '(' in statement.split('=', 1)[0]:
+                # Abstract/interface/native method
+                yield 'method', statement
+            else:
+                yield 'field', statement
+
+class StructureSession:
+    def __init__(self):
+        self.blocks = {}  # block hash -> TypeStructure (or None)
+        self.updated = time.monotonic()
+
+class JavaStructureExtractor:
+    """
+    Extracts schemas from Java source, reusing the structures of unchanged
+    top-level declarations from the session's previous revision.
+    """
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.extracted = 0
+        self.reused = 0
+
+    def _session(self, session_id):
+        with self._lock:
+            now = time.monotonic()
+            for stale in [s for s, session in self._sessions.items() if now - session.updated > self.ttl]:
+                del self._sessions[stale]
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = StructureSession()
+            session.updated = now
+            return session
+
+    def extract(self, code, session_id=None, endpoint='/api/extract/java'):
+        """
+        Extract the schema and relationships of Java source.
+
+        Args:
+            code (str): The Java source
+            session_id (str): Editor session; its previous revision's blocks are reused
+            endpoint (str): Endpoint label for the stage timings
+        Returns:
+            dict: {"schema", "relationships", "stats": {"blocks", "extracted", "reused"}}
+        """
+        with stage_timer(endpoint, 'split_declarations', language='java'):
+            blocks = split_type_declarations(mask_java(code))
+
+        previous = self._session(session_id).blocks if session_id is not None else {}
+        current = {}
+        structures = []
+        extracted = 0
+        with stage_timer(endpoint, 'extract_types', language='java'):
+            for block in blocks:
+                key = hashlib.sha256(block.encode('utf-8')).hexdigest()
+                if key in current:
+                    structure = current[key]
+                elif key in previous:
+                    structure = current[key] = previous[key]
+                else:
+                    structure = current[key] = extract_type(block)
+                    extracted += 1
+                if structure is not None:
+                    structures.append(structure)
+
+        if session_id is not None:
+            # Only this revision's blocks are kept, so a session never outgrows its file
+            self._session(session_id).blocks = current
+        self.extracted += extracted
+        self.reused += len(blocks) - extracted
+
+        schema = []
+        relationships = []
+        for structure in structures:
+            schema.append([normalize_entity_name(structure.name), structure.entity()])
+            relationships.extend(structure.relationships())
+        return {
+            "schema": schema,
+            "relationships": relationships,
+            "stats": {
+                "blocks": len(blocks),
+                "extracted": extracted,
+                "reused": len(blocks) - extracted
+            }
+        }
+
+    def stats(self):
+        return {
+            "sessions": len(self._sessions),
+            "extracted": self.extracted,
+            "reused": self.reused
+        }
+
+java_structure = JavaStructureExtractor()
+
+def setup_java_structure_routes(app):
+    """
+    Set up the Java structure extraction and grading preview routes.
+
+    Args:
+        app: The Flask application
+    """
+    def request_code():
+        data = request.get_json(silent=True) or {}
+        session_id = data.get('sessionId')
+        return data.get('code'), str(session_id) if session_id is not None else None
+
+    @app.route('/api/extract/java', methods=['POST'])
+    def extract_java_structure():
+        code, session_id = request_code()
+        if not code:
+            count_request('/api/extract/java', 'invalid', language='java')
+            return jsonify({"error": "No code provided"}), 400
+        with stage_timer('/api/extract/java', 'total', language='java'):
+            result = java_structure.extract(code, session_id)
+        count_request('/api/extract/java', 'extracted', language='java')
+        return jsonify(result)
+
+    @app.route('/api/question/<question_id>/preview', methods=['POST'])
+    def preview_grade(question_id):
+        # Grades the server-extracted structure; nothing is stored
+        code, session_id = request_code()
+        if not code:
+            count_request('/api/preview', 'invalid', question=question_id, language='java')
+            return jsonify({"error": "No code provided"}), 400
+        with stage_timer('/api/preview', 'total', question=question_id, language='java'):
+            result = java_structure.extract(code, session_id, endpoint='/api/preview')
+            grade = grade_submission(question_id, code, result["schema"], result["relationships"],
+                                     endpoint='/api/preview')
+        count_request('/api/preview', 'graded', question=question_id, language='java')
+        return jsonify(dict(result, grade=grade_for_response(grade)))
+
+    @app.route('/api/extract/java/stats', methods=['GET'])
+    def java_structure_stats():
+        return jsonify(java_structure.stats())
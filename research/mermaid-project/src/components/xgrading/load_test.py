@@ -0,0 +1,437 @@
+"""
+Load generator for a running xgrading server.
+
+    python load_test.py --duration 60 --concurrency 50 --rate 20 --output run.json
+    python load_test.py --duration 60 --concurrency 50 --compare run.json
+
+Replays stored submissions against /api/submit and simulates students
+typing: each virtual editor session sends growing prefixes of a Java or Python
+source to /api/validate/<language> with its sessionId and an increasing seq, the
+way CodeWorkbench.js does.
+
+With --rate, requests arrive open-loop (Poisson, that many per second) and at
+most --concurrency are in flight; arrivals that find every client busy are
+counted as "dropped". Without --rate, --concurrency clients send back to back.
+
+Replayed submissions are graded and stored like any other, as submissions of
+students "load-test-<client>", so run it against a staging server and database
+(or leave "submit" out of --mix).
+
+The submissions are a sample (--corpus-size) of the submission index, read with
+the server's code and DATABASE_URL. On a machine without the server's
+dependencies, write the sample to a file first and replay that:
+
+    python load_test.py --export-corpus corpus.jsonl
+    python load_test.py --corpus corpus.jsonl --duration 60
+
+Reports throughput, p50/p95/p99 latency and error rates per endpoint and saves
+them as JSON; --compare prints the change against an earlier report.
+Apart from reading the index, uses only the standard library (asyncio streams
+speaking HTTP/1.1).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_MIX = 'submit:1,validate-java:4,validate-python:2'
+# Submissions sampled from the index for replay
+CORPUS_SIZE = 1000
+# Characters typed between two validation requests of a session (one debounce)
+KEYSTROKE_CHUNK = 40
+
+def _replayable(data):
+    if not data.get('questionId') or not data.get('code'):
+        return None
+    data.pop('timestamp', None)
+    return data
+
+def index_corpus(size=CORPUS_SIZE, seed=1):
+    """
+    Read a uniform sample of submission payloads from the submission index.
+
+    Needs the server's dependencies and database (DATABASE_URL).
+
+    Returns:
+        list: Submission payloads (dicts with questionId, code, schema, relationships)
+    """
+    from server import app
+    from submission_store import iter_submissions, load_submission_payload
+
+    rng = random.Random(seed)
+    payloads = []
+    with app.app_context():
+        # Reservoir sample, so every question is represented without loading them all
+        sample = []
+        for seen, submission in enumerate(iter_submissions()):
+            if len(sample) < size:
+                sample.append(submission)
+            else:
+                slot = rng.randrange(seen + 1)
+                if slot < size:
+                    sample[slot] = submission
+        for submission in sample:
+            try:
+                data = _replayable(load_submission_payload(submission))
+            except (OSError, TypeError, KeyError, ValueError):
+                continue
+            if data is not None:
+                payloads.append(data)
+    return payloads
+
+def load_corpus(path):
+    """
+    Read submission payloads from a JSON Lines file written by --export-corpus.
+
+    Returns:
+        list: Submission payloads
+    """
+    payloads = []
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                data = _replayable(json.loads(line))
+            except ValueError:
+                continue
+            if data is not None:
+                payloads.append(data)
+    return payloads
+
+def generate_python_source(classes=6):
+    """A Python module of about `classes` small classes, for the Python validation stream."""
+    lines = []
+    for i in range(classes):
+        lines += [
+            f"class Item{i}:",
+            f"    def __init__(self, name, count={i}):",
+            "        self.name = name",
+            "        self.count = count",
+            "",
+            "    def total(self, price):",
+            "        return self.count * price",
+            "",
+        ]
+    return '\n'.join(lines)
+
+class EditorSession:
+    """
+    One simulated student typing a source file, validated every KEYSTROKE_CHUNK characters.
+    """
+    def __init__(self, session_id, language, source):
+        self.session_id = session_id
+        self.language = language
+        self.source = source
+        self.seq = 0
+        self.typed = 0
+
+    def next_payload(self):
+        self.typed = self.typed + KEYSTROKE_CHUNK if self.typed < len(self.source) else KEYSTROKE_CHUNK
+        self.seq += 1
+        return {
+            "code": self.source[:self.typed],
+            "sessionId": self.session_id,
+            "seq": self.seq
+        }
+
+class HttpClient:
+    """
+    A keep-alive HTTP/1.1 connection; reconnects when the server closes it.
+    """
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def post_json(self, path, payload):
+        """
+        Returns:
+            tuple: (status, body bytes)
+        """
+        return await asyncio.wait_for(self._post_json(path, payload), self.timeout)
+
+    async def _post_json(self, path, payload):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode('utf-8')
+        self.writer.write(
+            f"POST {path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Content-Type: application/json\r\n"
+            "Accept-Encoding: identity\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: keep-alive\r\n\r\n".encode('latin-1') + body
+        )
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection")
+        version, status = status_line.decode('latin-1').split(' ', 2)[:2]
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if 'content-length' in headers:
+            data = await self.reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            data = b''
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                data += chunk[:-2]
+        else:
+            data = await self.reader.read()
+            await self.close()
+
+        if version == 'HTTP/1.0' or headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return int(status), data
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.outcomes = {}
+
+    def record(self, latency, status, outcome):
+        self.latencies.append(latency)
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def summary(self, elapsed):
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        errors = self.outcomes.get('error', 0)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(count - 1, int(p * count))] * 1000, 2)
+
+        return {
+            "requests": count,
+            "throughput_rps": round(count / elapsed, 2) if elapsed else 0,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(latencies[-1] * 1000, 2) if latencies else None,
+            "error_rate": round(errors / count, 4) if count else 0,
+            "outcomes": self.outcomes,
+            "statuses": self.statuses
+        }
+
+def classify(endpoint, status, body):
+    """Map a response onto ok / superseded / rejected / error."""
+    if status in (429, 503):
+        return 'rejected'
+    if status >= 400:
+        return 'error'
+    if endpoint.startswith('validate'):
+        try:
+            if json.loads(body).get('superseded'):
+                return 'superseded'
+        except ValueError:
+            return 'error'
+    return 'ok'
+
+class LoadTest:
+    def __init__(self, args, corpus):
+        url = urlsplit(args.url)
+        self.host = url.hostname or '127.0.0.1'
+        self.port = url.port or 80
+        self.args = args
+        self.corpus = corpus
+        self.mix = parse_mix(args.mix)
+        self.stats = {endpoint: EndpointStats() for endpoint, _ in self.mix}
+        self.dropped = 0
+        self.rng = random.Random(args.seed)
+        self.java_sources = [p['code'] for p in corpus] or ["public class Main {}"]
+        self.python_source = generate_python_source()
+        self.sessions = {}
+
+    def _session(self, client_index, language):
+        key = (client_index, language)
+        if key not in self.sessions:
+            source = self.rng.choice(self.java_sources) if language == 'java' else self.python_source
+            self.sessions[key] = EditorSession(f"load-{os.getpid()}-{client_index}-{language}", language, source)
+        return self.sessions[key]
+
+    def _request(self, client_index):
+        endpoint = self.rng.choices([e for e, _ in self.mix], [w for _, w in self.mix])[0]
+        if endpoint == 'submit':
+            payload = dict(self.rng.choice(self.corpus), studentId=f"load-test-{client_index}")
+            return endpoint, '/api/submit', payload
+        language = endpoint.split('-', 1)[1]
+        return endpoint, f'/api/validate/{language}', self._session(client_index, language).next_payload()
+
+    async def _send(self, client, client_index):
+        endpoint, path, payload = self._request(client_index)
+        start = time.perf_counter()
+        try:
+            status, body = await client.post_json(path, payload)
+            outcome = classify(endpoint, status, body)
+        except (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            await client.close()
+            status, outcome = 0, 'error'
+        self.stats[endpoint].record(time.perf_counter() - start, status, outcome)
+
+    async def _closed_loop(self, client_index, deadline):
+        client = HttpClient(self.host, self.port, self.args.timeout)
+        try:
+            while time.monotonic() < deadline:
+                await self._send(client, client_index)
+        finally:
+            await client.close()
+
+    async def _open_loop(self, deadline):
+        idle = asyncio.Queue()
+        for i in range(self.args.concurrency):
+            idle.put_nowait((i, HttpClient(self.host, self.port, self.args.timeout)))
+        tasks = set()
+
+        async def run(slot):
+            try:
+                await self._send(slot[1], slot[0])
+            finally:
+                idle.put_nowait(slot)
+
+        next_arrival = time.monotonic()
+        while next_arrival < deadline:
+            await asyncio.sleep(max(0, next_arrival - time.monotonic()))
+            next_arrival += self.rng.expovariate(self.args.rate)
+            if idle.empty():
+                self.dropped += 1
+                continue
+            task = asyncio.ensure_future(run(idle.get_nowait()))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+        while not idle.empty():
+            await idle.get_nowait()[1].close()
+
+    async def run(self):
+        start = time.monotonic()
+        deadline = start + self.args.duration
+        if self.args.rate:
+            await self._open_loop(deadline)
+        else:
+            await asyncio.gather(*(self._closed_loop(i, deadline) for i in range(self.args.concurrency)))
+        return time.monotonic() - start
+
+    def report(self, elapsed):
+        endpoints = {endpoint: stats.summary(elapsed) for endpoint, stats in self.stats.items()}
+        total = sum(e["requests"] for e in endpoints.values())
+        errors = sum(e["outcomes"].get('error', 0) for e in endpoints.values())
+        return {
+            "started": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "config": {
+                "url": self.args.url,
+                "duration": self.args.duration,
+                "concurrency": self.args.concurrency,
+                "rate": self.args.rate,
+                "mix": self.args.mix,
+                "corpus": len(self.corpus)
+            },
+            "elapsed": round(elapsed, 2),
+            "total": {
+                "requests": total,
+                "throughput_rps": round(total / elapsed, 2) if elapsed else 0,
+                "error_rate": round(errors / total, 4) if total else 0,
+                "dropped": self.dropped
+            },
+            "endpoints": endpoints
+        }
+
+def parse_mix(mix):
+    weights = []
+    for part in mix.split(','):
+        endpoint, _, weight = part.partition(':')
+        endpoint = endpoint.strip()
+        if endpoint not in ('submit', 'validate-java', 'validate-python'):
+            raise SystemExit(f"Unknown endpoint in --mix: {endpoint}")
+        if float(weight or 1) > 0:
+            weights.append((endpoint, float(weight or 1)))
+    return weights
+
+def print_report(report, baseline=None):
+    print(f"{report['total']['requests']} requests in {report['elapsed']}s: "
+          f"{report['total']['throughput_rps']} req/s, error rate {report['total']['error_rate']:.2%}, "
+          f"{report['total']['dropped']} arrivals dropped")
+    print(f"{'endpoint':<18} {'requests':>9} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>8}")
+    for endpoint, stats in report["endpoints"].items():
+        print(f"{endpoint:<18} {stats['requests']:>9} {stats['throughput_rps']:>8} {stats['p50_ms'] or '-':>9} "
+              f"{stats['p95_ms'] or '-':>9} {stats['p99_ms'] or '-':>9} {stats['error_rate']:>8.2%}")
+        old = (baseline or {}).get("endpoints", {}).get(endpoint)
+        if old:
+            changes = []
+            for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+                if old.get(key) and stats.get(key) is not None:
+                    changes.append(f"{key} {(stats[key] - old[key]) / old[key]:+.1%}")
+            changes.append(f"error_rate {stats['error_rate'] - old.get('error_rate', 0):+.2%}")
+            print(f"{'  vs baseline':<18} " + ', '.join(changes))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='Server to load')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    parser.add_argument('--concurrency', type=int, default=10, help='Maximum requests in flight')
+    parser.add_argument('--rate', type=float, default=0, help='Arrivals per second (0 = back to back)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Endpoint weights, e.g. ' + DEFAULT_MIX)
+    parser.add_argument('--timeout', type=float, default=60, help='Seconds before a request counts as an error')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the request mix')
+    parser.add_argument('--output', help='Write the JSON report here')
+    parser.add_argument('--compare', help='Earlier JSON report to compare against')
+    parser.add_argument('--corpus', help='Replay the submissions in this JSON Lines file instead of the index')
+    parser.add_argument('--corpus-size', type=int, default=CORPUS_SIZE,
+                        help='Submissions sampled from the index')
+    parser.add_argument('--export-corpus', metavar='PATH',
+                        help='Write the sampled submissions to PATH (JSON Lines) and exit')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else index_corpus(args.corpus_size, args.seed)
+    if args.export_corpus:
+        with open(args.export_corpus, 'w') as f:
+            for data in corpus:
+                f.write(json.dumps(data) + '\n')
+        print(f"Wrote {len(corpus)} submissions to {args.export_corpus}")
+        return
+    if not corpus and any(endpoint == 'submit' for endpoint, _ in parse_mix(args.mix)):
+        raise SystemExit(f"No submissions found in {args.corpus or 'the submission index'}")
+    print(f"Replaying {len(corpus)} stored submissions against {args.url}")
+
+    test = LoadTest(args, corpus)
+    report = test.report(asyncio.run(test.run()))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+import re
+
+# Single-pass parser for the yUML-style schema used in <uml-design-elements>:
+#
+#   [Tank|capacity;temperature|
+#   +void clean();
+#   ]
+#   [Cleanable]<|..[Tank]
+#   [Store]o--"1..*"[Tank]
+#   [Tank]*--"0..*"[Fish]
+#
+# Each line is classified once (tokenize) and then folded into entities and
+# relationships by SchemaParser. The line scanners below reproduce what the old
+# lazy `.*?` regexes matched, but only ever move forward through a line, so a
+# diagram is parsed in time linear in its length however its lines are shaped.
+
+# Atomic lexemes only; these never backtrack
+_SPACE = re.compile(r'\s*')
+_SPACE_RUN = re.compile(r'\s+')
+_WORD = re.compile(r'\w*')
+
+RELATIONSHIP_OPERATORS = (
+    # (substring that marks the line, relationship type)
+    ('<|..', 'implementation'),
+    ('o--', 'aggregation'),
+    ('*--', 'composition'),
+)
+
+def _skip_space(line, pos):
+    return _SPACE.match(line, pos).end()
+
+def _bracket_target(line, pos):
+    # Text of "[...]" opening at pos, up to the first ']', without any ":label"
+    return line[pos + 1:line.find(']', pos + 1)].split(':')[0].strip()
+
+def parse_implementation(line):
+    """
+    Parse "[Source]<|..[Target]".
+
+    Returns:
+        dict: {type, source, target}, or None if the line does not match
+    """
+    if not line.startswith('['):
+        return None
+    last_close = line.rfind(']')
+    close = line.find(']', 1)
+    while close != -1:
+        operator = _skip_space(line, close + 1)
+        if line.startswith('<|.', operator) and operator + 3 < len(line) and line[operator + 3] != '\n':
+            target = _skip_space(line, operator + 4)
+            if line.startswith('[', target):
+                # A later ']' can only give a later '[', so this decides the line
+                if target >= last_close:
+                    return None
+                return {
+                    "type": "implementation",
+                    "source": line[1:close],
+                    "target": _bracket_target(line, target)
+                }
+        close = line.find(']', close + 1)
+    return None
+
+def parse_association(line, operator, rel_type):
+    """
+    Parse '[Source]o--"cardinality"[Target]' (or *-- for compositions).
+
+    Returns:
+        dict: {type, source, target, cardinality}, or None if the line does not match
+    """
+    if not line.startswith('['):
+        return None
+    last_close = line.rfind(']')
+    close = line.find(']', 1)
+    while close != -1:
+        pos = _skip_space(line, close + 1)
+        if line.startswith(operator, pos):
+            opening = _skip_space(line, pos + len(operator))
+            if line.startswith('"', opening):
+                # Any later candidate would only see a subset of these closing quotes
+                quote = line.find('"', opening + 1)
+                while quote != -1:
+                    target = _skip_space(line, quote + 1)
+                    if line.startswith('[', target) and target < last_close:
+                        return {
+                            "type": rel_type,
+                            "source": line[1:close],
+                            "target": _bracket_target(line, target),
+                            "cardinality": line[opening + 1:quote]
+                        }
+                    quote = line.find('"', quote + 1)
+                return None
+        close = line.find(']', close + 1)
+    return None
+
+def parse_entity_header(line):
+    """
+    Parse "[Name|attr1;attr2|".
+
+    Returns:
+        tuple: (name, [attributes]), or None if the line does not match
+    """
+    if not line.startswith('['):
+        return None
+    first = line.find('|', 1)
+    second = line.find('|', first + 1) if first != -1 else -1
+    if second == -1:
+        return None
+    attributes = [attr.strip() for attr in line[first + 1:second].split(';') if attr.strip()]
+    return line[1:first], attributes
+
+def parse_method(line):
+    """
+    Parse "+returnType name(param1, param2);".
+
+    Returns:
+        dict: {name, returnType, parameters}, or None if the line does not match
+    """
+    if not line.startswith('+'):
+        return None
+    start = _skip_space(line, 1)
+    last_close = line.rfind(')')
+
+    def signature(name_start):
+        # name, optional whitespace, '(' with a ')' somewhere after it
+        name_end = _WORD.match(line, name_start).end()
+        if name_end == name_start:
+            return None
+        paren = _skip_space(line, name_end)
+        if line.startswith('(', paren) and paren < last_close:
+            return name_end, paren
+        return None
+
+    # The return type runs up to the first whitespace that is followed by a signature
+    return_type = None
+    for space in _SPACE_RUN.finditer(line, start):
+        found = signature(space.end())
+        if found:
+            return_type = line[start:space.start()]
+            name_start = space.end()
+            break
+    else:
+        # "+ name()" - no return type
+        found = signature(start) if start > 1 else None
+        return_type, name_start = '', start
+
+    if not found:
+        return None
+    name_end, paren = found
+    parameters = line[paren + 1:line.find(')', paren + 1)].strip()
+    return {
+        "name": line[name_start:name_end].strip(),
+        "returnType": return_type.strip(),
+        "parameters": [p.strip() for p in parameters.split(',')] if parameters else []
+    }
+
+def tokenize(lines):
+    """
+    Classify schema lines.
+
+    Yields:
+        tuple: (kind, line) with kind one of 'implementation', 'aggregation',
+            'composition', 'entity', 'method' or 'end'; lines that can never
+            affect the result are dropped
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        for marker, rel_type in RELATIONSHIP_OPERATORS:
+            if marker in line:
+                yield rel_type, line
+                break
+        else:
+            if line.startswith('[') and '|' in line:
+                yield 'entity', line
+            elif line.startswith('+'):
+                yield 'method', line
+            elif line.endswith(']'):
+                yield 'end', line
+
+class SchemaParser:
+    """
+    Incremental schema parser.
+
+    Feed it lines as they arrive; every call returns the entities and
+    relationships that the line completed:
+
+        parser = SchemaParser()
+        for line in stream:
+            for kind, item in parser.feed(line):
+                ...
+        for kind, item in parser.close():
+            ...
+
+    Items are ('relationship', {type, source, target[, cardinality]}) and
+    ('entity', {entity, attribute, methods}).
+    """
+    def __init__(self):
+        self.current_entity = None
+        self.attributes = []
+        self.methods = []
+
+    def _entity(self):
+        return {
+            "entity": self.current_entity,
+            "attribute": {attr: {"attribute": attr} for attr in self.attributes},
+            "methods": self.methods
+        }
+
+    def _finish_entity(self):
+        completed = [('entity', self._entity())]
+        self.current_entity = None
+        self.attributes = []
+        self.methods = []
+        return completed
+
+    def feed(self, line):
+        completed = []
+        for kind, token in tokenize((line,)):
+            completed.extend(self._consume(kind, token))
+        return completed
+
+    def _consume(self, kind, line):
+        if kind == 'implementation':
+            relationship = parse_implementation(line)
+            return [('relationship', relationship)] if relationship else []
+        if kind in ('aggregation', 'composition'):
+            operator = 'o--' if kind == 'aggregation' else '*--'
+            relationship = parse_association(line, operator, kind)
+            return [('relationship', relationship)] if relationship else []
+
+        if kind == 'entity':
+            header = parse_entity_header(line)
+            if header is None:
+                # Malformed header: the open entity carries on
+                return []
+            completed = self._finish_entity() if self.current_entity else []
+            self.current_entity, self.attributes = header
+            self.methods = []
+            return completed
+
+        if not self.current_entity:
+            return []
+        if kind == 'method':
+            method = parse_method(line)
+            if method:
+                self.methods.append(method)
+            return []
+        # kind == 'end'
+        return self._finish_entity()
+
+    def close(self):
+        """Finish the entity still open at the end of the input, if any."""
+        return self._finish_entity() if self.current_entity else []
+
+def iter_schema(lines):
+    """
+    Stream the entities and relationships of a schema as they complete.
+
+    Args:
+        lines (iterable): Schema lines (e.g. an open file)
+    Yields:
+        tuple: ('entity', data) or ('relationship', data)
+    """
+    parser = SchemaParser()
+    for kind, line in tokenize(lines):
+        yield from parser._consume(kind, line)
+    yield from parser.close()
+
+def parse_mermaid_schema(mermaid_text):
+    """
+    Parse Mermaid schema text into structured entities and relationships.
+
+    Returns:
+        tuple: (entities keyed by lowercased name, relationships)
+    """
+    entities = {}
+    relationships = []
+    if not mermaid_text:
+        return entities, relationships
+
+    for kind, item in iter_schema(mermaid_text.split('\n')):
+        if kind == 'entity':
+            entities[item["entity"].lower()] = item
+        else:
+            relationships.append(item)
+    return entities, relationships
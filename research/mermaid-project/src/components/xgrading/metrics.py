@@ -0,0 +1,198 @@
+import bisect
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from flask import Response
+
+# In-process metrics for the grading and validation pipelines.
+#
+# Every stage is timed into one histogram family labelled by endpoint, stage,
+# question and language. Alongside the Prometheus buckets each series keeps a
+# window of recent samples so /api/metrics can also report p50/p95/p99.
+# Recording is a perf_counter() pair, a lock and a bisect; sorting only
+# happens when the endpoint is scraped. Question ids come from clients, so only
+# questions in the catalog get their own series; anything else is "unknown".
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+# Recent samples kept per series for the quantiles
+WINDOW_SIZE = 1024
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    "buckets": [0] * (len(self.buckets) + 1),
+                    "sum": 0.0,
+                    "count": 0,
+                    "recent": deque(maxlen=WINDOW_SIZE)
+                }
+            series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+            series["recent"].append(value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def quantiles(self, **labels):
+        """
+        Return {quantile: seconds} over the recent samples of one series.
+        """
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            samples = sorted(series["recent"]) if series else []
+        return {q: self._quantile(samples, q) for q in QUANTILES} if samples else {}
+
+    @staticmethod
+    def _quantile(samples, q):
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        quantile_lines = [
+            f"# HELP {self.name}_quantile Recent ({WINDOW_SIZE} samples) quantiles of {self.name}",
+            f"# TYPE {self.name}_quantile gauge",
+        ]
+        with self._lock:
+            snapshot = [(key, list(s["buckets"]), s["sum"], s["count"], sorted(s["recent"]))
+                        for key, s in sorted(self._series.items())]
+
+        for key, buckets, total, count, samples in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), buckets):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+            for q in QUANTILES:
+                labels = _format_labels(self.labelnames, key, [('quantile', q)])
+                quantile_lines.append(f"{self.name}_quantile{labels} {_format_value(self._quantile(samples, q))}")
+        return lines + quantile_lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+STAGE_LABELS = ('endpoint', 'stage', 'question', 'language')
+
+stage_duration = registry.histogram(
+    'xgrading_stage_duration_seconds',
+    'Time spent in each stage of the grading and validation pipelines.',
+    STAGE_LABELS
+)
+requests_total = registry.counter(
+    'xgrading_requests_total',
+    'Grading and validation requests by outcome.',
+    ('endpoint', 'question', 'language', 'outcome')
+)
+
+def question_label(question_id):
+    """
+    Return the `question` label for a (client-supplied) question id.
+    """
+    if not question_id:
+        return ''
+    # question_catalog imports grading, which imports this module
+    from question_catalog import question_catalog
+    return question_id if isinstance(question_id, str) and question_id in question_catalog else 'unknown'
+
+def stage_timer(endpoint, stage, question='', language=''):
+    """
+    Time a block of code into xgrading_stage_duration_seconds.
+
+    Usage:
+        with stage_timer('/api/submit', 'store_json', question=question_id):
+            ...
+    """
+    return stage_duration.time(endpoint=endpoint, stage=stage, question=question_label(question),
+                               language=language or '')
+
+def count_request(endpoint, outcome, question='', language=''):
+    requests_total.inc(endpoint=endpoint, outcome=outcome, question=question_label(question), language=language or '')
+
+def setup_metrics_routes(app):
+    """
+    Expose the metrics at /api/metrics in the Prometheus text format.
+
+    Args:
+        app: The Flask application
+    """
+    @app.route('/api/metrics', methods=['GET'])
+    def get_metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,40 @@
+"""Submission index.
+
+Revision ID: 3a7c2e91b4d6
+Revises: d5f09c3bdce2
+Create Date: 2025-04-16 14:02:11.418205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a7c2e91b4d6'
+down_revision = 'd5f09c3bdce2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('submission',
+    sa.Column('id', sa.String(length=255), nullable=False),
+    sa.Column('question_id', sa.String(length=120), nullable=False),
+    sa.Column('student_id', sa.String(length=120), nullable=True),
+    sa.Column('timestamp', sa.Integer(), nullable=False),
+    sa.Column('code', sa.Text(), nullable=False),
+    sa.Column('path', sa.String(length=512), nullable=True),
+    sa.Column('score', sa.Float(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('submission', schema=None) as batch_op:
+        batch_op.create_index('ix_submission_question_timestamp', ['question_id', 'timestamp', 'id'], unique=False)
+        batch_op.create_index('ix_submission_student_question_timestamp', ['student_id', 'question_id', 'timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('submission', schema=None) as batch_op:
+        batch_op.drop_index('ix_submission_student_question_timestamp')
+        batch_op.drop_index('ix_submission_question_timestamp')
+
+    op.drop_table('submission')
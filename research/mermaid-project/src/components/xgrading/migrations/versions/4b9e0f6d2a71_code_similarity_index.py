@@ -0,0 +1,45 @@
+"""MinHash signatures and LSH buckets of submitted code.
+
+Revision ID: 4b9e0f6d2a71
+Revises: e8d15b7a9c32
+Create Date: 2025-05-13 09:28:17.640512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b9e0f6d2a71'
+down_revision = 'e8d15b7a9c32'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('code_signature',
+    sa.Column('submission_id', sa.String(length=255), nullable=False),
+    sa.Column('question_id', sa.String(length=120), nullable=False),
+    sa.Column('student_id', sa.String(length=120), nullable=True),
+    sa.Column('signature', sa.LargeBinary(), nullable=False),
+    sa.PrimaryKeyConstraint('submission_id')
+    )
+    op.create_table('lsh_bucket',
+    sa.Column('question_id', sa.String(length=120), nullable=False),
+    sa.Column('band', sa.Integer(), nullable=False),
+    sa.Column('bucket', sa.BigInteger(), nullable=False),
+    sa.Column('submission_id', sa.String(length=255), nullable=False),
+    sa.PrimaryKeyConstraint('question_id', 'band', 'bucket', 'submission_id')
+    )
+    with op.batch_alter_table('code_signature', schema=None) as batch_op:
+        batch_op.create_index('ix_code_signature_question', ['question_id'], unique=False)
+
+    # Existing submissions are indexed by `flask similarity-index` (or on first query)
+
+
+def downgrade():
+    with op.batch_alter_table('code_signature', schema=None) as batch_op:
+        batch_op.drop_index('ix_code_signature_question')
+
+    op.drop_table('lsh_bucket')
+    op.drop_table('code_signature')
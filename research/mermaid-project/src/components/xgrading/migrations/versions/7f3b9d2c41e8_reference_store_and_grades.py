@@ -0,0 +1,136 @@
+"""Reference solution versions and grades.
+
+Revision ID: 7f3b9d2c41e8
+Revises: 3a7c2e91b4d6
+Create Date: 2025-05-02 11:37:45.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f3b9d2c41e8'
+down_revision = '3a7c2e91b4d6'
+branch_labels = None
+depends_on = None
+
+
+def _create_initial_tables():
+    op.create_table('entity',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('attribute',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.Column('key', sa.String(length=10), nullable=True),
+    sa.ForeignKeyConstraint(['entity_id'], ['entity.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('relationship',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('parent_entity_id', sa.Integer(), nullable=False),
+    sa.Column('child_entity_id', sa.Integer(), nullable=False),
+    sa.Column('parent_cardinality', sa.String(length=10), nullable=True),
+    sa.Column('child_cardinality', sa.String(length=10), nullable=True),
+    sa.ForeignKeyConstraint(['child_entity_id'], ['entity.id'], ),
+    sa.ForeignKeyConstraint(['parent_entity_id'], ['entity.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def upgrade():
+    # The initial entity/attribute/relationship tables were never written to, and
+    # entity.name was globally unique; recreate them keyed by question and version
+    op.drop_table('relationship')
+    op.drop_table('attribute')
+    op.drop_table('entity')
+
+    op.create_table('reference_solution',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('question_id', sa.String(length=120), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('reference_schema', sa.Text(), nullable=True),
+    sa.Column('marking_criteria', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('question_id', 'content_hash', name='uq_reference_solution_question_hash'),
+    sa.UniqueConstraint('question_id', 'version', name='uq_reference_solution_question_version')
+    )
+    op.create_table('entity',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('question_id', sa.String(length=120), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.Column('methods', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('attribute',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.Column('key', sa.String(length=10), nullable=True),
+    sa.ForeignKeyConstraint(['entity_id'], ['entity.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('relationship',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('question_id', sa.String(length=120), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('type', sa.String(length=20), nullable=False),
+    sa.Column('source', sa.String(length=80), nullable=False),
+    sa.Column('target', sa.String(length=80), nullable=False),
+    sa.Column('parent_entity_id', sa.Integer(), nullable=True),
+    sa.Column('child_entity_id', sa.Integer(), nullable=True),
+    sa.Column('parent_cardinality', sa.String(length=10), nullable=True),
+    sa.Column('child_cardinality', sa.String(length=10), nullable=True),
+    sa.ForeignKeyConstraint(['child_entity_id'], ['entity.id'], ),
+    sa.ForeignKeyConstraint(['parent_entity_id'], ['entity.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('grade',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('submission_id', sa.String(length=255), nullable=False),
+    sa.Column('question_id', sa.String(length=120), nullable=False),
+    sa.Column('reference_version', sa.Integer(), nullable=True),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('entity_score', sa.Float(), nullable=True),
+    sa.Column('relationship_score', sa.Float(), nullable=True),
+    sa.Column('method_score', sa.Float(), nullable=True),
+    sa.Column('feedback', sa.Text(), nullable=True),
+    sa.Column('details', sa.Text(), nullable=True),
+    sa.Column('source', sa.String(length=20), nullable=False),
+    sa.Column('graded_at', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['submission_id'], ['submission.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('entity', schema=None) as batch_op:
+        batch_op.create_index('ix_entity_question_version', ['question_id', 'version', 'position'], unique=False)
+    with op.batch_alter_table('attribute', schema=None) as batch_op:
+        batch_op.create_index('ix_attribute_entity', ['entity_id', 'position'], unique=False)
+    with op.batch_alter_table('relationship', schema=None) as batch_op:
+        batch_op.create_index('ix_relationship_question_version', ['question_id', 'version', 'position'], unique=False)
+    with op.batch_alter_table('grade', schema=None) as batch_op:
+        batch_op.create_index('ix_grade_question_version_graded', ['question_id', 'reference_version', 'graded_at'], unique=False)
+        batch_op.create_index('ix_grade_submission_graded', ['submission_id', 'graded_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('grade', schema=None) as batch_op:
+        batch_op.drop_index('ix_grade_submission_graded')
+        batch_op.drop_index('ix_grade_question_version_graded')
+
+    op.drop_table('grade')
+    op.drop_table('relationship')
+    op.drop_table('attribute')
+    op.drop_table('entity')
+    op.drop_table('reference_solution')
+    _create_initial_tables()
@@ -0,0 +1,46 @@
+"""Submission insertion order.
+
+Revision ID: 9c41d7e2b5a8
+Revises: 4b9e0f6d2a71
+Create Date: 2025-06-02 09:17:38.502113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c41d7e2b5a8'
+down_revision = '4b9e0f6d2a71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('submission', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('seq', sa.Integer(), nullable=True))
+
+    # Existing submissions are numbered in their current (timestamp, id) order
+    bind = op.get_bind()
+    ids = [row.id for row in bind.execute(sa.text('SELECT id FROM submission ORDER BY timestamp, id'))]
+    if ids:
+        bind.execute(sa.text('UPDATE submission SET seq = :seq WHERE id = :id'),
+                     [{"seq": seq, "id": submission_id} for seq, submission_id in enumerate(ids, 1)])
+
+    with op.batch_alter_table('submission', schema=None) as batch_op:
+        batch_op.alter_column('seq', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_unique_constraint('uq_submission_seq', ['seq'])
+        batch_op.drop_index('ix_submission_student_question_timestamp')
+        batch_op.drop_index('ix_submission_question_timestamp')
+        batch_op.create_index('ix_submission_question_timestamp', ['question_id', 'timestamp', 'seq'], unique=False)
+        batch_op.create_index('ix_submission_student_question_timestamp', ['student_id', 'question_id', 'timestamp', 'seq'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('submission', schema=None) as batch_op:
+        batch_op.drop_index('ix_submission_student_question_timestamp')
+        batch_op.drop_index('ix_submission_question_timestamp')
+        batch_op.create_index('ix_submission_question_timestamp', ['question_id', 'timestamp', 'id'], unique=False)
+        batch_op.create_index('ix_submission_student_question_timestamp', ['student_id', 'question_id', 'timestamp', 'id'], unique=False)
+        batch_op.drop_constraint('uq_submission_seq', type_='unique')
+        batch_op.drop_column('seq')
@@ -0,0 +1,38 @@
+"""Merge missing-relationship counters that differ only in case.
+
+Revision ID: b7e2f4a19c63
+Revises: 9c41d7e2b5a8
+Create Date: 2025-06-04 16:41:09.873215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2f4a19c63'
+down_revision = '9c41d7e2b5a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Missing relationships are now counted under their lowercased name
+    bind = op.get_bind()
+    counts = {}
+    for row in bind.execute(sa.text(
+            "SELECT question_id, item, count FROM analytics_missing_item WHERE kind = 'relationship'")):
+        key = (row.question_id, row.item.lower())
+        counts[key] = counts.get(key, 0) + row.count
+    bind.execute(sa.text("DELETE FROM analytics_missing_item WHERE kind = 'relationship'"))
+    if counts:
+        bind.execute(sa.text(
+            "INSERT INTO analytics_missing_item (question_id, kind, item, count)"
+            " VALUES (:question_id, 'relationship', :item, :count)"
+        ), [{"question_id": question_id, "item": item, "count": count}
+            for (question_id, item), count in counts.items()])
+
+
+def downgrade():
+    # The original case is not kept; `flask analytics-rebuild` recomputes the counters
+    pass
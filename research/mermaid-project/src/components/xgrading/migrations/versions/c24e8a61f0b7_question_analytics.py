@@ -0,0 +1,76 @@
+"""Per-question analytics aggregates.
+
+Revision ID: c24e8a61f0b7
+Revises: 7f3b9d2c41e8
+Create Date: 2025-05-06 16:12:03.418275
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c24e8a61f0b7'
+down_revision = '7f3b9d2c41e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('question_analytics',
+    sa.Column('question_id', sa.String(length=120), nullable=False),
+    sa.Column('submissions', sa.Integer(), nullable=False),
+    sa.Column('student_submissions', sa.Integer(), nullable=False),
+    sa.Column('students', sa.Integer(), nullable=False),
+    sa.Column('graded', sa.Integer(), nullable=False),
+    sa.Column('score_sum', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('question_id')
+    )
+    op.create_table('analytics_score_bucket',
+    sa.Column('question_id', sa.String(length=120), nullable=False),
+    sa.Column('bucket', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('question_id', 'bucket')
+    )
+    op.create_table('analytics_missing_item',
+    sa.Column('question_id', sa.String(length=120), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('item', sa.String(length=255), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('question_id', 'kind', 'item')
+    )
+    op.create_table('analytics_student_attempts',
+    sa.Column('question_id', sa.String(length=120), nullable=False),
+    sa.Column('student_id', sa.String(length=120), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('question_id', 'student_id')
+    )
+    op.create_table('analytics_attempt_bucket',
+    sa.Column('question_id', sa.String(length=120), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('students', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('question_id', 'attempts')
+    )
+    op.create_table('analytics_submission',
+    sa.Column('submission_id', sa.String(length=255), nullable=False),
+    sa.Column('question_id', sa.String(length=120), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('missing', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('submission_id')
+    )
+    with op.batch_alter_table('analytics_missing_item', schema=None) as batch_op:
+        batch_op.create_index('ix_analytics_missing_item_count', ['question_id', 'kind', 'count'], unique=False)
+
+    # Existing submissions are counted by `flask analytics-rebuild`
+
+
+def downgrade():
+    with op.batch_alter_table('analytics_missing_item', schema=None) as batch_op:
+        batch_op.drop_index('ix_analytics_missing_item_count')
+
+    op.drop_table('analytics_submission')
+    op.drop_table('analytics_attempt_bucket')
+    op.drop_table('analytics_student_attempts')
+    op.drop_table('analytics_missing_item')
+    op.drop_table('analytics_score_bucket')
+    op.drop_table('question_analytics')
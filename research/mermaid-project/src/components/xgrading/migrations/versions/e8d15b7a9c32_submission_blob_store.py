@@ -0,0 +1,66 @@
+"""Content-addressed submission blobs.
+
+Revision ID: e8d15b7a9c32
+Revises: c24e8a61f0b7
+Create Date: 2025-05-09 10:04:51.276630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8d15b7a9c32'
+down_revision = 'c24e8a61f0b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('blob',
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.Column('base_hash', sa.String(length=64), nullable=True),
+    sa.Column('depth', sa.Integer(), nullable=False),
+    sa.Column('codec', sa.String(length=10), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['base_hash'], ['blob.hash'], ),
+    sa.PrimaryKeyConstraint('hash')
+    )
+    with op.batch_alter_table('submission', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('code_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('payload_hash', sa.String(length=64), nullable=True))
+        batch_op.alter_column('code', existing_type=sa.Text(), nullable=True)
+
+    # Imported submissions keep their files until `flask pack-submissions`
+
+
+def downgrade():
+    # Blob-stored submissions get their code back inline; their payloads are lost
+    # unless they were packed from files that still exist
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        'SELECT id, code_hash FROM submission WHERE code IS NULL AND code_hash IS NOT NULL'
+    )).fetchall()
+    if rows:
+        import zlib
+        blobs = {row.hash: row for row in bind.execute(sa.text('SELECT hash, base_hash, codec, data FROM blob'))}
+
+        def content(blob_hash):
+            blob = blobs[blob_hash]
+            if blob.codec != 'zlib':
+                raise RuntimeError("Downgrading zstd blobs needs blob_store.py")
+            base = content(blob.base_hash) if blob.base_hash else None
+            decompressor = zlib.decompressobj(zdict=base) if base else zlib.decompressobj()
+            return decompressor.decompress(blob.data) + decompressor.flush()
+
+        for row in rows:
+            bind.execute(sa.text('UPDATE submission SET code = :code WHERE id = :id'),
+                         {"code": content(row.code_hash).decode('utf-8'), "id": row.id})
+
+    with op.batch_alter_table('submission', schema=None) as batch_op:
+        batch_op.alter_column('code', existing_type=sa.Text(), nullable=False)
+        batch_op.drop_column('payload_hash')
+        batch_op.drop_column('code_hash')
+
+    op.drop_table('blob')
@@ -0,0 +1,326 @@
+import json
+import sqlite3
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+
+db = SQLAlchemy()
+
+# Milliseconds a connection waits for another writer before raising "database is locked"
+SQLITE_BUSY_TIMEOUT = 5000
+
+@event.listens_for(Engine, 'connect')
+def _configure_sqlite(dbapi_connection, connection_record):
+    # WAL lets readers run while one writer commits (every server process shares the file);
+    # NORMAL sync is durable across application crashes and only fsyncs at checkpoints
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}')
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+def engine_options(database_uri, pool_size):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for a worker process that runs pool_size threads against the database.
+
+    In-memory SQLite keeps SQLAlchemy's single-connection pool.
+    """
+    if database_uri.startswith('sqlite') and (database_uri in ('sqlite://', 'sqlite:///:memory:')
+                                              or 'mode=memory' in database_uri):
+        return {}
+    return {
+        'pool_size': pool_size,
+        # Short bursts beyond the pool (e.g. CLI commands in the same process) get temporary connections
+        'max_overflow': pool_size,
+        'pool_timeout': 10,
+        'pool_recycle': 3600,
+    }
+
+def upsert(model):
+    """
+    An INSERT for model that supports .on_conflict_do_update()/.on_conflict_do_nothing()
+    on the database in use (SQLite or PostgreSQL).
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+class Submission(db.Model):
+    """
+    Index row for one stored submission.
+    """
+    __tablename__ = 'submission'
+
+    id = db.Column(db.String(255), primary_key=True)
+    question_id = db.Column(db.String(120), nullable=False)
+    student_id = db.Column(db.String(120), nullable=True)
+    timestamp = db.Column(db.Integer, nullable=False)
+    # Insertion order, which breaks ties between submissions of the same second
+    # (see submission_store.next_submission_seq())
+    seq = db.Column(db.Integer, nullable=False)
+    # Inline code and a JSON file in Submissions/ (imported submissions), or the
+    # hashes of the code and payload blobs (see blob_store.py)
+    code = db.Column(db.Text, nullable=True)
+    path = db.Column(db.String(512), nullable=True)
+    code_hash = db.Column(db.String(64), nullable=True)
+    payload_hash = db.Column(db.String(64), nullable=True)
+    score = db.Column(db.Float, nullable=True)
+
+    __table_args__ = (
+        # Latest code / history per question and per student, newest first
+        db.UniqueConstraint('seq', name='uq_submission_seq'),
+        db.Index('ix_submission_question_timestamp', 'question_id', 'timestamp', 'seq'),
+        db.Index('ix_submission_student_question_timestamp', 'student_id', 'question_id', 'timestamp', 'seq'),
+    )
+
+    def to_dict(self, include_code=True):
+        data = {
+            "submissionId": self.id,
+            "questionId": self.question_id,
+            "studentId": self.student_id,
+            "timestamp": self.timestamp,
+            "score": self.score
+        }
+        if include_code:
+            from blob_store import submission_code
+            data["code"] = submission_code(self)
+        return data
+
+class ReferenceVersion(db.Model):
+    """
+    One version of a question's reference solution: a new version is recorded
+    whenever the question.html it came from changes.
+    """
+    __tablename__ = 'reference_solution'
+
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.String(120), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    # sha256 of question.html
+    content_hash = db.Column(db.String(64), nullable=False)
+    reference_schema = db.Column(db.Text, nullable=True)
+    marking_criteria = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('question_id', 'version', name='uq_reference_solution_question_version'),
+        db.UniqueConstraint('question_id', 'content_hash', name='uq_reference_solution_question_hash'),
+    )
+
+class Entity(db.Model):
+    """
+    A class of a reference solution, in declaration order.
+    """
+    __tablename__ = 'entity'
+
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.String(120), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(80), nullable=False)
+    # JSON list of {name, returnType, parameters}
+    methods = db.Column(db.Text, nullable=False, default='[]')
+
+    __table_args__ = (
+        db.Index('ix_entity_question_version', 'question_id', 'version', 'position'),
+    )
+
+class Attribute(db.Model):
+    __tablename__ = 'attribute'
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity_id = db.Column(db.Integer, db.ForeignKey('entity.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(80), nullable=False)
+    key = db.Column(db.String(10), nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_attribute_entity', 'entity_id', 'position'),
+    )
+
+class Relationship(db.Model):
+    """
+    A relationship of a reference solution. The entity ids are set when the
+    endpoint is one of the solution's entities (interfaces often aren't).
+    """
+    __tablename__ = 'relationship'
+
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.String(120), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    type = db.Column(db.String(20), nullable=False)
+    source = db.Column(db.String(80), nullable=False)
+    target = db.Column(db.String(80), nullable=False)
+    parent_entity_id = db.Column(db.Integer, db.ForeignKey('entity.id'), nullable=True)
+    child_entity_id = db.Column(db.Integer, db.ForeignKey('entity.id'), nullable=True)
+    parent_cardinality = db.Column(db.String(10), nullable=True)
+    child_cardinality = db.Column(db.String(10), nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_relationship_question_version', 'question_id', 'version', 'position'),
+    )
+
+class Grade(db.Model):
+    """
+    One grading of a submission (a submission is graded again by every regrade).
+    """
+    __tablename__ = 'grade'
+
+    id = db.Column(db.Integer, primary_key=True)
+    submission_id = db.Column(db.String(255), db.ForeignKey('submission.id'), nullable=False)
+    question_id = db.Column(db.String(120), nullable=False)
+    # Version of the reference solution it was graded against
+    reference_version = db.Column(db.Integer, nullable=True)
+    score = db.Column(db.Float, nullable=False)
+    entity_score = db.Column(db.Float, nullable=True)
+    relationship_score = db.Column(db.Float, nullable=True)
+    method_score = db.Column(db.Float, nullable=True)
+    feedback = db.Column(db.Text, nullable=True)
+    # JSON of the grade's "details"
+    details = db.Column(db.Text, nullable=True)
+    # 'submit', 'queue' or 'regrade'
+    source = db.Column(db.String(20), nullable=False)
+    graded_at = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        # Per-question (and per-version) grade queries, newest first
+        db.Index('ix_grade_question_version_graded', 'question_id', 'reference_version', 'graded_at'),
+        db.Index('ix_grade_submission_graded', 'submission_id', 'graded_at'),
+    )
+
+    def to_dict(self, include_details=False):
+        data = {
+            "submissionId": self.submission_id,
+            "questionId": self.question_id,
+            "referenceVersion": self.reference_version,
+            "score": self.score,
+            "entityScore": self.entity_score,
+            "relationshipScore": self.relationship_score,
+            "methodScore": self.method_score,
+            "source": self.source,
+            "gradedAt": self.graded_at
+        }
+        if include_details:
+            data["feedback"] = self.feedback
+            data["details"] = json.loads(self.details) if self.details else None
+        return data
+
+class QuestionAnalytics(db.Model):
+    """
+    Running totals of a question's submissions (see analytics.py).
+    """
+    __tablename__ = 'question_analytics'
+
+    question_id = db.Column(db.String(120), primary_key=True)
+    submissions = db.Column(db.Integer, nullable=False, default=0)
+    # Submissions with a student id, and the distinct students among them
+    student_submissions = db.Column(db.Integer, nullable=False, default=0)
+    students = db.Column(db.Integer, nullable=False, default=0)
+    # Submissions with a score, and the sum of their current scores
+    graded = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)
+
+class ScoreBucket(db.Model):
+    """
+    Number of a question's submissions whose current score falls in one histogram bucket.
+    """
+    __tablename__ = 'analytics_score_bucket'
+
+    question_id = db.Column(db.String(120), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class MissingItem(db.Model):
+    """
+    Number of a question's submissions whose current grade reports this item as missing.
+    """
+    __tablename__ = 'analytics_missing_item'
+
+    question_id = db.Column(db.String(120), primary_key=True)
+    # 'entity', 'attribute', 'relationship' or 'method'
+    kind = db.Column(db.String(20), primary_key=True)
+    item = db.Column(db.String(255), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Most commonly missing items of a kind
+        db.Index('ix_analytics_missing_item_count', 'question_id', 'kind', 'count'),
+    )
+
+class StudentAttempts(db.Model):
+    __tablename__ = 'analytics_student_attempts'
+
+    question_id = db.Column(db.String(120), primary_key=True)
+    student_id = db.Column(db.String(120), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+
+class AttemptBucket(db.Model):
+    """
+    Number of students with this many attempts at a question (the last bucket is "or more").
+    """
+    __tablename__ = 'analytics_attempt_bucket'
+
+    question_id = db.Column(db.String(120), primary_key=True)
+    attempts = db.Column(db.Integer, primary_key=True)
+    students = db.Column(db.Integer, nullable=False, default=0)
+
+class GradedSubmission(db.Model):
+    """
+    What a submission's current grade contributes to the analytics, so a regrade
+    can take it back out.
+    """
+    __tablename__ = 'analytics_submission'
+
+    submission_id = db.Column(db.String(255), primary_key=True)
+    question_id = db.Column(db.String(120), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    # JSON list of [kind, item] pairs
+    missing = db.Column(db.Text, nullable=False, default='[]')
+
+class Blob(db.Model):
+    """
+    Compressed content addressed by its sha256; either whole or a delta against
+    the base blob (see blob_store.py).
+    """
+    __tablename__ = 'blob'
+
+    hash = db.Column(db.String(64), primary_key=True)
+    base_hash = db.Column(db.String(64), db.ForeignKey('blob.hash'), nullable=True)
+    # Deltas between this blob and a whole one
+    depth = db.Column(db.Integer, nullable=False, default=0)
+    # 'zlib' or 'zstd'
+    codec = db.Column(db.String(10), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+class CodeSignature(db.Model):
+    """
+    MinHash signature of a submission's normalized code (see similarity.py).
+    """
+    __tablename__ = 'code_signature'
+
+    submission_id = db.Column(db.String(255), primary_key=True)
+    question_id = db.Column(db.String(120), nullable=False)
+    student_id = db.Column(db.String(120), nullable=True)
+    # Little-endian uint32 per permutation
+    signature = db.Column(db.LargeBinary, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_code_signature_question', 'question_id'),
+    )
+
+class LSHBucket(db.Model):
+    """
+    One band of a signature: submissions sharing a (question, band, bucket) are similarity candidates.
+    """
+    __tablename__ = 'lsh_bucket'
+
+    question_id = db.Column(db.String(120), primary_key=True)
+    band = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.BigInteger, primary_key=True)
+    submission_id = db.Column(db.String(255), primary_key=True)
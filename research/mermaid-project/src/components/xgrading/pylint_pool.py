@@ -0,0 +1,225 @@
+import contextlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+
+from sandbox import SANDBOX_ADDRESS_SPACE_MB, SANDBOX_FILE_SIZE_MB, SANDBOX_TIMEOUT, SandboxTimeout, sandbox
+from sandbox_exec import apply_limits
+
+# Pre-initialized pylint workers used by /api/validate/python.
+#
+# Every worker imports pylint/astroid once and then lints code straight from
+# memory (pylint's --from-stdin mode), so requests skip both the interpreter
+# start-up and the temporary file. Workers are recycled after PYLINT_MAX_JOBS
+# jobs so astroid's module caches can't grow without bound.
+
+PYLINT_POOL_SIZE = int(os.environ.get('XGRADING_PYLINT_POOL_SIZE', '2'))
+PYLINT_MAX_JOBS = int(os.environ.get('XGRADING_PYLINT_MAX_JOBS', '200'))
+# Seconds a pooled lint may run; the worker abandons it at this point
+PYLINT_TIMEOUT = float(os.environ.get('XGRADING_PYLINT_TIMEOUT', str(SANDBOX_TIMEOUT)))
+# Extra seconds to wait for a worker to report its timeout before giving up on it
+TIMEOUT_GRACE = 2
+# How often a waiting request checks whether it was superseded
+POLL_INTERVAL = 0.05
+
+# Name pylint reports for the linted code
+MODULE_NAME = 'submission.py'
+
+# Forked workers would inherit every pipe the request threads have open at that
+# moment, including a concurrent javac Popen's exec-status pipe, which then hangs
+# that Popen until the worker exits. Start workers from a clean forkserver instead.
+WORKER_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+class LinterUnavailable(Exception):
+    """The pylint pool could not handle a request; callers should fall back to a pylint process."""
+
+def _init_worker():
+    # Workers are long-lived, so they get the sandbox's memory limit but no CPU limit
+    apply_limits(SANDBOX_ADDRESS_SPACE_MB, file_size_mb=SANDBOX_FILE_SIZE_MB)
+    # Pay for the pylint/astroid imports and plugin loading before the first job
+    import pylint.lint  # noqa: F401
+    from pylint.reporters import JSONReporter  # noqa: F401
+
+class _LintExpired(BaseException):
+    # Not an Exception, so pylint's own error handling can't swallow it
+    pass
+
+def _expire(signum, frame):
+    raise _LintExpired()
+
+def _lint(code, timeout=PYLINT_TIMEOUT):
+    """
+    Lint code in a worker process.
+
+    Returns:
+        list: pylint's JSON messages (the same dicts `pylint --output-format=json` prints)
+    Raises:
+        SandboxTimeout: If linting took longer than timeout seconds
+    """
+    from pylint.lint import Run
+    from pylint.reporters import JSONReporter
+
+    output = io.StringIO()
+    stdin = sys.stdin
+    # --from-stdin re-wraps sys.stdin's buffer, so give it a real TextIOWrapper
+    sys.stdin = io.TextIOWrapper(io.BytesIO(code.encode('utf-8')), encoding='utf-8')
+    # Jobs run on the worker's main thread, so a timer signal can interrupt a runaway lint
+    # (not on Windows, where the request's own deadline is the only limit)
+    alarm = hasattr(signal, 'setitimer')
+    if alarm:
+        previous = signal.signal(signal.SIGALRM, _expire)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        Run(['--from-stdin', MODULE_NAME], reporter=JSONReporter(output), exit=False)
+    except _LintExpired:
+        raise SandboxTimeout(f"pylint did not finish within {timeout:g}s")
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+        sys.stdin = stdin
+    return json.loads(output.getvalue() or '[]')
+
+class PylintPool:
+    """
+    A multiprocessing pool of pylint workers shared by all request threads.
+    """
+    def __init__(self, size=PYLINT_POOL_SIZE, max_jobs=PYLINT_MAX_JOBS):
+        self.size = size
+        self.max_jobs = max_jobs
+        self._pool = None
+        # One lint per worker at a time, so a reserved lint never queues inside the pool
+        self._free = threading.BoundedSemaphore(max(1, size))
+
+    def start(self):
+        if importlib.util.find_spec('pylint') is None:
+            raise LinterUnavailable("pylint is not installed")
+        self._pool = multiprocessing.get_context(WORKER_START_METHOD).Pool(
+            processes=self.size,
+            initializer=_init_worker,
+            maxtasksperchild=self.max_jobs,
+        )
+        print(f"Started {self.size} pylint workers (recycled every {self.max_jobs} jobs)")
+
+    @property
+    def available(self):
+        return self._pool is not None
+
+    @contextlib.contextmanager
+    def reserve(self, timeout=PYLINT_TIMEOUT, ticket=None):
+        """
+        Hold one worker's share of the pool for the duration of the block.
+
+        Raises:
+            LinterUnavailable: If no worker became free within the timeout
+            ValidationSuperseded: If the ticket was superseded while waiting
+        """
+        deadline = time.monotonic() + timeout
+        while not self._free.acquire(timeout=POLL_INTERVAL if ticket is not None else timeout):
+            if time.monotonic() >= deadline:
+                raise LinterUnavailable("All pylint workers are busy")
+            if ticket is not None:
+                ticket.check()
+        try:
+            yield
+        finally:
+            self._free.release()
+
+    def lint(self, code, timeout=PYLINT_TIMEOUT, ticket=None, hold=None):
+        """
+        Lint code on a worker.
+
+        If the ticket is superseded (or the worker doesn't answer in time) the
+        request stops waiting, but the job keeps its worker busy until it ends.
+        Whatever the caller holds for the job in `hold` (its reservation and
+        sandbox slot) is then released only when the job ends, so reservations
+        and slots keep counting the work that is really running.
+
+        Args:
+            code (str): The code to lint
+            timeout (float): Seconds the worker may spend on it
+            ticket (ValidationTicket): Stops the wait when a newer revision arrives
+            hold (contextlib.ExitStack): Released when the job ends, if that is after this returns
+        Returns:
+            list: pylint's JSON messages
+        Raises:
+            LinterUnavailable: If the pool is not running or the job failed
+            SandboxTimeout: If the lint ran past the timeout
+            ValidationSuperseded: If the ticket was superseded while waiting
+        """
+        if not self.available:
+            raise LinterUnavailable("No pylint workers running")
+        if ticket is not None:
+            ticket.check()
+
+        lock = threading.Lock()
+        ended = False
+        handed_off = None
+
+        def job_ended(_):
+            # Runs on the pool's result thread
+            nonlocal ended
+            with lock:
+                ended = True
+                stack = handed_off
+            if stack is not None:
+                stack.close()
+
+        result = self._pool.apply_async(_lint, (code, timeout), callback=job_ended, error_callback=job_ended)
+        deadline = time.monotonic() + timeout + TIMEOUT_GRACE
+        try:
+            while True:
+                try:
+                    return result.get(timeout=POLL_INTERVAL if ticket is not None else timeout + TIMEOUT_GRACE)
+                except multiprocessing.TimeoutError:
+                    if time.monotonic() >= deadline:
+                        raise LinterUnavailable(f"pylint worker did not answer within {timeout}s")
+                except SandboxTimeout:
+                    sandbox.record_timeout()
+                    raise
+                except Exception as e:
+                    raise LinterUnavailable(f"pylint worker failed: {e}")
+                if ticket is not None:
+                    ticket.check()
+        finally:
+            if hold is not None:
+                with lock:
+                    if not ended:
+                        handed_off = hold.pop_all()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+_pool = None
+# Process that started _pool; a forked worker starts its own
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pylint_pool():
+    """
+    Return the process-wide pylint pool, starting it on first use.
+
+    Returns None when the pool is disabled (XGRADING_PYLINT_POOL_SIZE=0) or pylint is missing.
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                pool = PylintPool()
+                if pool.size > 0:
+                    try:
+                        pool.start()
+                    except (LinterUnavailable, OSError) as e:
+                        print(f"pylint pool disabled, using a pylint process per request: {e}")
+                _pool = pool
+                _pool_pid = os.getpid()
+    return _pool if _pool.available else None
@@ -0,0 +1,249 @@
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import re
+import select
+import threading
+import time
+
+from flask import Response, jsonify
+
+from grading import QUESTIONS_DIR, reference_cache
+from http_cache import cached_response
+
+# In-memory catalog of the questions under Questions/.
+#
+# Every question.html is read once at startup into a Question: its raw bytes,
+# the <method> list and the parsed reference solution. The question routes are
+# then plain dictionary lookups. A background thread watches Questions/ (with
+# inotify on Linux, by polling mtimes elsewhere) and rebuilds the catalog when a
+# question is added, removed or edited. Unchanged questions are carried over,
+# and the new catalog replaces the old one in a single assignment, so a request
+# always sees either the old or the new catalog, never a mix.
+
+# Seconds between mtime checks; with inotify this is only a safety net
+POLL_INTERVAL = float(os.environ.get('XGRADING_QUESTION_POLL_INTERVAL', '2'))
+# Wait this long after a change event for the rest of an editor's writes
+SETTLE_DELAY = 0.2
+
+METHOD_PATTERN = re.compile(r'<method>\s*(.*?)\s*<\/method>')
+
+# inotify(7) event masks
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+
+class Question:
+    """
+    One question.html, read and parsed.
+    """
+    def __init__(self, title, path, html, mtime_ns, size):
+        self.title = title
+        self.path = path
+        self.html = html
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.content_hash = hashlib.sha256(html).hexdigest()
+
+        text = html.decode('utf-8')
+        self.methods = METHOD_PATTERN.findall(text)
+        self.reference = reference_cache.put(title, text, path, mtime_ns, size)
+
+class Inotify:
+    """
+    Minimal inotify binding (Linux only); raises OSError where it is not available.
+    """
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        try:
+            self._add_watch = libc.inotify_add_watch
+            init = libc.inotify_init1
+        except AttributeError:
+            raise OSError("inotify is not available")
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = init(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def watch(self, path):
+        if self._add_watch(self.fd, os.fsencode(path), WATCH_MASK) < 0:
+            raise OSError(ctypes.get_errno(), f"Cannot watch {path}")
+
+    def wait(self, timeout):
+        """
+        Wait up to timeout seconds for events.
+
+        Returns:
+            bool: Whether anything changed
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        # Let a burst of writes finish, then drop all of it
+        time.sleep(SETTLE_DELAY)
+        while select.select([self.fd], [], [], 0)[0]:
+            os.read(self.fd, 65536)
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+class QuestionCatalog:
+    """
+    Questions keyed by title, rebuilt in the background when Questions/ changes.
+    """
+    def __init__(self, questions_dir=QUESTIONS_DIR, poll_interval=POLL_INTERVAL):
+        self.questions_dir = questions_dir
+        self.poll_interval = poll_interval
+        # (questions by title, titles, ETag of the title list), replaced as a whole
+        self._catalog = ({}, [], None)
+        self._lock = threading.Lock()
+        self._pid = None
+        self.mode = None
+        self.reloads = 0
+        self.loaded_at = None
+
+    def reload(self):
+        """
+        Rescan Questions/ and swap in the new catalog if anything changed.
+
+        Returns:
+            bool: Whether the catalog changed
+        """
+        with self._lock:
+            current = self._catalog[0]
+            questions = {}
+            names = sorted(os.listdir(self.questions_dir)) if os.path.isdir(self.questions_dir) else []
+            for title in names:
+                path = os.path.join(self.questions_dir, title, 'question.html')
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                question = current.get(title)
+                if question is None or (question.mtime_ns, question.size) != (stat.st_mtime_ns, stat.st_size):
+                    try:
+                        with open(path, 'rb') as f:
+                            html = f.read()
+                        question = Question(title, path, html, stat.st_mtime_ns, stat.st_size)
+                    except (OSError, UnicodeDecodeError) as e:
+                        print(f"Cannot load question {title}: {e}")
+                        if question is None:
+                            continue
+                questions[title] = question
+
+            if questions.keys() == current.keys() and all(questions[t] is current[t] for t in questions):
+                return False
+            for title in current.keys() - questions.keys():
+                reference_cache.invalidate(title)
+            titles = list(questions)
+            etag = hashlib.sha256('\n'.join(titles).encode('utf-8')).hexdigest()
+            # One assignment: readers never see a half-built catalog
+            self._catalog = (questions, titles, etag)
+            self.reloads += 1
+            self.loaded_at = time.time()
+        print(f"Loaded question catalog: {titles}")
+        return True
+
+    def _ensure_watching(self):
+        # Started on first use (and again in a forked child) rather than at import
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._watch, name="question-catalog-watcher", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _watch(self):
+        try:
+            inotify = Inotify()
+            self.mode = 'inotify'
+        except OSError as e:
+            print(f"Watching questions by polling every {self.poll_interval}s ({e})")
+            inotify = None
+            self.mode = 'poll'
+
+        while True:
+            try:
+                if inotify is not None:
+                    # (Re)watch Questions/ and every question directory, new ones included
+                    inotify.watch(self.questions_dir)
+                    for title in self._catalog[1]:
+                        inotify.watch(os.path.join(self.questions_dir, title))
+                    inotify.wait(self.poll_interval)
+                else:
+                    time.sleep(self.poll_interval)
+                self.reload()
+            except Exception as e:
+                print(f"Question catalog watcher error: {e}")
+                time.sleep(self.poll_interval)
+
+    def get(self, title):
+        """Return the Question with this title, or None."""
+        self._ensure_watching()
+        return self._catalog[0].get(title)
+
+    def __contains__(self, title):
+        # Membership only (e.g. for metric labels): doesn't start the watcher
+        return title in self._catalog[0]
+
+    def titles(self):
+        """
+        Returns:
+            tuple: (titles, ETag of the list)
+        """
+        self._ensure_watching()
+        _, titles, etag = self._catalog
+        return titles, etag
+
+    def stats(self):
+        return {
+            "questions": len(self._catalog[1]),
+            "mode": self.mode,
+            "reloads": self.reloads,
+            "loadedAt": self.loaded_at
+        }
+
+question_catalog = QuestionCatalog()
+
+def setup_question_catalog(app):
+    """
+    Load the question catalog and set up the question routes.
+
+    Args:
+        app: The Flask application
+    """
+    question_catalog.reload()
+
+    @app.route('/api/questions', methods=['GET'])
+    def get_questions():
+        titles, etag = question_catalog.titles()
+        return cached_response(etag, lambda: jsonify({"questions": titles}))
+
+    @app.route('/api/question/<question_title>', methods=['GET'])
+    def get_question(question_title):
+        question = question_catalog.get(question_title)
+        if question is None:
+            return jsonify({"error": "File not found"}), 404
+        return cached_response(question.content_hash, lambda: Response(question.html, mimetype='text/html'))
+
+    @app.route('/api/question/<question_title>/methods', methods=['GET'])
+    def get_question_methods(question_title):
+        question = question_catalog.get(question_title)
+        if question is None:
+            return jsonify({"error": "File not found"}), 404
+        return cached_response(f"{question.content_hash}-methods", lambda: jsonify({"methods": question.methods}))
+
+    @app.route('/api/questions/catalog', methods=['GET'])
+    def question_catalog_stats():
+        return jsonify(question_catalog.stats())
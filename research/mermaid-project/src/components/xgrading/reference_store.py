@@ -0,0 +1,163 @@
+import json
+import time
+
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from grading import ReferenceSolution, reference_cache
+from models import db, Attribute, Entity, ReferenceVersion, Relationship
+
+# Reference solutions in the database.
+#
+# Every distinct question.html a question has had is stored once as a numbered
+# version: its marking criteria in `reference_solution`, its classes in `entity`
+# and `attribute`, and its relationships in `relationship`. The reference cache
+# looks a question up here by the sha256 of its HTML before parsing it, so a
+# restarted server (or another worker) loads the compiled solution with a few
+# indexed queries instead of re-parsing the HTML. Grades record the version
+# they were graded against.
+
+class ReferenceStore:
+    """
+    Loads and saves ReferenceSolutions; plugged into the reference cache by setup_reference_store().
+    """
+    def __init__(self, app):
+        self.app = app
+
+    def load(self, question_id, content_hash, question_file=None, mtime_ns=0, size=0):
+        """
+        Return the stored ReferenceSolution for this content of question.html, or None.
+
+        Database errors (e.g. an unmigrated database) are reported and also return
+        None, so the caller falls back to parsing the HTML.
+        """
+        try:
+            return self._load(question_id, content_hash, question_file, mtime_ns, size)
+        except SQLAlchemyError as e:
+            print(f"Could not load the stored reference solution of {question_id}: {getattr(e, 'orig', None) or e}")
+            return None
+
+    def _load(self, question_id, content_hash, question_file, mtime_ns, size):
+        with self.app.app_context():
+            row = ReferenceVersion.query.filter_by(question_id=question_id, content_hash=content_hash).first()
+            if row is None:
+                return None
+            entity_rows = (Entity.query.filter_by(question_id=question_id, version=row.version)
+                           .order_by(Entity.position).all())
+            attributes = {}
+            if entity_rows:
+                attribute_rows = (Attribute.query.filter(Attribute.entity_id.in_([e.id for e in entity_rows]))
+                                  .order_by(Attribute.entity_id, Attribute.position).all())
+                for attribute in attribute_rows:
+                    attributes.setdefault(attribute.entity_id, []).append(attribute.name)
+            relationship_rows = (Relationship.query.filter_by(question_id=question_id, version=row.version)
+                                 .order_by(Relationship.position).all())
+
+            # The same shapes parse_mermaid_schema produces
+            ref_entities = {
+                entity.name.lower(): {
+                    "entity": entity.name,
+                    "attribute": {name: {"attribute": name} for name in attributes.get(entity.id, [])},
+                    "methods": json.loads(entity.methods)
+                }
+                for entity in entity_rows
+            }
+            ref_relationships = []
+            for relationship in relationship_rows:
+                data = {"type": relationship.type, "source": relationship.source, "target": relationship.target}
+                if relationship.child_cardinality is not None:
+                    data["cardinality"] = relationship.child_cardinality
+                ref_relationships.append(data)
+
+            return ReferenceSolution(question_id, question_file, mtime_ns, size, content_hash,
+                                     row.reference_schema, json.loads(row.marking_criteria),
+                                     ref_entities, ref_relationships, version=row.version)
+
+    def save(self, reference):
+        """
+        Store a parsed reference solution as the question's next version (unless it is already stored).
+
+        Returns:
+            int: The version number, or None if it could not be stored
+        """
+        try:
+            with self.app.app_context():
+                try:
+                    return self._save(reference)
+                except IntegrityError:
+                    # Another process stored the same content (or took the version number) first
+                    db.session.rollback()
+                    return self._save(reference)
+        except SQLAlchemyError as e:
+            print(f"Could not store the reference solution of {reference.question_id}: {getattr(e, 'orig', None) or e}")
+            return None
+
+    def _save(self, reference):
+        question_id = reference.question_id
+        existing = ReferenceVersion.query.filter_by(question_id=question_id,
+                                                    content_hash=reference.content_hash).first()
+        if existing is not None:
+            return existing.version
+
+        version = (db.session.query(func.max(ReferenceVersion.version))
+                   .filter_by(question_id=question_id).scalar() or 0) + 1
+        db.session.add(ReferenceVersion(
+            question_id=question_id,
+            version=version,
+            content_hash=reference.content_hash,
+            reference_schema=reference.reference_schema,
+            marking_criteria=json.dumps(reference.marking_criteria),
+            created_at=int(time.time())
+        ))
+
+        entities = list(reference.ref_entities.values())
+        entity_ids = {}
+        if entities:
+            # One multi-row INSERT ... RETURNING for the entities, then one for their attributes
+            inserted = db.session.execute(
+                insert(Entity).returning(Entity.id, sort_by_parameter_order=True),
+                [{"question_id": question_id, "version": version, "position": position,
+                  "name": entity["entity"], "methods": json.dumps(entity["methods"])}
+                 for position, entity in enumerate(entities)]
+            ).scalars().all()
+            entity_ids = {entity["entity"].lower(): entity_id for entity, entity_id in zip(entities, inserted)}
+            attributes = [
+                {"entity_id": entity_id, "position": position, "name": name}
+                for entity, entity_id in zip(entities, inserted)
+                for position, name in enumerate(entity["attribute"])
+            ]
+            if attributes:
+                db.session.execute(insert(Attribute), attributes)
+
+        if reference.ref_relationships:
+            db.session.execute(insert(Relationship), [
+                {"question_id": question_id, "version": version, "position": position,
+                 "type": rel.get("type", ""), "source": rel.get("source", ""), "target": rel.get("target", ""),
+                 "parent_entity_id": entity_ids.get(rel.get("source", "").lower()),
+                 "child_entity_id": entity_ids.get(rel.get("target", "").lower()),
+                 "child_cardinality": rel.get("cardinality")}
+                for position, rel in enumerate(reference.ref_relationships)
+            ])
+        db.session.commit()
+        print(f"Stored reference solution for question {question_id} as version {version}")
+        return version
+
+    def versions(self, question_id):
+        """
+        Returns:
+            list: {version, contentHash, createdAt} of every stored version, oldest first
+        """
+        with self.app.app_context():
+            rows = (ReferenceVersion.query.filter_by(question_id=question_id)
+                    .order_by(ReferenceVersion.version).all())
+            return [{"version": row.version, "contentHash": row.content_hash, "createdAt": row.created_at}
+                    for row in rows]
+
+def setup_reference_store(app):
+    """
+    Keep the reference cache's parsed solutions in the app's database.
+
+    Args:
+        app: The Flask application
+    """
+    reference_cache.store = ReferenceStore(app)
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+import click
+
+from grading import get_reference_solution, preload_reference_solutions
+from models import db, Submission
+from pylint_pool import WORKER_START_METHOD
+from submission_store import grade_row, iter_submissions, load_submission_payload, record_grades
+
+# Batch regrading of stored submissions.
+#
+#   flask --app server regrade --question "Fish Store" --workers 4
+#
+# Submissions are streamed from the submission index into a process pool. Every
+# worker parses the reference solutions once (in its initializer) and then only
+# grades. Results are appended to a JSONL file as they finish; rerunning with the
+# same output file skips submissions it already contains, so an interrupted
+# regrade can be resumed. With --update-scores, results are checkpointed in
+# batches, each only after its scores and grades are committed.
+#
+# By default the file is instance/regrade/regrade-<key>.jsonl, keyed by the
+# regraded questions and the content of their reference solutions: a rerun only
+# resumes an interrupted run against the same references. A completed run's file
+# is renamed with its finish time, so the next regrade starts over.
+
+CHECKPOINT_DIR = os.path.join(os.path.dirname(__file__), 'instance', 'regrade')
+# Results per score/grade commit (and checkpoint write) with --update-scores
+UPDATE_BATCH_SIZE = 200
+
+def _init_worker():
+    # The grading code prints a lot of debug output; keep the workers quiet
+    sys.stdout = open(os.devnull, 'w')
+    from grading import preload_reference_solutions, reference_cache
+    # Workers have no database connection: they parse the questions themselves
+    # and the parent fills in the reference versions
+    reference_cache.store = None
+    preload_reference_solutions()
+
+def _regrade_one(submission_id, question_id, data):
+    from grading import grade_submission
+    result = grade_submission(question_id, data.get('code'), data.get('schema') or [], data.get('relationships'))
+    return submission_id, result
+
+def checkpoint_path(question_ids=None, checkpoint_dir=None):
+    """
+    The default results file / resume checkpoint of a regrade.
+
+    Args:
+        question_ids (list): The regraded questions (all if empty)
+        checkpoint_dir (str): Where checkpoints are kept (default: CHECKPOINT_DIR)
+    Returns:
+        str: The path, which changes with the questions and their reference solutions
+    """
+    key = hashlib.sha256()
+    for question_id in sorted(question_ids or preload_reference_solutions()):
+        reference = get_reference_solution(question_id)
+        key.update(f"{question_id}\0{reference.content_hash if reference is not None else ''}\n".encode('utf-8'))
+    return os.path.join(checkpoint_dir or CHECKPOINT_DIR, f"regrade-{key.hexdigest()[:16]}.jsonl")
+
+def read_checkpoint(output_path):
+    """
+    Return the submission ids already regraded into output_path.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r') as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)['submissionId'])
+            except (ValueError, KeyError):
+                # A line cut off by an interrupted run; that submission is regraded again
+                continue
+    return done
+
+def regrade_submissions(question_ids=None, workers=None, output_path=None,
+                        update_scores=False, window=None):
+    """
+    Regrade stored submissions in parallel. Must run inside an app context.
+
+    Args:
+        question_ids (list): Only these questions (all if empty)
+        workers (int): Worker processes (defaults to the CPU count)
+        output_path (str): JSONL file results are appended to (also the resume checkpoint);
+            by default checkpoint_path(), renamed once the run completes
+        update_scores (bool): Write the new scores back to the submission index and record the grades
+        window (int): Submissions in flight at once (defaults to 4 per worker)
+    Returns:
+        dict: Summary with counts, throughput and score changes
+    """
+    workers = workers or os.cpu_count() or 1
+    window = window or workers * 4
+    rotate = output_path is None
+    if rotate:
+        output_path = checkpoint_path(question_ids)
+    done = read_checkpoint(output_path)
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+
+    summary = {
+        "regraded": 0,
+        "skipped": 0,
+        "missing": 0,
+        "failed": 0,
+        "changed": 0,
+        "unchanged": 0,
+        "not_previously_graded": 0,
+        "total_delta": 0.0,
+        "largest_changes": [],
+        "per_question": {}
+    }
+    score_updates = []
+    grade_rows = []
+    lines = []
+    started = time.monotonic()
+
+    # Not fork: see WORKER_START_METHOD in pylint_pool.py
+    with open(output_path, 'a') as output, ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            mp_context=multiprocessing.get_context(WORKER_START_METHOD)) as pool:
+        pending = {}
+
+        def checkpoint():
+            # A result only goes into the checkpoint once its score and grade are committed,
+            # or a resumed run would skip a submission whose score was never written
+            if score_updates:
+                db.session.bulk_update_mappings(Submission, score_updates)
+                record_grades(grade_rows)
+                score_updates.clear()
+                grade_rows.clear()
+            output.writelines(lines)
+            output.flush()
+            lines.clear()
+
+        def collect(finished):
+            for future in finished:
+                submission_id, question_id, old_score = pending.pop(future)
+                try:
+                    _, result = future.result()
+                except Exception as e:
+                    summary["failed"] += 1
+                    print(f"Regrading {submission_id} failed: {e}")
+                    continue
+
+                new_score = result.get('score')
+                record = {
+                    "submissionId": submission_id,
+                    "questionId": question_id,
+                    "oldScore": old_score,
+                    "newScore": new_score,
+                    "delta": None if old_score is None else new_score - old_score
+                }
+                lines.append(json.dumps(record) + '\n')
+
+                summary["regraded"] += 1
+                per_question = summary["per_question"].setdefault(question_id, {"regraded": 0, "changed": 0, "total_delta": 0.0})
+                per_question["regraded"] += 1
+                if old_score is None:
+                    summary["not_previously_graded"] += 1
+                elif new_score != old_score:
+                    summary["changed"] += 1
+                    summary["total_delta"] += record["delta"]
+                    per_question["changed"] += 1
+                    per_question["total_delta"] += record["delta"]
+                    summary["largest_changes"].append(record)
+                    summary["largest_changes"] = sorted(summary["largest_changes"], key=lambda r: -abs(r["delta"]))[:10]
+                else:
+                    summary["unchanged"] += 1
+
+                if update_scores:
+                    score_updates.append({"id": submission_id, "score": new_score})
+                    grade_rows.append(grade_row(submission_id, question_id, result, 'regrade'))
+                if not update_scores or len(lines) >= UPDATE_BATCH_SIZE:
+                    checkpoint()
+
+        for submission in iter_submissions(question_ids):
+            if submission.id in done:
+                summary["skipped"] += 1
+                continue
+            # Payloads are read here: the workers have no database connection
+            try:
+                data = load_submission_payload(submission)
+            except (OSError, TypeError, KeyError, ValueError):
+                summary["missing"] += 1
+                continue
+            future = pool.submit(_regrade_one, submission.id, submission.question_id, data)
+            pending[future] = (submission.id, submission.question_id, submission.score)
+            if len(pending) >= window:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(finished)
+        checkpoint()
+
+    if rotate:
+        # Done: keep the results, but don't let the next regrade resume from them
+        finished_path = f"{output_path[:-len('.jsonl')]}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.jsonl"
+        os.replace(output_path, finished_path)
+        output_path = finished_path
+    summary["output"] = output_path
+
+    elapsed = time.monotonic() - started
+    summary["elapsed_seconds"] = round(elapsed, 3)
+    summary["submissions_per_second"] = round(summary["regraded"] / elapsed, 2) if elapsed > 0 else 0.0
+    summary["mean_delta"] = summary["total_delta"] / summary["changed"] if summary["changed"] else 0.0
+    return summary
+
+def setup_regrade_command(app):
+    """
+    Register the `flask regrade` command.
+
+    Args:
+        app: The Flask application
+    """
+    @app.cli.command('regrade')
+    @click.option('--question', 'questions', multiple=True, help='Question to regrade (repeatable, default: all).')
+    @click.option('--workers', type=int, default=None, help='Worker processes (default: CPU count).')
+    @click.option('--output', default=None,
+                  help='JSONL results file / resume checkpoint (default: one per question set and '
+                       'reference solutions under instance/regrade/, renamed when the run completes).')
+    @click.option('--update-scores', is_flag=True, help='Store the new scores in the submission index and the grades table.')
+    @click.option('--fresh', is_flag=True, help='Ignore an existing checkpoint and start over.')
+    def regrade_command(questions, workers, output, update_scores, fresh):
+        """Regrade stored submissions against the current reference solutions."""
+        if fresh:
+            checkpoint = output or checkpoint_path(list(questions))
+            if os.path.exists(checkpoint):
+                os.remove(checkpoint)
+        summary = regrade_submissions(list(questions), workers, output, update_scores)
+
+        click.echo(f"Regraded {summary['regraded']} submissions in {summary['elapsed_seconds']}s "
+                   f"({summary['submissions_per_second']} submissions/sec)")
+        click.echo(f"Skipped (already in checkpoint): {summary['skipped']}, "
+                   f"missing payloads: {summary['missing']}, failed: {summary['failed']}")
+        click.echo(f"Score changes: {summary['changed']} changed, {summary['unchanged']} unchanged, "
+                   f"{summary['not_previously_graded']} not previously graded, mean delta {summary['mean_delta']:+.2f}")
+        for question_id, stats in sorted(summary["per_question"].items()):
+            click.echo(f"  {question_id}: {stats['regraded']} regraded, {stats['changed']} changed")
+        for record in summary["largest_changes"]:
+            click.echo(f"  {record['submissionId']}: {record['oldScore']} -> {record['newScore']} ({record['delta']:+})")
+        click.echo(f"Results written to {summary['output']}")
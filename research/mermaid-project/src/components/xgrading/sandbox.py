@@ -0,0 +1,323 @@
+import contextlib
+import errno
+import itertools
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from flask import jsonify
+
+try:
+    import fcntl
+    import resource
+except ImportError:
+    fcntl = resource = None
+
+# Resource-limited execution of the compilers and linters behind /api/validate.
+#
+# Every compile or lint (warm pool or one-off process) first takes one of
+# SANDBOX_SLOTS slots. The slots are lock files, so the limit holds for all
+# server processes on the host, not per worker. A request that can't get a
+# slot within SANDBOX_QUEUE_WAIT seconds is rejected straight away (429 with
+# Retry-After) instead of queueing behind a burst.
+#
+# One-off processes then run with:
+#   - a wall-clock timeout (SANDBOX_TIMEOUT), after which they are killed
+#   - RLIMIT_CPU / RLIMIT_AS / RLIMIT_FSIZE limits and no core dumps, applied
+#     by the sandbox_exec.py wrapper before it execs the command
+#   - their own cgroup (memory.max, pids.max, cpu.max) when XGRADING_SANDBOX_CGROUP
+#     names a cgroup v2 directory the server may create children in
+#   - a private working directory on tmpfs (/dev/shm), removed afterwards
+# The warm pool workers are long-lived, so they only get the address space limit;
+# their jobs are bounded by the same wall-clock timeout.
+
+SANDBOX_SLOTS = int(os.environ.get('XGRADING_SANDBOX_SLOTS', str(os.cpu_count() or 1)))
+# Seconds a validation waits for a free slot before it is rejected
+SANDBOX_QUEUE_WAIT = float(os.environ.get('XGRADING_SANDBOX_QUEUE_WAIT', '0.5'))
+# Wall-clock seconds a compile/lint may run
+SANDBOX_TIMEOUT = float(os.environ.get('XGRADING_SANDBOX_TIMEOUT', '20'))
+SANDBOX_CPU_SECONDS = int(os.environ.get('XGRADING_SANDBOX_CPU_SECONDS', '20'))
+# Address space, not resident memory: a JVM reserves far more than it touches
+SANDBOX_ADDRESS_SPACE_MB = int(os.environ.get('XGRADING_SANDBOX_ADDRESS_SPACE_MB', '4096'))
+SANDBOX_FILE_SIZE_MB = int(os.environ.get('XGRADING_SANDBOX_FILE_SIZE_MB', '64'))
+# Delegated cgroup v2 directory for per-job cgroups; unset disables them
+SANDBOX_CGROUP = os.environ.get('XGRADING_SANDBOX_CGROUP')
+SANDBOX_CGROUP_MEMORY_MB = int(os.environ.get('XGRADING_SANDBOX_CGROUP_MEMORY_MB', '512'))
+SANDBOX_CGROUP_PIDS = int(os.environ.get('XGRADING_SANDBOX_CGROUP_PIDS', '64'))
+# Parent of the per-job working directories; tmpfs keeps the short-lived files off disk
+SANDBOX_TMPDIR = os.environ.get('XGRADING_SANDBOX_TMPDIR') or (
+    '/dev/shm' if os.access('/dev/shm', os.W_OK) else tempfile.gettempdir())
+SANDBOX_LOCK_DIR = os.environ.get('XGRADING_SANDBOX_LOCK_DIR',
+                                  os.path.join(tempfile.gettempdir(), 'xgrading-sandbox-slots'))
+
+# Applies the limits and execs the sandboxed command
+SANDBOX_EXEC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sandbox_exec.py')
+
+# How often a waiting request retries the slots
+SLOT_POLL_INTERVAL = 0.01
+MAX_RETRY_AFTER = 30
+
+class SandboxBusy(Exception):
+    """Every sandbox slot is taken; the request should be retried after retry_after seconds."""
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class SandboxTimeout(Exception):
+    """A compile or lint ran past its wall-clock timeout and was killed."""
+
+def limited_command(args, address_space_mb=SANDBOX_ADDRESS_SPACE_MB, cpu_seconds=None,
+                    file_size_mb=SANDBOX_FILE_SIZE_MB, cgroup=None):
+    """
+    Wrap a command line so the process runs under the resource limits.
+
+    The limits are applied by sandbox_exec.py just before it execs the command,
+    not in a Popen preexec_fn, which isn't safe in the threaded server.
+
+    Args:
+        args (list): The command line
+        address_space_mb (int): RLIMIT_AS in MiB (None = unlimited)
+        cpu_seconds (int): RLIMIT_CPU (None = unlimited)
+        file_size_mb (int): RLIMIT_FSIZE in MiB (None = unlimited)
+        cgroup (str): cgroup v2 directory to move the process into
+    Returns:
+        list: The wrapped command line, or args unchanged where resource limits are not supported
+    Raises:
+        FileNotFoundError: If the command is not installed (as Popen would for the bare command)
+    """
+    if resource is None:
+        return list(args)
+    if shutil.which(args[0]) is None:
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), args[0])
+    command = [sys.executable, '-I', '-S', SANDBOX_EXEC]
+    if address_space_mb:
+        command += ['--address-space', str(address_space_mb)]
+    if cpu_seconds:
+        command += ['--cpu', str(cpu_seconds)]
+    if file_size_mb:
+        command += ['--file-size', str(file_size_mb)]
+    if cgroup:
+        command += ['--cgroup', cgroup]
+    return command + ['--'] + list(args)
+
+class Sandbox:
+    """
+    Host-wide slots for compiler/linter jobs and limited execution of their processes.
+    """
+    def __init__(self, slots=SANDBOX_SLOTS, queue_wait=SANDBOX_QUEUE_WAIT, timeout=SANDBOX_TIMEOUT,
+                 lock_dir=SANDBOX_LOCK_DIR, tmp_dir=SANDBOX_TMPDIR, cgroup_root=SANDBOX_CGROUP):
+        self.slots = max(1, slots)
+        self.queue_wait = queue_wait
+        self.timeout = timeout
+        self.lock_dir = lock_dir
+        self.tmp_dir = tmp_dir
+        self.cgroup_root = cgroup_root
+        # Without fcntl (Windows) the slots are only shared by this process's threads
+        self._local_slots = threading.BoundedSemaphore(self.slots) if fcntl is None else None
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+        # Moving average of job durations, for Retry-After
+        self._average_duration = 1.0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _try_acquire(self):
+        """
+        Returns:
+            The held slot (a locked file descriptor), or None if every slot is taken
+        """
+        if self._local_slots is not None:
+            return True if self._local_slots.acquire(blocking=False) else None
+        # Start at a different slot per attempt so waiters don't all fight over slot 0
+        first = next(self._job_ids)
+        for i in range(self.slots):
+            path = os.path.join(self.lock_dir, f"slot-{(first + i) % self.slots}")
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def _release(self, held):
+        if self._local_slots is not None:
+            self._local_slots.release()
+        else:
+            # Closing the descriptor drops the lock (as does the process dying)
+            os.close(held)
+
+    def retry_after(self):
+        """Seconds a rejected client should wait: about one job's duration."""
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(self._average_duration)))
+
+    @contextlib.contextmanager
+    def slot(self, ticket=None):
+        """
+        Hold one sandbox slot for the duration of the block.
+
+        Raises:
+            SandboxBusy: If no slot became free within queue_wait seconds
+            ValidationSuperseded: If the ticket was superseded while waiting
+        """
+        if fcntl is not None:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        deadline = time.monotonic() + self.queue_wait
+        while True:
+            held = self._try_acquire()
+            if held is not None:
+                break
+            if ticket is not None:
+                ticket.check()
+            if time.monotonic() >= deadline:
+                with self._lock:
+                    self.rejected += 1
+                raise SandboxBusy(f"All {self.slots} compiler slots are busy", self.retry_after())
+            time.sleep(SLOT_POLL_INTERVAL)
+
+        started = time.monotonic()
+        with self._lock:
+            self.running += 1
+        try:
+            yield
+        finally:
+            self._release(held)
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self._average_duration = 0.8 * self._average_duration + 0.2 * (time.monotonic() - started)
+
+    def _make_cgroup(self):
+        if not self.cgroup_root:
+            return None
+        path = os.path.join(self.cgroup_root, f"job-{os.getpid()}-{next(self._job_ids)}")
+        try:
+            os.mkdir(path)
+            for name, value in (('memory.max', str(SANDBOX_CGROUP_MEMORY_MB * 1024 * 1024)),
+                                ('memory.swap.max', '0'),
+                                ('pids.max', str(SANDBOX_CGROUP_PIDS)),
+                                # One CPU's worth of time per period
+                                ('cpu.max', '100000 100000')):
+                with open(os.path.join(path, name), 'w') as f:
+                    f.write(value)
+            return path
+        except OSError as e:
+            print(f"Sandbox cgroups disabled, using rlimits only: {e}")
+            self.cgroup_root = None
+            self._remove_cgroup(path)
+            return None
+
+    def _remove_cgroup(self, path):
+        if path:
+            try:
+                os.rmdir(path)
+            except OSError:
+                pass
+
+    def run(self, args, files=None, ticket=None, timeout=None):
+        """
+        Run a compiler/linter process in a private working directory.
+
+        The caller must hold a slot (see slot()). Relative paths in args resolve
+        inside the working directory, where `files` are written first.
+
+        Args:
+            args (list): The command line
+            files (dict): {file name: text} to create in the working directory
+            ticket (ValidationTicket): Kills the process if the validation is superseded
+            timeout (float): Wall-clock seconds (default: the sandbox timeout)
+        Returns:
+            subprocess.CompletedProcess: The finished process with text stdout/stderr
+        Raises:
+            SandboxTimeout: If the process ran past the timeout
+            ValidationSuperseded: If a newer request from the same session cancelled this one
+        """
+        if ticket is not None:
+            ticket.check()
+        timeout = timeout or self.timeout
+        workdir = tempfile.mkdtemp(prefix='job-', dir=self.tmp_dir)
+        cgroup = self._make_cgroup()
+        try:
+            for name, text in (files or {}).items():
+                with open(os.path.join(workdir, name), 'w', encoding='utf-8') as f:
+                    f.write(text)
+
+            env = dict(os.environ, TMPDIR=workdir, HOME=workdir,
+                       # glibc reserves address space per thread arena; keep that inside RLIMIT_AS
+                       MALLOC_ARENA_MAX='2')
+            process = subprocess.Popen(
+                limited_command(args, cpu_seconds=SANDBOX_CPU_SECONDS, cgroup=cgroup), cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                start_new_session=True,
+            )
+            if ticket is not None:
+                ticket.attach(process)
+            try:
+                stdout, stderr = process.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                with self._lock:
+                    self.timeouts += 1
+                raise SandboxTimeout(f"{os.path.basename(args[0])} did not finish within {timeout:g}s")
+            finally:
+                if ticket is not None:
+                    ticket.detach(process)
+            if ticket is not None:
+                ticket.check()
+            return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+            self._remove_cgroup(cgroup)
+
+    def record_timeout(self):
+        """Count a pooled job that was stopped at the timeout."""
+        with self._lock:
+            self.timeouts += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "slots": self.slots,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "averageSeconds": round(self._average_duration, 3),
+                "cgroups": bool(self.cgroup_root),
+                "tmpDir": self.tmp_dir
+            }
+
+sandbox = Sandbox()
+
+def sandbox_busy_response(e):
+    response = jsonify({
+        "success": False,
+        "busy": True,
+        "retryAfter": e.retry_after,
+        "errors": [{
+            "line": 1,
+            "message": "The server is busy checking other code, please try again shortly.",
+            "severity": "info"
+        }]
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+def sandbox_timeout_response(e):
+    return {
+        "success": False,
+        "timedOut": True,
+        "errors": [{
+            "line": 1,
+            "message": f"Checking this code took too long: {e}",
+            "severity": "error"
+        }]
+    }
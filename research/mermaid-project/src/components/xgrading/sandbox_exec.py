@@ -0,0 +1,70 @@
+import argparse
+import os
+import sys
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Exec wrapper for sandboxed processes.
+#
+#   python sandbox_exec.py [--address-space MB] [--cpu SECONDS] [--file-size MB]
+#                          [--cgroup DIR] -- command [args...]
+#
+# Applies the resource limits to itself, joins the cgroup and then execs the
+# command, which inherits both. The server is multi-threaded, so it can't do
+# this in a Popen preexec_fn: code run between fork and exec in a threaded
+# parent can deadlock on locks another thread held at fork time. Only imports
+# the standard library, so it starts quickly under `python -I -S`.
+
+def apply_limits(address_space_mb=None, cpu_seconds=None, file_size_mb=None, cgroup=None):
+    """
+    Apply the limits to the calling process (and the processes it execs or starts).
+
+    Args:
+        address_space_mb (int): RLIMIT_AS in MiB (None = unlimited)
+        cpu_seconds (int): RLIMIT_CPU (None = unlimited)
+        file_size_mb (int): RLIMIT_FSIZE in MiB (None = unlimited)
+        cgroup (str): cgroup v2 directory to move the process into
+    """
+    if resource is not None:
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        if address_space_mb:
+            limit = address_space_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        if cpu_seconds:
+            # SIGXCPU at the soft limit, SIGKILL a second later
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+        if file_size_mb:
+            limit = file_size_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_FSIZE, (limit, limit))
+    if cgroup:
+        with open(os.path.join(cgroup, 'cgroup.procs'), 'w') as f:
+            f.write(str(os.getpid()))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a command under sandbox resource limits')
+    parser.add_argument('--address-space', type=int, help='RLIMIT_AS in MiB')
+    parser.add_argument('--cpu', type=int, help='RLIMIT_CPU in seconds')
+    parser.add_argument('--file-size', type=int, help='RLIMIT_FSIZE in MiB')
+    parser.add_argument('--cgroup', help='cgroup v2 directory to join')
+    parser.add_argument('command', nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    if not command:
+        parser.error('no command given')
+
+    apply_limits(args.address_space, args.cpu, args.file_size, args.cgroup)
+    try:
+        os.execvp(command[0], command)
+    except OSError as e:
+        # Same wording and status as a shell, so callers can tell a missing tool from a failed run
+        if isinstance(e, FileNotFoundError):
+            print(f"{command[0]}: command not found", file=sys.stderr)
+            return 127
+        print(f"{command[0]}: {e.strerror}", file=sys.stderr)
+        return 126
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import gc
+import os
+
+import click
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+from grading_queue import share_grading_queue
+from models import db
+from question_catalog import question_catalog
+from validation_stream import configure_validation_streams
+
+# Production serving.
+#
+#   flask --app server serve --workers 4 --threads 8
+#
+# Runs the app under gunicorn with preloaded, preforked workers: the app, the
+# question catalog and the parsed reference solutions are loaded once in the
+# master and the workers inherit them copy-on-write. Background threads and
+# compiler/linter pools start lazily in each worker, never in the master.
+#
+# kill -HUP <master pid> re-reads Questions/ in the master and gracefully
+# replaces the workers; kill -TERM drains in-flight requests before exiting.
+# Without gunicorn (e.g. on Windows) it falls back to a threaded single-process
+# server. The debugger and reloader are only on for `python server.py` with
+# XGRADING_DEBUG=1.
+
+SERVE_BIND = os.environ.get('XGRADING_BIND', '127.0.0.1:5000')
+SERVE_WORKERS = int(os.environ.get('XGRADING_WORKERS', str(os.cpu_count() or 1)))
+# Requests each worker handles concurrently
+SERVE_THREADS = int(os.environ.get('XGRADING_THREADS', '4'))
+# Open (keep-alive and SSE) connections a worker accepts
+SERVE_MAX_CONNECTIONS = int(os.environ.get('XGRADING_MAX_CONNECTIONS', '1000'))
+# Seconds a request may run before its worker is restarted (javac can be slow)
+SERVE_TIMEOUT = int(os.environ.get('XGRADING_TIMEOUT', '120'))
+SERVE_GRACEFUL_TIMEOUT = int(os.environ.get('XGRADING_GRACEFUL_TIMEOUT', '30'))
+SERVE_BACKLOG = int(os.environ.get('XGRADING_BACKLOG', '2048'))
+
+def _freeze_heap():
+    # Keep the preloaded objects out of the GC's reach so collections in the
+    # workers don't touch (and un-share) their pages
+    gc.collect()
+    gc.freeze()
+
+def gunicorn_server(app, options):
+    """
+    Build a gunicorn application serving the already-loaded Flask app.
+    """
+    def post_fork(server, worker):
+        # Connections opened in the master must not be shared with the workers
+        with app.app_context():
+            db.engine.dispose(close=False)
+
+    def on_reload(server):
+        # SIGHUP: new workers are forked from the master, so refresh its copy first
+        question_catalog.reload()
+        _freeze_heap()
+
+    class PreforkServer(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+            self.cfg.set('post_fork', post_fork)
+            self.cfg.set('on_reload', on_reload)
+
+        def load(self):
+            return app
+
+    return PreforkServer()
+
+def serve(app, bind=SERVE_BIND, workers=SERVE_WORKERS, threads=SERVE_THREADS,
+          max_connections=SERVE_MAX_CONNECTIONS, timeout=SERVE_TIMEOUT,
+          graceful_timeout=SERVE_GRACEFUL_TIMEOUT, max_requests=0, backlog=SERVE_BACKLOG):
+    """
+    Serve the app until the server is stopped.
+
+    Args:
+        app: The (fully set up) Flask application
+        bind (str): host:port to listen on
+        workers (int): Worker processes
+        threads (int): Request threads per worker
+        max_connections (int): Open connections per worker
+        timeout (int): Seconds before a stuck worker is restarted
+        graceful_timeout (int): Seconds workers get to finish requests on reload/shutdown
+        max_requests (int): Restart a worker after this many requests (0 = never)
+        backlog (int): Pending connections the listening socket queues
+    """
+    if BaseApplication is None:
+        host, _, port = bind.rpartition(':')
+        print(f"gunicorn is not installed; serving on {bind} from a single threaded process")
+        app.run(host=host or '127.0.0.1', port=int(port), threaded=True, debug=False, use_reloader=False)
+        return
+
+    share_grading_queue(app, workers)
+    configure_validation_streams(workers, threads)
+    _freeze_heap()
+    print(f"Serving on {bind}: {workers} workers x {threads} threads")
+    gunicorn_server(app, {
+        'bind': bind,
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'worker_connections': max_connections,
+        'timeout': timeout,
+        'graceful_timeout': graceful_timeout,
+        'max_requests': max_requests,
+        # Spread worker restarts out so they don't all recycle at once
+        'max_requests_jitter': max_requests // 10,
+        'backlog': backlog,
+        'preload_app': True,
+    }).run()
+
+def setup_serve_command(app):
+    """
+    Register the `serve` CLI command.
+
+    Args:
+        app: The Flask application
+    """
+    @app.cli.command('serve')
+    @click.option('--bind', default=SERVE_BIND, show_default=True, help='host:port to listen on')
+    @click.option('--workers', default=SERVE_WORKERS, show_default=True, help='Worker processes')
+    @click.option('--threads', default=SERVE_THREADS, show_default=True, help='Request threads per worker')
+    @click.option('--max-connections', default=SERVE_MAX_CONNECTIONS, show_default=True,
+                  help='Open connections per worker (keep-alive and event streams included)')
+    @click.option('--timeout', default=SERVE_TIMEOUT, show_default=True,
+                  help='Seconds before a stuck worker is restarted')
+    @click.option('--graceful-timeout', default=SERVE_GRACEFUL_TIMEOUT, show_default=True,
+                  help='Seconds workers get to finish their requests on reload/shutdown')
+    @click.option('--max-requests', default=0, show_default=True,
+                  help='Restart a worker after this many requests (0 = never)')
+    @click.option('--backlog', default=SERVE_BACKLOG, show_default=True, help='Listen backlog')
+    def serve_command(**options):
+        """Serve the app with preforked, preloaded workers."""
+        serve(app, **options)
@@ -0,0 +1,358 @@
+import hashlib
+import json
+import os
+import re
+import struct
+
+import click
+from flask import jsonify, request
+from sqlalchemy import tuple_
+
+from blob_store import submission_code
+from models import db, CodeSignature, LSHBucket, Submission
+
+# Near-duplicate detection for submitted code.
+#
+# When a submission is stored its code is normalized (comments and whitespace
+# dropped, identifiers renamed in order of first appearance, so renaming
+# variables or classes doesn't hide a copy), cut into overlapping token
+# shingles and summarized by a MinHash signature: for each of MINHASH_PERMUTATIONS
+# hash functions, the smallest hash of any shingle. The hash functions are the
+# 32-bit words of one SHAKE-128 output per shingle, so a signature costs one
+# hash call per shingle and a min() per position, all in C. The fraction of equal
+# positions in two signatures estimates the Jaccard similarity of their shingle
+# sets. The signature is split into LSH_BANDS bands, and each band is stored as
+# a (question, band, bucket) row: submissions that share any bucket are
+# candidates. A query is then LSH_BANDS index lookups plus a comparison with
+# each candidate, instead of a comparison with every submission of the question.
+#
+#   GET /api/question/<id>/similar/<submissionId>     near-duplicates of one submission
+#   GET /api/question/<id>/clusters                   groups of near-duplicates
+#   flask --app server similarity-index               (re)index stored submissions
+#   flask --app server similarity-clusters            clusters of every question
+
+MINHASH_PERMUTATIONS = 128
+# 16 bands of 8 rows: pairs with a Jaccard similarity around 0.7 and above become candidates
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+SHINGLE_SIZE = 4
+SIMILARITY_THRESHOLD = float(os.environ.get('XGRADING_SIMILARITY_THRESHOLD', '0.8'))
+DEFAULT_SIMILAR_LIMIT = 20
+# Buckets with more members than this are checked against their first member only
+MAX_PAIRWISE_BUCKET = 64
+
+_SIGNATURE = struct.Struct(f'<{MINHASH_PERMUTATIONS}I')
+_BAND = struct.Struct(f'<{LSH_ROWS}I')
+
+# Words kept as they are when identifiers are renamed: Mermaid, Java and Python
+# keywords and the common type names
+KEYWORDS = frozenset("""
+classdiagram class interface abstract enumeration namespace note direction
+public private protected static final void int float double boolean char long short byte string
+extends implements new return if else for while do switch case break continue try catch
+finally throw throws import package this super null true false enum var
+def elif in not and or is none with except raise lambda yield pass self async await
+list map set date optional dict str bool tuple object
+""".split())
+
+_MERMAID_COMMENT = re.compile(r'%%[^\n]*')
+_C_COMMENT = re.compile(r'/\*.*?\*/|//[^\n]*', re.S)
+_HASH_COMMENT = re.compile(r'#[^\n]*')
+_TOKEN = re.compile(r'[A-Za-z_]\w*|\d+(?:\.\d+)?|[^\w\s]+')
+
+def normalize_code(code):
+    """
+    Tokenize code with comments removed and identifiers renamed.
+
+    Args:
+        code (str): Mermaid class diagram, Java or Python source
+    Returns:
+        list: The normalized tokens
+    """
+    if code.lstrip().startswith('classDiagram'):
+        # In Mermaid, '#' is the protected marker
+        code = _MERMAID_COMMENT.sub(' ', code)
+    else:
+        code = _HASH_COMMENT.sub(' ', _C_COMMENT.sub(' ', code))
+    names = {}
+    tokens = []
+    for token in _TOKEN.findall(code):
+        if token[0].isalpha() or token[0] == '_':
+            word = token.lower()
+            if word not in KEYWORDS:
+                word = names.setdefault(word, f"v{len(names)}")
+            tokens.append(word)
+        else:
+            tokens.append(token)
+    return tokens
+
+def minhash(code):
+    """
+    Returns:
+        tuple: The MinHash signature of code (MINHASH_PERMUTATIONS ints)
+    """
+    tokens = normalize_code(code or '')
+    if len(tokens) < SHINGLE_SIZE:
+        shingles = {' '.join(tokens)}
+    else:
+        shingles = {' '.join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+    hashes = [_SIGNATURE.unpack(hashlib.shake_128(shingle.encode('utf-8')).digest(_SIGNATURE.size))
+              for shingle in shingles]
+    return tuple(map(min, zip(*hashes)))
+
+def pack_signature(signature):
+    return _SIGNATURE.pack(*signature)
+
+def unpack_signature(data):
+    return _SIGNATURE.unpack(data)
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for a, b in zip(first, second) if a == b) / MINHASH_PERMUTATIONS
+
+def band_buckets(signature):
+    """
+    Returns:
+        list: (band, bucket) of each LSH band of the signature
+    """
+    buckets = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(_BAND.pack(*rows), digest_size=8).digest()
+        buckets.append((band, int.from_bytes(digest, 'little', signed=True)))
+    return buckets
+
+def index_submissions(submissions):
+    """
+    Store the signatures and LSH buckets of submissions (replacing any earlier ones).
+    Runs in the caller's transaction; the caller commits.
+
+    Args:
+        submissions (list): (submission_id, question_id, student_id, code) of each submission
+    """
+    for submission_id, question_id, student_id, code in submissions:
+        previous = db.session.get(CodeSignature, submission_id)
+        if previous is not None:
+            for band, bucket in band_buckets(unpack_signature(previous.signature)):
+                LSHBucket.query.filter_by(question_id=previous.question_id, band=band, bucket=bucket,
+                                          submission_id=submission_id).delete(synchronize_session=False)
+            db.session.delete(previous)
+            db.session.flush()
+        signature = minhash(code)
+        db.session.add(CodeSignature(submission_id=submission_id, question_id=question_id,
+                                     student_id=student_id, signature=pack_signature(signature)))
+        db.session.add_all(LSHBucket(question_id=question_id, band=band, bucket=bucket, submission_id=submission_id)
+                           for band, bucket in band_buckets(signature))
+
+def _signature_of(submission_id):
+    row = db.session.get(CodeSignature, submission_id)
+    if row is not None:
+        return row
+    # Stored before the index existed: index it now
+    submission = db.session.get(Submission, submission_id)
+    if submission is None:
+        return None
+    index_submissions([(submission.id, submission.question_id, submission.student_id, submission_code(submission))])
+    db.session.commit()
+    return db.session.get(CodeSignature, submission_id)
+
+def _different_students(first, second):
+    # Anonymous submissions can't be attributed, so they never count as the same student
+    return first is None or second is None or first != second
+
+def similar_submissions(submission_id, threshold=SIMILARITY_THRESHOLD, limit=DEFAULT_SIMILAR_LIMIT,
+                        same_student=False):
+    """
+    Find the near-duplicates of a submission among its question's submissions.
+
+    Args:
+        submission_id (str): The submission
+        threshold (float): Minimum estimated Jaccard similarity
+        limit (int): Most results returned
+        same_student (bool): Also report the student's own other submissions
+    Returns:
+        dict: The matches, most similar first, or None if there is no such submission
+    """
+    target = _signature_of(submission_id)
+    if target is None:
+        return None
+    signature = unpack_signature(target.signature)
+
+    candidate_ids = {row.submission_id for row in db.session.query(LSHBucket.submission_id).filter(
+        LSHBucket.question_id == target.question_id,
+        tuple_(LSHBucket.band, LSHBucket.bucket).in_(band_buckets(signature))
+    ).distinct()}
+    candidate_ids.discard(submission_id)
+
+    matches = []
+    candidate_list = list(candidate_ids)
+    for start in range(0, len(candidate_list), 500):
+        for row in CodeSignature.query.filter(CodeSignature.submission_id.in_(candidate_list[start:start + 500])):
+            if not same_student and not _different_students(target.student_id, row.student_id):
+                continue
+            score = similarity(signature, unpack_signature(row.signature))
+            if score >= threshold:
+                matches.append({"submissionId": row.submission_id, "studentId": row.student_id,
+                                "similarity": round(score, 3)})
+    matches.sort(key=lambda match: (-match["similarity"], match["submissionId"]))
+    return {
+        "submissionId": submission_id,
+        "questionId": target.question_id,
+        "studentId": target.student_id,
+        "threshold": threshold,
+        "candidates": len(candidate_ids),
+        "similar": matches[:limit]
+    }
+
+def similarity_clusters(question_id, threshold=SIMILARITY_THRESHOLD, same_student=False, batch_size=1000):
+    """
+    Group a question's submissions into clusters of near-duplicates, comparing only
+    the pairs that share an LSH bucket.
+
+    Returns:
+        list: Clusters of two or more submissions, largest first
+    """
+    signatures = {}
+    students = {}
+    for row in CodeSignature.query.filter_by(question_id=question_id).yield_per(batch_size):
+        signatures[row.submission_id] = unpack_signature(row.signature)
+        students[row.submission_id] = row.student_id
+
+    parent = {submission_id: submission_id for submission_id in signatures}
+
+    def find(submission_id):
+        while parent[submission_id] != submission_id:
+            parent[submission_id] = parent[parent[submission_id]]
+            submission_id = parent[submission_id]
+        return submission_id
+
+    def join(first, second):
+        first_root, second_root = find(first), find(second)
+        if first_root == second_root:
+            return
+        if not same_student and not _different_students(students[first], students[second]):
+            return
+        if similarity(signatures[first], signatures[second]) >= threshold:
+            parent[second_root] = first_root
+
+    def join_bucket(members):
+        if len(members) > MAX_PAIRWISE_BUCKET:
+            for member in members[1:]:
+                join(members[0], member)
+            return
+        for i, first in enumerate(members):
+            for second in members[i + 1:]:
+                join(first, second)
+
+    # Bucket rows arrive in primary key order, one bucket after another
+    members = []
+    current = None
+    rows = (db.session.query(LSHBucket.band, LSHBucket.bucket, LSHBucket.submission_id)
+            .filter(LSHBucket.question_id == question_id)
+            .order_by(LSHBucket.band, LSHBucket.bucket, LSHBucket.submission_id).yield_per(batch_size))
+    for band, bucket, submission_id in rows:
+        if (band, bucket) != current:
+            join_bucket(members)
+            members = []
+            current = (band, bucket)
+        if submission_id in parent:
+            members.append(submission_id)
+    join_bucket(members)
+
+    clusters = {}
+    for submission_id in signatures:
+        clusters.setdefault(find(submission_id), []).append(submission_id)
+    result = []
+    for cluster in clusters.values():
+        if len(cluster) < 2:
+            continue
+        cluster.sort()
+        result.append({
+            "size": len(cluster),
+            "students": len({students[submission_id] for submission_id in cluster if students[submission_id]}),
+            "submissions": [{"submissionId": submission_id, "studentId": students[submission_id]}
+                            for submission_id in cluster]
+        })
+    result.sort(key=lambda cluster: (-cluster["size"], cluster["submissions"][0]["submissionId"]))
+    return result
+
+def index_stored_submissions(question_ids=None, batch_size=200):
+    """
+    Index every stored submission that isn't indexed yet. Must run inside an app context.
+
+    Returns:
+        int: The number of submissions indexed
+    """
+    indexed_ids = {row.submission_id for row in db.session.query(CodeSignature.submission_id)}
+    query = db.session.query(Submission.id)
+    if question_ids:
+        query = query.filter(Submission.question_id.in_(question_ids))
+    pending = [row.id for row in query if row.id not in indexed_ids]
+    for start in range(0, len(pending), batch_size):
+        batch = Submission.query.filter(Submission.id.in_(pending[start:start + batch_size])).all()
+        index_submissions([(submission.id, submission.question_id, submission.student_id, submission_code(submission))
+                           for submission in batch])
+        db.session.commit()
+    return len(pending)
+
+def _threshold_arg():
+    threshold = float(request.args.get('threshold', SIMILARITY_THRESHOLD))
+    if not 0 < threshold <= 1:
+        raise ValueError(threshold)
+    return threshold
+
+def setup_similarity(app):
+    """
+    Register the similarity routes and CLI commands.
+
+    Args:
+        app: The Flask application
+    """
+    @app.route('/api/question/<question_id>/similar/<submission_id>', methods=['GET'])
+    def get_similar_submissions(question_id, submission_id):
+        try:
+            threshold = _threshold_arg()
+            limit = max(int(request.args.get('limit', DEFAULT_SIMILAR_LIMIT)), 1)
+        except ValueError:
+            return jsonify({"error": "threshold must be in (0, 1] and limit an integer"}), 400
+        result = similar_submissions(submission_id, threshold, limit, request.args.get('sameStudent') == '1')
+        if result is None or result["questionId"] != question_id:
+            return jsonify({"error": f"No submission {submission_id} for question {question_id}"}), 404
+        return jsonify(result)
+
+    @app.route('/api/question/<question_id>/clusters', methods=['GET'])
+    def get_similarity_clusters(question_id):
+        try:
+            threshold = _threshold_arg()
+        except ValueError:
+            return jsonify({"error": "threshold must be in (0, 1]"}), 400
+        clusters = similarity_clusters(question_id, threshold, request.args.get('sameStudent') == '1')
+        return jsonify({"questionId": question_id, "threshold": threshold, "clusters": clusters})
+
+    @app.cli.command('similarity-index')
+    @click.option('--question', 'questions', multiple=True, help='Question to index (repeatable, default: all).')
+    def similarity_index_command(questions):
+        """Compute the MinHash signatures of stored submissions that don't have one."""
+        indexed = index_stored_submissions(list(questions))
+        click.echo(f"Indexed {indexed} submissions")
+
+    @app.cli.command('similarity-clusters')
+    @click.option('--question', 'questions', multiple=True, help='Question to cluster (repeatable, default: all).')
+    @click.option('--threshold', type=float, default=SIMILARITY_THRESHOLD, show_default=True,
+                  help='Minimum estimated Jaccard similarity.')
+    @click.option('--same-student', is_flag=True, help="Also cluster a student's own resubmissions.")
+    @click.option('--output', default=None, help='Write the clusters to this JSON file.')
+    def similarity_clusters_command(questions, threshold, same_student, output):
+        """Cluster near-duplicate submissions of every question."""
+        question_ids = list(questions) or [row.question_id for row in
+                                           db.session.query(CodeSignature.question_id).distinct()]
+        report = {}
+        for question_id in sorted(question_ids):
+            clusters = similarity_clusters(question_id, threshold, same_student)
+            report[question_id] = clusters
+            click.echo(f"{question_id}: {len(clusters)} clusters, "
+                       f"{sum(cluster['size'] for cluster in clusters)} submissions in them")
+        if output:
+            with open(output, 'w') as f:
+                json.dump(report, f, indent=2)
+            click.echo(f"Clusters written to {output}")
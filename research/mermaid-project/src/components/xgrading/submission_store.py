@@ -0,0 +1,429 @@
+import json
+import os
+import re
+import secrets
+import time
+
+import click
+from flask import Response, jsonify, request, stream_with_context
+from sqlalchemy import and_, func, insert, or_, select
+from sqlalchemy.orm import load_only
+
+from analytics import count_grades, count_submissions
+from blob_store import load_payload, pack_submissions, store_payload
+from grading import get_reference_solution
+from similarity import index_submissions
+from models import db, Grade, Submission
+
+# Indexed access to stored submissions.
+#
+# Payloads are kept in the content-addressed blob store (see blob_store.py), or
+# for submissions imported from Submissions/<question>/<id>.json, in those files.
+# The `submission` table indexes them by question and student so latest-code and
+# history lookups are index range scans instead of directory listings. Every grading of a
+# submission is kept in the `grade` table (submission.score is the latest one),
+# indexed by question and reference version. Both also update the per-question
+# analytics (see analytics.py) in the same transaction, and stored code is
+# indexed for near-duplicate search (see similarity.py).
+
+GRADES_PAGE_SIZE = 50
+MAX_GRADES_PAGE_SIZE = 500
+HISTORY_PAGE_SIZE = 20
+MAX_HISTORY_PAGE_SIZE = 500
+# ?fields= of the submissions route: row metadata, plus the code, plus the whole payload
+SUBMISSION_FIELDS = ('metadata', 'code', 'payload')
+
+SUBMISSIONS_DIR = os.path.join(os.path.dirname(__file__), 'Submissions')
+
+def grade_row(submission_id, question_id, grade, source, graded_at=None):
+    """
+    Build the `grade` table row for a grade_submission result.
+
+    Args:
+        submission_id (str): The graded submission
+        question_id (str): Its question
+        grade (dict): The grade_submission result
+        source (str): What graded it ('submit', 'queue' or 'regrade')
+        graded_at (int): Unix time (default: now)
+    Returns:
+        dict: Column values
+    """
+    details = grade.get("details") or {}
+    version = grade.get("referenceVersion")
+    if version is None:
+        # Graded in a worker process without the reference store; ours has the same solution
+        reference = get_reference_solution(question_id)
+        version = reference.version if reference is not None else None
+    return {
+        "submission_id": submission_id,
+        "question_id": question_id,
+        "reference_version": version,
+        "score": grade.get("score"),
+        "entity_score": (details.get("entity_score") or {}).get("score"),
+        "relationship_score": (details.get("relationship_score") or {}).get("score"),
+        "method_score": (details.get("method_score") or {}).get("score"),
+        "feedback": grade.get("feedback"),
+        "details": json.dumps(details) if details else None,
+        "source": source,
+        "graded_at": graded_at or int(time.time())
+    }
+
+def new_submission_id(question_id, student_id, timestamp):
+    """
+    Build the id of a new submission: "<question>_<timestamp>_<student>_<random>".
+    Imported Submissions/*.json files keep their "<question>_<timestamp>" names.
+
+    Args:
+        question_id (str): The question
+        student_id (str): The submitting student (None if anonymous)
+        timestamp (int): Unix time of the submission
+    Returns:
+        str: The id
+    """
+    # Student ids are free-form; keep the id usable in a URL path segment
+    student = re.sub(r'[^A-Za-z0-9.-]+', '-', str(student_id))[:64] if student_id else 'anon'
+    return f"{question_id}_{timestamp}_{student}_{secrets.token_hex(4)}"
+
+def next_submission_seq():
+    """
+    The seq of the next inserted submission, as a subquery evaluated by the
+    INSERT itself (under the database's write lock, so concurrent inserts from
+    other server processes can't take the same number).
+    """
+    return select(func.coalesce(func.max(Submission.seq), 0) + 1).scalar_subquery()
+
+def record_submission(submission_id, data, path=None, score=None, grade=None):
+    """
+    Index a new submission.
+
+    Args:
+        submission_id (str): The submission id (see new_submission_id())
+        data (dict): The submitted payload, including its timestamp
+        path (str): Where the JSON payload was written (default: store it in the blob store)
+        score (float): The grade, if it has been graded
+        grade (dict): The full grade_submission result, stored in the same transaction
+    Raises:
+        sqlalchemy.exc.IntegrityError: If a submission with this id exists
+    """
+    submission = Submission(
+        id=submission_id,
+        question_id=data.get('questionId'),
+        student_id=data.get('studentId'),
+        timestamp=data.get('timestamp'),
+        seq=next_submission_seq(),
+        code=data.get('code') or '',
+        path=os.path.relpath(path, SUBMISSIONS_DIR) if path else None,
+        score=score
+    )
+    if path is None:
+        store_payload(submission, data)
+    db.session.add(submission)
+    index_submissions([(submission_id, submission.question_id, submission.student_id, data.get('code') or '')])
+    count_submissions([(submission.question_id, submission.student_id)])
+    if grade is not None:
+        db.session.add(Grade(**grade_row(submission_id, submission.question_id, grade, 'submit')))
+        count_grades([(submission_id, submission.question_id, grade.get("score"), grade.get("details"))])
+    db.session.commit()
+    return submission
+
+def record_grade(submission_id, question_id, grade, source):
+    """
+    Store a grade of an indexed submission and make it the submission's score.
+
+    Returns:
+        bool: False if the submission is not in the index
+    """
+    updated = Submission.query.filter_by(id=submission_id).update({"score": grade.get("score")})
+    if updated:
+        db.session.add(Grade(**grade_row(submission_id, question_id, grade, source)))
+        count_grades([(submission_id, question_id, grade.get("score"), grade.get("details"))])
+    db.session.commit()
+    return bool(updated)
+
+def record_grades(rows, batch_size=500):
+    """
+    Bulk-insert `grade` rows (see grade_row()) with multi-row INSERTs.
+    """
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        db.session.execute(insert(Grade), batch)
+        count_grades([(row["submission_id"], row["question_id"], row["score"],
+                       json.loads(row["details"]) if row["details"] else None) for row in batch])
+    db.session.commit()
+
+def question_grades(question_id, version=None, before=None, limit=GRADES_PAGE_SIZE):
+    """
+    Return one page of a question's grades, newest first.
+
+    Args:
+        question_id (str): The ID of the question
+        version (int): Only grades against this reference version
+        before (tuple): (graded_at, grade id) cursor of the last row of the previous page
+        limit (int): Page size
+    Returns:
+        list: Grade rows
+    """
+    query = Grade.query.filter_by(question_id=question_id)
+    if version is not None:
+        query = query.filter_by(reference_version=version)
+    if before is not None:
+        graded_at, grade_id = before
+        query = query.filter(or_(
+            Grade.graded_at < graded_at,
+            and_(Grade.graded_at == graded_at, Grade.id < grade_id)
+        ))
+    return query.order_by(Grade.graded_at.desc(), Grade.id.desc()).limit(limit).all()
+
+def set_submission_score(submission_id, score):
+    """
+    Store the grade of an indexed submission.
+
+    Returns:
+        bool: False if the submission is not in the index
+    """
+    updated = Submission.query.filter_by(id=submission_id).update({"score": score})
+    db.session.commit()
+    return bool(updated)
+
+def get_submission(submission_id):
+    """Return the Submission row with this id, or None."""
+    return db.session.get(Submission, submission_id)
+
+def latest_submission(question_id, student_id=None):
+    """
+    Return the newest Submission for a question (optionally for one student), or None.
+    """
+    query = Submission.query.filter_by(question_id=question_id)
+    if student_id is not None:
+        query = query.filter_by(student_id=student_id)
+    return query.order_by(Submission.timestamp.desc(), Submission.seq.desc()).first()
+
+def _history_query(question_id, student_id=None, before=None, fields='code'):
+    query = Submission.query.filter_by(question_id=question_id)
+    if student_id is not None:
+        query = query.filter_by(student_id=student_id)
+    if before is not None:
+        timestamp, submission_id = before
+        seq = select(Submission.seq).where(Submission.id == submission_id).scalar_subquery()
+        query = query.filter(or_(
+            Submission.timestamp < timestamp,
+            and_(Submission.timestamp == timestamp, Submission.seq < seq)
+        ))
+    if fields == 'metadata':
+        # Leave inline code (imported submissions) in the database
+        query = query.options(load_only(Submission.id, Submission.question_id, Submission.student_id,
+                                        Submission.timestamp, Submission.score))
+    return query.order_by(Submission.timestamp.desc(), Submission.seq.desc())
+
+def submission_history(question_id, student_id=None, before=None, limit=HISTORY_PAGE_SIZE, fields='code'):
+    """
+    Return one page of a question's submissions, newest first.
+
+    Args:
+        question_id (str): The ID of the question
+        student_id (str): Only this student's submissions, if given
+        before (tuple): (timestamp, submission_id) cursor of the last row of the previous page
+        limit (int): Page size
+        fields (str): 'metadata' loads only the row metadata
+    Returns:
+        list: Submission rows
+    """
+    return _history_query(question_id, student_id, before, fields).limit(limit).all()
+
+def iter_submission_history(question_id, student_id=None, before=None, limit=None, fields='code', batch_size=200):
+    """
+    Like submission_history(), but streams the submissions (all remaining ones unless
+    limit is given) in batches of batch_size rows.
+    """
+    query = _history_query(question_id, student_id, before, fields)
+    if limit is not None:
+        query = query.limit(limit)
+    yield from query.yield_per(batch_size)
+
+def submission_record(submission, fields='metadata'):
+    """
+    The JSON of a submission for the submissions route.
+
+    Args:
+        submission (Submission): The row
+        fields (str): One of SUBMISSION_FIELDS
+    Returns:
+        dict: The submission's metadata, with its code or its whole payload if asked for
+    """
+    if fields != 'payload':
+        return submission.to_dict(include_code=fields == 'code')
+    data = submission.to_dict(include_code=False)
+    try:
+        payload = load_submission_payload(submission)
+    except (OSError, TypeError, KeyError, ValueError):
+        data["payloadMissing"] = True
+        return data
+    for key in ('code', 'schema', 'relationships'):
+        data[key] = payload.get(key)
+    return data
+
+def iter_submissions(question_ids=None, batch_size=500):
+    """
+    Stream Submission rows (oldest first) without loading them all at once.
+
+    Rows are read a page at a time (keyset pagination, no cursor is left open)
+    and detached from the session, so the caller can commit between them.
+    """
+    after = None
+    while True:
+        query = Submission.query
+        if question_ids:
+            query = query.filter(Submission.question_id.in_(question_ids))
+        if after is not None:
+            question_id, timestamp, seq = after
+            query = query.filter(or_(
+                Submission.question_id > question_id,
+                and_(Submission.question_id == question_id, Submission.timestamp > timestamp),
+                and_(Submission.question_id == question_id, Submission.timestamp == timestamp,
+                     Submission.seq > seq)
+            ))
+        page = query.order_by(Submission.question_id, Submission.timestamp, Submission.seq).limit(batch_size).all()
+        for submission in page:
+            db.session.expunge(submission)
+        yield from page
+        if len(page) < batch_size:
+            return
+        last = page[-1]
+        after = (last.question_id, last.timestamp, last.seq)
+
+def load_submission_payload(submission):
+    """
+    Load the full JSON payload (code, schema, relationships) of a Submission row.
+    """
+    if submission.payload_hash is not None:
+        return load_payload(submission)
+    with open(os.path.join(SUBMISSIONS_DIR, submission.path), 'r') as f:
+        return json.load(f)
+
+def import_submission_files(submissions_dir=SUBMISSIONS_DIR, batch_size=500):
+    """
+    Index every Submissions/<question>/*.json file that is not in the table yet.
+
+    Returns:
+        int: The number of submissions imported
+    """
+    known = {row.id for row in db.session.query(Submission.id)}
+    imported = 0
+    batch = []
+    if not os.path.isdir(submissions_dir):
+        return imported
+
+    for question_id in sorted(os.listdir(submissions_dir)):
+        question_dir = os.path.join(submissions_dir, question_id)
+        if not os.path.isdir(question_dir):
+            continue
+        for filename in sorted(os.listdir(question_dir)):
+            submission_id, ext = os.path.splitext(filename)
+            if ext != '.json' or submission_id in known:
+                continue
+            path = os.path.join(question_dir, filename)
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Skipping unreadable submission {path}: {e}")
+                continue
+            data.setdefault('questionId', question_id)
+            if 'timestamp' not in data:
+                data['timestamp'] = int(submission_id.rsplit('_', 1)[-1])
+            db.session.add(Submission(
+                id=submission_id,
+                question_id=data['questionId'],
+                student_id=data.get('studentId'),
+                timestamp=data['timestamp'],
+                seq=next_submission_seq(),
+                code=data.get('code') or '',
+                path=os.path.relpath(path, submissions_dir)
+            ))
+            batch.append((submission_id, data['questionId'], data.get('studentId'), data.get('code') or ''))
+            imported += 1
+            if imported % batch_size == 0:
+                count_submissions([(question_id, student_id) for _, question_id, student_id, _ in batch])
+                index_submissions(batch)
+                db.session.commit()
+                batch = []
+    count_submissions([(question_id, student_id) for _, question_id, student_id, _ in batch])
+    index_submissions(batch)
+    db.session.commit()
+    return imported
+
+def setup_submission_store(app):
+    """
+    Register the submission store's routes and CLI commands.
+
+    Args:
+        app: The Flask application
+    """
+    @app.route('/api/question/<question_id>/grades', methods=['GET'])
+    def get_question_grades(question_id):
+        try:
+            version = request.args.get('version', type=int)
+            limit = min(max(int(request.args.get('limit', GRADES_PAGE_SIZE)), 1), MAX_GRADES_PAGE_SIZE)
+            before = request.args.get('before')
+            if before:
+                graded_at, grade_id = before.split(':', 1)
+                before = (int(graded_at), int(grade_id))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer and before a <gradedAt>:<id> cursor"}), 400
+
+        grades = question_grades(question_id, version, before or None, limit)
+        return jsonify({
+            "questionId": question_id,
+            "grades": [grade.to_dict() for grade in grades],
+            "next": f"{grades[-1].graded_at}:{grades[-1].id}" if len(grades) == limit else None
+        })
+
+    @app.route('/api/question/<question_id>/submissions', methods=['GET'])
+    def get_question_submissions(question_id):
+        student_id = request.args.get('studentId')
+        fields = request.args.get('fields', 'metadata')
+        if fields not in SUBMISSION_FIELDS:
+            return jsonify({"error": f"fields must be one of {', '.join(SUBMISSION_FIELDS)}"}), 400
+        stream = (request.args.get('format') == 'ndjson'
+                  or request.accept_mimetypes.best == 'application/x-ndjson')
+        try:
+            # A stream runs to the end of the history unless it is given a limit
+            limit = request.args.get('limit', None if stream else HISTORY_PAGE_SIZE)
+            limit = min(max(int(limit), 1), MAX_HISTORY_PAGE_SIZE) if limit is not None else None
+            before = request.args.get('before')
+            if before:
+                timestamp, submission_id = before.split(':', 1)
+                before = (int(timestamp), submission_id)
+        except ValueError:
+            return jsonify({"error": "limit must be an integer and before a <timestamp>:<submissionId> cursor"}), 400
+
+        if stream:
+            def lines():
+                # One row batch in memory at a time, however long the history
+                for submission in iter_submission_history(question_id, student_id, before or None, limit, fields):
+                    yield json.dumps(submission_record(submission, fields)) + '\n'
+            return Response(stream_with_context(lines()), mimetype='application/x-ndjson',
+                            headers={'X-Accel-Buffering': 'no'})
+
+        submissions = submission_history(question_id, student_id, before or None, limit, fields)
+        return jsonify({
+            "questionId": question_id,
+            "submissions": [submission_record(submission, fields) for submission in submissions],
+            "next": (f"{submissions[-1].timestamp}:{submissions[-1].id}"
+                     if len(submissions) == limit else None)
+        })
+
+    @app.cli.command('import-submissions')
+    def import_submissions_command():
+        """Index the existing Submissions/*/*.json files."""
+        imported = import_submission_files()
+        click.echo(f"Imported {imported} submissions")
+
+    @app.cli.command('pack-submissions')
+    @click.option('--question', 'questions', multiple=True, help='Question to pack (repeatable, default: all).')
+    @click.option('--delete-files', is_flag=True, help='Delete the JSON files once their blobs are stored.')
+    def pack_submissions_command(questions, delete_files):
+        """Move imported Submissions/*/*.json payloads into the blob store."""
+        summary = pack_submissions(SUBMISSIONS_DIR, list(questions), delete_files)
+        click.echo(f"Packed {summary['packed']} submissions ({summary['missing']} unreadable): "
+                   f"{summary['file_bytes']} bytes of JSON stored in {summary['blob_bytes']} bytes of blobs")
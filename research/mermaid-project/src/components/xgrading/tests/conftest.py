@@ -0,0 +1,42 @@
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The server modules import each other by their flat names and read their
+# configuration from the environment at import time
+XGRADING_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, XGRADING_DIR)
+
+TEST_DIR = tempfile.mkdtemp(prefix='xgrading-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TEST_DIR, 'test.db')}"
+os.environ.setdefault('XGRADING_SANDBOX_LOCK_DIR', os.path.join(TEST_DIR, 'sandbox-slots'))
+
+SUBMISSIONS_DIR = os.path.join(XGRADING_DIR, 'Submissions')
+
+@pytest.fixture(scope='session')
+def app():
+    from flask_migrate import upgrade
+    from server import app
+
+    with app.app_context():
+        upgrade(directory=os.path.join(XGRADING_DIR, 'migrations'))
+    return app
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture(scope='session')
+def fish_store_payload():
+    """A stored Fish Store submission payload (code, schema, relationships)."""
+    question_dir = os.path.join(SUBMISSIONS_DIR, 'Fish Store')
+    with open(os.path.join(question_dir, sorted(os.listdir(question_dir))[0]), 'r') as f:
+        return json.load(f)
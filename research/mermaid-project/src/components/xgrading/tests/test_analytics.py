@@ -0,0 +1,81 @@
+import pytest
+
+from analytics import missing_items, question_analytics, rebuild_analytics
+from submission_store import new_submission_id, record_grade, record_submission
+
+def grade(score, *missing_relationships):
+    return {"score": score, "details": {"relationship_score": {
+        "feedback": [f"✗ Missing relationship: {relationship}" for relationship in missing_relationships]
+    }}}
+
+def missing_relationships(analytics):
+    return {row["item"]: row["count"] for row in analytics["missing"]["relationship"]}
+
+@pytest.fixture
+def question_id(app_context, request):
+    return f"analytics-{request.node.name}"
+
+def submit(question_id, student_id, result, timestamp=1700000000):
+    submission_id = new_submission_id(question_id, student_id, timestamp)
+    record_submission(submission_id, {"questionId": question_id, "studentId": student_id,
+                                      "timestamp": timestamp, "code": "class A {}"},
+                      score=result["score"], grade=result)
+    return submission_id
+
+def test_missing_items_keys():
+    details = {
+        "entity_score": {"feedback": ["✗ Missing required entity: Tank",
+                                      "✗ Entity Fish is missing attribute: name",
+                                      "✓ Found entity: Fish"]},
+        # The "no relationships defined" path keeps the reference's case
+        "relationship_score": {"feedback": ["✗ Missing relationship: Association between Fish and Tank",
+                                            "✗ Missing relationship: association between fish and tank"]},
+        "method_score": {"feedback": ["✗ Class Fish is missing required method: swim"]}
+    }
+    assert missing_items(details) == [
+        ['attribute', 'Fish.name'],
+        ['entity', 'Tank'],
+        ['method', 'Fish.swim'],
+        ['relationship', 'association between fish and tank']
+    ]
+    assert missing_items(None) == []
+
+def test_counts_are_upserted_per_question(question_id):
+    submit(question_id, 'student-1', grade(35, "Association between Fish and Tank"))
+    submit(question_id, 'student-1', grade(72, "association between fish and tank"))
+    submit(question_id, 'student-2', grade(100))
+
+    analytics = question_analytics(question_id)
+    assert analytics["submissions"] == 3
+    assert analytics["graded"] == 3
+    assert analytics["students"] == 2
+    assert analytics["resubmissions"] == 1
+    assert analytics["meanScore"] == 69.0
+    histogram = {row["range"]: row["count"] for row in analytics["scoreHistogram"] if row["count"]}
+    assert histogram == {"30-39": 1, "70-79": 1, "90-100": 1}
+    assert missing_relationships(analytics) == {"association between fish and tank": 2}
+    assert {row["attempts"]: row["students"] for row in analytics["attempts"]} == {"1": 1, "2": 1}
+
+def test_regrade_replaces_a_submissions_contribution(question_id):
+    submission_id = submit(question_id, 'student-1', grade(35, "Association between Fish and Tank"))
+    assert record_grade(submission_id, question_id, grade(80), 'regrade')
+
+    analytics = question_analytics(question_id)
+    assert analytics["graded"] == 1
+    assert analytics["meanScore"] == 80.0
+    assert missing_relationships(analytics) == {}
+
+def test_rebuild_matches_the_incremental_counts(question_id):
+    submission_id = submit(question_id, 'student-1', grade(35, "Association between Fish and Tank"))
+    submit(question_id, 'student-2', grade(55, "association between fish and tank"))
+    record_grade(submission_id, question_id, grade(45, "Aggregation between Tank and Store"), 'regrade')
+    incremental = question_analytics(question_id)
+
+    rebuild_analytics([question_id])
+    assert question_analytics(question_id) == incremental
+
+def test_analytics_route(client):
+    response = client.get('/api/analytics/Banks?top=3')
+    assert response.status_code == 200
+    assert response.get_json()["questionId"] == 'Banks'
+    assert client.get('/api/analytics/Banks?top=many').status_code == 400
@@ -0,0 +1,22 @@
+import json
+import os
+
+from bench_grading import GOLDEN_FILE, grade_stored_submissions
+
+def test_stored_submissions_grade_as_recorded(app_context):
+    with open(GOLDEN_FILE, 'r') as f:
+        golden = json.load(f)
+    current = grade_stored_submissions()
+
+    assert set(golden) <= set(current)
+    changed = {submission_id: (expected, current[submission_id])
+               for submission_id, expected in golden.items() if current[submission_id] != expected}
+    assert not changed
+
+def test_golden_file_covers_every_stored_submission():
+    submissions_dir = os.path.join(os.path.dirname(GOLDEN_FILE), 'Submissions')
+    stored = {os.path.splitext(name)[0]
+              for question_id in os.listdir(submissions_dir)
+              for name in os.listdir(os.path.join(submissions_dir, question_id)) if name.endswith('.json')}
+    with open(GOLDEN_FILE, 'r') as f:
+        assert set(json.load(f)) == stored
@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+from grading_queue import grading_queue
+from submission_store import new_submission_id, record_submission
+
+@pytest.fixture
+def queue_full(monkeypatch):
+    monkeypatch.setattr(grading_queue.store, 'max_depth', 0)
+
+@pytest.fixture
+def ungraded(app_context, fish_store_payload):
+    # Stored without a grading job, as when its enqueue found the queue full
+    timestamp = int(time.time())
+    submission_id = new_submission_id('Fish Store', 'queue-test', timestamp)
+    record_submission(submission_id, dict(fish_store_payload, timestamp=timestamp))
+    return submission_id
+
+def test_async_submit_is_queued_then_graded(client, fish_store_payload):
+    response = client.post('/api/submit', json=dict(fish_store_payload, studentId='queue-test', **{"async": True}))
+    assert response.status_code == 202
+    body = response.get_json()
+    assert body["status"] == 'queued'
+
+    response = client.get(f"{body['gradeUrl']}?wait=20")
+    assert response.status_code == 200
+    assert response.get_json()["status"] == 'done'
+    assert response.get_json()["grade"]["score"] is not None
+
+def test_async_submit_to_a_full_queue_is_refused(client, fish_store_payload, queue_full):
+    response = client.post('/api/submit', json=dict(fish_store_payload, **{"async": True}))
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
+    assert response.get_json()["retryAfter"]
+
+def test_ungraded_submission_without_a_job_is_requeued(client, ungraded):
+    response = client.get(f"/api/submission/{ungraded}/grade")
+    assert response.status_code == 202
+    assert response.get_json()["status"] == 'queued'
+    assert grading_queue.result(ungraded) is not None
+
+    response = client.get(f"/api/submission/{ungraded}/grade?wait=20")
+    assert response.get_json()["status"] == 'done'
+
+def test_ungraded_submission_with_a_full_queue_answers_503(client, ungraded, queue_full):
+    response = client.get(f"/api/submission/{ungraded}/grade")
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
+
+def test_unknown_submission_is_404(client):
+    assert client.get("/api/submission/no-such-submission/grade").status_code == 404
+
+def test_wait_must_be_a_number(client):
+    assert client.get("/api/submission/no-such-submission/grade?wait=soon").status_code == 400
@@ -0,0 +1,57 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import regrade
+from models import Submission
+from regrade import checkpoint_path, regrade_submissions
+from submission_store import import_submission_files
+
+QUESTION = 'Fish Store'
+
+@pytest.fixture
+def stored(app_context, monkeypatch, tmp_path):
+    import_submission_files()
+    monkeypatch.setattr(regrade, 'CHECKPOINT_DIR', str(tmp_path))
+    return [row.id for row in Submission.query.filter_by(question_id=QUESTION).order_by(Submission.seq)]
+
+def test_checkpoint_is_keyed_by_questions_and_references(app_context, monkeypatch, tmp_path):
+    path = checkpoint_path([QUESTION], str(tmp_path))
+    assert path == checkpoint_path([QUESTION], str(tmp_path))
+    assert path != checkpoint_path(['Banks'], str(tmp_path))
+
+    monkeypatch.setattr(regrade, 'get_reference_solution', lambda question_id: SimpleNamespace(content_hash='edited'))
+    assert path != checkpoint_path([QUESTION], str(tmp_path))
+
+def test_completed_run_is_rotated_and_not_resumed(stored, tmp_path):
+    first = regrade_submissions([QUESTION], workers=1)
+    second = regrade_submissions([QUESTION], workers=1)
+
+    assert first["regraded"] == second["regraded"] == len(stored)
+    assert first["skipped"] == second["skipped"] == 0
+    assert first["output"] != second["output"]
+    assert not os.path.exists(checkpoint_path([QUESTION]))
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(s["output"]) for s in (first, second))
+
+def test_interrupted_run_resumes_and_counts_only_skipped_ids(stored):
+    done = stored[:3]
+    with open(checkpoint_path([QUESTION]), 'w') as f:
+        for submission_id in done + ['from-another-question']:
+            f.write(json.dumps({"submissionId": submission_id}) + '\n')
+        # Cut off by the interruption
+        f.write('{"submissionId": ')
+
+    summary = regrade_submissions([QUESTION], workers=1)
+    assert summary["skipped"] == len(done)
+    assert summary["regraded"] == len(stored) - len(done)
+
+def test_explicit_output_keeps_resuming(stored, tmp_path):
+    output = str(tmp_path / 'results.jsonl')
+    regrade_submissions([QUESTION], workers=1, output_path=output)
+    summary = regrade_submissions([QUESTION], workers=1, output_path=output)
+
+    assert summary["output"] == output
+    assert summary["skipped"] == len(stored)
+    assert summary["regraded"] == 0
@@ -0,0 +1,27 @@
+import sys
+
+import pytest
+
+from sandbox import SANDBOX_ADDRESS_SPACE_MB, SANDBOX_CPU_SECONDS, SANDBOX_FILE_SIZE_MB, sandbox
+
+# The limits are POSIX rlimits
+pytest.importorskip('resource')
+
+def test_processes_run_under_the_limits_in_their_own_session():
+    result = sandbox.run([sys.executable, '-c', (
+        "import os, resource\n"
+        "print(resource.getrlimit(resource.RLIMIT_AS)[0], resource.getrlimit(resource.RLIMIT_CPU)[0],\n"
+        "      resource.getrlimit(resource.RLIMIT_FSIZE)[0], resource.getrlimit(resource.RLIMIT_CORE)[0],\n"
+        "      os.getsid(0) == os.getpid(), os.path.basename(os.getcwd()).startswith('job-'))"
+    )])
+    assert result.returncode == 0
+    assert result.stdout.split() == [str(SANDBOX_ADDRESS_SPACE_MB * 1024 * 1024), str(SANDBOX_CPU_SECONDS),
+                                     str(SANDBOX_FILE_SIZE_MB * 1024 * 1024), '0', 'True', 'True']
+
+def test_files_are_written_to_the_working_directory():
+    result = sandbox.run([sys.executable, 'main.py'], {'main.py': "print('hello')"})
+    assert result.stdout == 'hello\n'
+
+def test_missing_tool_raises_like_popen():
+    with pytest.raises(FileNotFoundError):
+        sandbox.run(['no-such-compiler', 'Main.java'])
@@ -0,0 +1,55 @@
+import pytest
+
+from submission_store import (iter_submission_history, iter_submissions, latest_submission, new_submission_id,
+                              record_submission, submission_history)
+
+TIMESTAMP = 1700000000
+
+@pytest.fixture
+def same_second(app_context, request):
+    # Many submissions of one student within the same second, in submission order
+    question_id = f"order-{request.node.name}"
+    ids = []
+    for attempt in range(12):
+        submission_id = new_submission_id(question_id, 'student-1', TIMESTAMP)
+        record_submission(submission_id, {"questionId": question_id, "studentId": 'student-1',
+                                          "timestamp": TIMESTAMP, "code": f"class A{attempt} {{}}"})
+        ids.append(submission_id)
+    return question_id, ids
+
+def test_latest_submission_is_the_last_one_of_the_second(same_second):
+    question_id, ids = same_second
+    assert latest_submission(question_id).id == ids[-1]
+    assert latest_submission(question_id, 'student-1').id == ids[-1]
+
+def test_history_pages_cover_every_submission_newest_first(same_second):
+    question_id, ids = same_second
+    seen = []
+    page = submission_history(question_id, limit=5)
+    while page:
+        seen += [submission.id for submission in page]
+        page = submission_history(question_id, before=(page[-1].timestamp, page[-1].id), limit=5)
+    assert seen == ids[::-1]
+    assert [submission.id for submission in iter_submission_history(question_id, batch_size=5)] == ids[::-1]
+
+def test_iter_submissions_streams_oldest_first(same_second):
+    question_id, ids = same_second
+    assert [submission.id for submission in iter_submissions([question_id], batch_size=5)] == ids
+
+def test_history_route_cursor(same_second, client):
+    question_id, ids = same_second
+    seen = []
+    url = f"/api/question/{question_id}/submissions?limit=5&fields=metadata"
+    cursor = None
+    while True:
+        response = client.get(url + (f"&before={cursor}" if cursor else ''))
+        assert response.status_code == 200
+        body = response.get_json()
+        seen += [submission["submissionId"] for submission in body["submissions"]]
+        cursor = body["next"]
+        if cursor is None:
+            break
+    assert seen == ids[::-1]
+
+def test_history_route_rejects_a_bad_cursor(client):
+    assert client.get("/api/question/Banks/submissions?before=yesterday").status_code == 400
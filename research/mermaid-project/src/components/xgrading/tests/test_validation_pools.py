@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+
+import validate
+from java_compiler import JavaCompilerPool
+from pylint_pool import PylintPool
+from sandbox import sandbox
+from validation_sessions import ValidationSuperseded, validation_sessions
+
+# Keeps a pylint worker busy for a few seconds
+SLOW_LINT = '\n'.join(f"def f{i}(a, b):\n    return [a + b for _ in range(a)]\n" for i in range(1500))
+
+def wait_until(condition, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+def in_thread(fn, *args):
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = fn(*args)
+        except Exception as e:
+            outcome["error"] = e
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+class FakeCompiler:
+    """Stands in for a CompileServer JVM: compiles when released."""
+    def __init__(self):
+        self.release = threading.Event()
+
+    def compile(self, code):
+        assert self.release.wait(10)
+        return True, []
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def java_pool(monkeypatch):
+    pool = JavaCompilerPool(size=1)
+    worker = FakeCompiler()
+    pool._idle.put(worker)
+    pool._workers = 1
+    monkeypatch.setattr(validate, 'get_java_compiler_pool', lambda: pool)
+    return pool, worker
+
+@pytest.fixture(scope='module')
+def pylint_pool():
+    pool = PylintPool(size=1)
+    pool.start()
+    pool.lint('x = 1\n')
+    yield pool
+    pool.close()
+
+def test_superseded_compile_waiting_for_a_worker_takes_no_slot(java_pool):
+    pool, worker = java_pool
+    running = sandbox.running
+    first, first_outcome = in_thread(validate.compile_java, 'class A {}', validation_sessions.begin('java-a', 1))
+    wait_until(lambda: sandbox.running == running + 1)
+
+    waiting, waiting_outcome = in_thread(validate.compile_java, 'class B {}', validation_sessions.begin('java-b', 1))
+    time.sleep(0.2)
+    validation_sessions.begin('java-b', 2)
+    waiting.join(5)
+    assert isinstance(waiting_outcome.get("error"), ValidationSuperseded)
+    assert sandbox.running == running + 1
+
+    worker.release.set()
+    first.join(5)
+    assert first_outcome["result"] == (True, [])
+    assert sandbox.running == running
+    assert pool._idle.qsize() == 1
+
+def test_superseded_lint_keeps_its_worker_and_slot_until_the_job_ends(pylint_pool, monkeypatch):
+    monkeypatch.setattr(validate, 'get_pylint_pool', lambda: pylint_pool)
+    running = sandbox.running
+    ticket = validation_sessions.begin('lint-a', 1)
+    threading.Timer(0.3, validation_sessions.begin, ('lint-a', 2)).start()
+
+    started = time.monotonic()
+    with pytest.raises(ValidationSuperseded):
+        validate.run_pylint(SLOW_LINT, ticket)
+    assert time.monotonic() - started < 2
+    # The job is still running on the only worker
+    assert pylint_pool._free._value == 0
+    assert sandbox.running == running + 1
+
+    # A lint queued behind it gives up when it is superseded too
+    queued, queued_outcome = in_thread(validate.run_pylint, 'x = 1\n', validation_sessions.begin('lint-b', 1))
+    time.sleep(0.2)
+    validation_sessions.begin('lint-b', 2)
+    queued.join(5)
+    assert isinstance(queued_outcome.get("error"), ValidationSuperseded)
+
+    wait_until(lambda: pylint_pool._free._value == 1 and sandbox.running == running)
+    assert validate.run_pylint('x = 1\n') is not None
@@ -1,10 +1,366 @@
-import subprocess
-import tempfile
-import os
+import contextlib
 import re
 import ast
 import json
 from flask import jsonify, request
+from metrics import count_request, stage_timer
+from java_compiler import JVM_OPTIONS, CompilerUnavailable, get_java_compiler_pool, source_class_name
+from pylint_pool import MODULE_NAME, LinterUnavailable, get_pylint_pool
+from sandbox import (SandboxBusy, SandboxTimeout, sandbox, sandbox_busy_response,
+                     sandbox_timeout_response)
+from validation_cache import UncacheableResponse, validation_cache
+from validation_sessions import ValidationSuperseded, validation_sessions
+
+JAVAC_ERROR_PATTERN = re.compile(r'(.+\.java):(\d+): error: (.*)')
+JAVAC_WARNING_PATTERN = re.compile(r'(.+\.java):(\d+): warning: (.*)')
+# The one-off javac gets the same small JVM as the warm workers
+JAVAC_JVM_OPTIONS = [f'-J{option}' for option in JVM_OPTIONS]
+
+def validation_timer(language, stage):
+    # Stage timings are labelled with the route that runs them
+    return stage_timer(f'/api/validate/{language}', stage, language=language)
+
+def parse_javac_output(stderr):
+    """
+    Parse javac's stderr into {line, message, severity} entries.
+    """
+    errors = []
+    for line in stderr.split('\n'):
+        error_match = JAVAC_ERROR_PATTERN.search(line)
+        warning_match = JAVAC_WARNING_PATTERN.search(line)
+        
+        if error_match:
+            errors.append({
+                "line": int(error_match.group(2)),
+                "message": error_match.group(3),
+                "severity": "error"
+            })
+        elif warning_match:
+            errors.append({
+                "line": int(warning_match.group(2)),
+                "message": warning_match.group(3),
+                "severity": "warning"
+            })
+    return errors
+
+@contextlib.contextmanager
+def sandbox_slot(language, ticket=None):
+    """Hold a sandbox slot for a compile/lint, timing the wait for it."""
+    with contextlib.ExitStack() as stack:
+        with validation_timer(language, 'sandbox_wait'):
+            stack.enter_context(sandbox.slot(ticket))
+        yield
+
+@contextlib.contextmanager
+def pool_worker(language, checkout, ticket=None):
+    """
+    Hold a warm pool worker and then a sandbox slot, timing the waits for them.
+
+    The worker comes first: a request queued for one of the few warm workers must
+    not sit on a host-wide sandbox slot that other requests could use.
+    """
+    with contextlib.ExitStack() as stack:
+        with validation_timer(language, 'pool_wait'):
+            worker = stack.enter_context(checkout)
+        stack.enter_context(sandbox_slot(language, ticket))
+        yield worker
+
+def compile_java_subprocess(code, ticket=None):
+    """
+    Compile code by running javac in a sandbox.
+    
+    The caller must hold a sandbox slot.
+    
+    Returns:
+        tuple: (success, errors)
+    """
+    # Named after the public class, as javac requires; the working directory is private
+    source_file = f"{source_class_name(code)}.java"
+    with validation_timer('java', 'process'):
+        result = sandbox.run(['javac'] + JAVAC_JVM_OPTIONS + [source_file], {source_file: code}, ticket)
+    with validation_timer('java', 'parse_output'):
+        return result.returncode == 0, parse_javac_output(result.stderr)
+
+def compile_java(code, ticket=None):
+    """
+    Compile Java code on the warm compiler pool, falling back to a javac process.
+    
+    Returns:
+        tuple: (success, errors)
+    Raises:
+        SandboxBusy: If every sandbox slot stayed taken
+        SandboxTimeout: If the compile ran past the sandbox timeout
+    """
+    pool = get_java_compiler_pool()
+    if pool is not None:
+        try:
+            with pool_worker('java', pool.checkout(ticket), ticket) as worker:
+                with validation_timer('java', 'compiler_pool'):
+                    return worker.compile(code)
+        except CompilerUnavailable as e:
+            print(f"Warm Java compiler failed, falling back to javac: {e}")
+    with sandbox_slot('java', ticket):
+        return compile_java_subprocess(code, ticket)
+
+def pylint_issues_to_errors(pylint_results):
+    """
+    Map pylint's JSON messages onto {line, message, severity} entries.
+    """
+    errors = []
+    for issue in pylint_results:
+        severity = "warning"
+        if issue.get('type') in ['error', 'fatal']:
+            severity = "error"
+        elif issue.get('type') in ['convention', 'refactor']:
+            severity = "info"
+        
+        errors.append({
+            "line": issue.get('line', 1),
+            "message": issue.get('message', 'Unknown issue'),
+            "severity": severity
+        })
+    return errors
+
+def run_pylint_subprocess(code, ticket=None):
+    """
+    Lint code by running pylint in a sandbox.
+    
+    The caller must hold a sandbox slot.
+    
+    Returns:
+        list: pylint's JSON messages, or None if pylint is not available or its output can't be parsed
+    """
+    # Run pylint to check the code
+    with validation_timer('python', 'process'):
+        result = sandbox.run(['pylint', '--output-format=json', MODULE_NAME], {MODULE_NAME: code}, ticket)
+    
+    if result.returncode != 0 and 'command not found' in result.stderr:
+        return None
+    
+    # Parse pylint JSON output
+    try:
+        with validation_timer('python', 'parse_json'):
+            return json.loads(result.stdout)
+    except ValueError:
+        # Killed (e.g. by the memory limit) or crashed: no messages we can trust
+        return None
+
+def run_pylint(code, ticket=None):
+    """
+    Lint Python code on the pylint worker pool, falling back to a pylint process.
+    
+    Returns:
+        list: pylint's JSON messages, or None if pylint is not available or its output can't be parsed
+    Raises:
+        SandboxBusy: If every sandbox slot stayed taken
+        SandboxTimeout: If the lint ran past the sandbox timeout
+    """
+    pool = get_pylint_pool()
+    if pool is not None:
+        try:
+            with contextlib.ExitStack() as hold:
+                hold.enter_context(pool_worker('python', pool.reserve(ticket=ticket), ticket))
+                with validation_timer('python', 'pylint_pool'):
+                    # A lint abandoned mid-job keeps its reservation and slot until the worker is done
+                    return pool.lint(code, ticket=ticket, hold=hold)
+        except LinterUnavailable as e:
+            print(f"pylint pool failed, falling back to a pylint process: {e}")
+    with sandbox_slot('python', ticket):
+        return run_pylint_subprocess(code, ticket)
+
+def validate_java(code, ticket=None):
+    """
+    Compile Java code and build the /api/validate/java response.
+    
+    Returns:
+        dict: {"success": bool, "errors": [{line, message, severity}]}
+    Raises:
+        UncacheableResponse: If javac failed without reporting errors (e.g. it was killed)
+    """
+    success, errors = compile_java(code, ticket)
+    
+    # If compilation succeeded with no errors
+    if success:
+        return {
+            "success": True,
+            "errors": [{
+                "line": 1,
+                "message": "Code compiles successfully.",
+                "severity": "info"
+            }]
+        }
+    
+    if not errors:
+        raise UncacheableResponse({
+            "success": False,
+            "errors": [{
+                "line": 1,
+                "message": "Compilation failed with unrecognized errors.",
+                "severity": "error"
+            }]
+        })
+    
+    return {
+        "success": False,
+        "errors": errors
+    }
+
+def python_syntax_errors(code):
+    """
+    Check Python syntax with ast.parse.
+    
+    Returns:
+        list: The syntax error as a {line, message, severity} entry, or [] if the code parses
+    """
+    try:
+        ast.parse(code)
+    except SyntaxError as e:
+        return [{
+            "line": e.lineno,
+            "message": f"Syntax error: {e.msg}",
+            "severity": "error"
+        }]
+    return []
+
+JAVA_BRACKETS = {')': '(', ']': '[', '}': '{'}
+
+def java_syntax_errors(code, max_errors=20):
+    """
+    Cheap structural check of Java code: unbalanced brackets and unterminated
+    comments, strings and character literals. Takes microseconds, so it can
+    answer long before javac does.
+    
+    Returns:
+        list: {line, message, severity} entries, [] if nothing was found
+    """
+    errors = []
+    open_brackets = []  # (bracket, line)
+    line = 1
+    i = 0
+    n = len(code)
+    
+    def error(at_line, message):
+        errors.append({"line": at_line, "message": message, "severity": "error"})
+    
+    while i < n and len(errors) < max_errors:
+        ch = code[i]
+        if ch == '\n':
+            line += 1
+            i += 1
+        elif code.startswith('//', i):
+            end = code.find('\n', i)
+            i = n if end == -1 else end
+        elif code.startswith('/*', i):
+            end = code.find('*/', i + 2)
+            if end == -1:
+                error(line, "Unterminated comment")
+                break
+            line += code.count('\n', i, end)
+            i = end + 2
+        elif code.startswith('"""', i):
+            end = code.find('"""', i + 3)
+            if end == -1:
+                error(line, "Unterminated text block")
+                break
+            line += code.count('\n', i, end)
+            i = end + 3
+        elif ch in '"\'':
+            # Literals end at the matching unescaped quote on the same line
+            end = i + 1
+            while end < n and code[end] not in (ch, '\n'):
+                end += 2 if code[end] == '\\' and code[end + 1:end + 2] not in ('', '\n') else 1
+            if end >= n or code[end] != ch:
+                error(line, "Unterminated string literal" if ch == '"' else "Unterminated character literal")
+                i = end
+            else:
+                i = end + 1
+        else:
+            if ch in '([{':
+                open_brackets.append((ch, line))
+            elif ch in JAVA_BRACKETS:
+                if open_brackets and open_brackets[-1][0] == JAVA_BRACKETS[ch]:
+                    open_brackets.pop()
+                else:
+                    error(line, f"Unexpected '{ch}'")
+            i += 1
+    
+    for bracket, opened_at in open_brackets[:max(0, max_errors - len(errors))]:
+        error(opened_at, f"'{bracket}' is never closed")
+    return sorted(errors, key=lambda e: e["line"])
+
+SYNTAX_CHECKS = {
+    'java': java_syntax_errors,
+    'python': python_syntax_errors,
+}
+
+def validate_python(code, ticket=None):
+    """
+    Syntax-check and lint Python code and build the /api/validate/python response.
+    
+    Returns:
+        dict: {"success": bool, "errors": [{line, message, severity}]}
+    Raises:
+        UncacheableResponse: With the syntax-check-only response, if pylint didn't run
+    """
+    # First, check syntax with ast.parse
+    with validation_timer('python', 'syntax_check'):
+        errors = python_syntax_errors(code)
+    if errors:
+        return {"success": False, "errors": errors}
+    
+    # If syntax is valid, use pylint for more detailed checks
+    pylint_results = run_pylint(code, ticket)
+    
+    # If pylint is not available, we'll just return the basic syntax check
+    if pylint_results is None:
+        raise UncacheableResponse({
+            "success": True,
+            "errors": [{
+                "line": 1,
+                "message": "Basic syntax check passed (pylint not available for detailed analysis)",
+                "severity": "info"
+            }]
+        })
+    
+    with validation_timer('python', 'parse_output'):
+        errors.extend(pylint_issues_to_errors(pylint_results))
+    
+    # If no errors were found by pylint
+    if not errors:
+        errors.append({
+            "line": 1,
+            "message": "Code looks good!",
+            "severity": "info"
+        })
+    
+    return {
+        "success": len([e for e in errors if e['severity'] == 'error']) == 0,
+        "errors": errors
+    }
+
+VALIDATORS = {
+    'java': validate_java,
+    'python': validate_python,
+}
+
+def server_error_response(e):
+    return {
+        "success": False,
+        "errors": [{
+            "line": 1,
+            "message": f"Server error: {str(e)}",
+            "severity": "error"
+        }]
+    }
+
+def superseded_response(sequence):
+    # Cheap reply for a request a newer one from the same editor replaced
+    return {
+        "success": False,
+        "superseded": True,
+        "seq": sequence,
+        "errors": []
+    }
 
 def setup_validation_routes(app):
     """
@@ -13,165 +369,70 @@ def setup_validation_routes(app):
     Args:
         app: The Flask application to add routes to
     """
-    @app.route('/api/validate/java', methods=['POST'])
-    def validate_java_code():
+    def run_validation(language):
+        with validation_timer(language, 'total'):
+            return _run_validation(language)
+
+    def _run_validation(language):
+        endpoint = f'/api/validate/{language}'
         code = request.json.get('code')
         if not code:
+            count_request(endpoint, 'invalid', language=language)
             return jsonify({"errors": [{"line": 1, "message": "No code provided", "severity": "error"}]})
         
-        # Create a temporary Java file
-        with tempfile.NamedTemporaryFile(suffix=".java", delete=False) as temp:
-            temp_filename = temp.name
-            temp.write(code.encode('utf-8'))
+        # Live validations from the editor carry a session id and sequence number
+        session_id = request.json.get('sessionId')
+        sequence = request.json.get('seq')
+        if session_id is not None and sequence is not None:
+            try:
+                sequence = int(sequence)
+            except (TypeError, ValueError):
+                count_request(endpoint, 'invalid', language=language)
+                return jsonify({"errors": [{"line": 1, "message": "seq must be an integer", "severity": "error"}]}), 400
+        ticket = None
         
         try:
-            # Run javac to compile the code
-            result = subprocess.run(['javac', temp_filename], 
-                                capture_output=True, 
-                                text=True)
-            
-            # If compilation succeeded with no errors
-            if result.returncode == 0:
-                return jsonify({
-                    "success": True,
-                    "errors": [{
-                        "line": 1,
-                        "message": "Code compiles successfully.",
-                        "severity": "info"
-                    }]
-                })
-            
-            # Parse compiler errors
-            errors = []
-            error_pattern = re.compile(r'(.+\.java):(\d+): error: (.*)')
-            warning_pattern = re.compile(r'(.+\.java):(\d+): warning: (.*)')
-            
-            for line in result.stderr.split('\n'):
-                error_match = error_pattern.search(line)
-                warning_match = warning_pattern.search(line)
-                
-                if error_match:
-                    errors.append({
-                        "line": int(error_match.group(2)),
-                        "message": error_match.group(3),
-                        "severity": "error"
-                    })
-                elif warning_match:
-                    errors.append({
-                        "line": int(warning_match.group(2)),
-                        "message": warning_match.group(3),
-                        "severity": "warning"
-                    })
+            if session_id is not None and sequence is not None:
+                ticket = validation_sessions.begin(str(session_id), sequence)
             
-            return jsonify({
-                "success": False,
-                "errors": errors if errors else [{
-                    "line": 1,
-                    "message": "Compilation failed with unrecognized errors.",
-                    "severity": "error"
-                }]
-            })
-        
+            validator = VALIDATORS[language]
+            response = validation_cache.validate(language, code, lambda c: validator(c, ticket))
+            if ticket is not None:
+                ticket.check()
+            count_request(endpoint, 'validated', language=language)
+            return jsonify(response)
+        except ValidationSuperseded:
+            count_request(endpoint, 'superseded', language=language)
+            return jsonify(superseded_response(sequence))
+        except SandboxBusy as e:
+            count_request(endpoint, 'rejected', language=language)
+            return sandbox_busy_response(e)
+        except SandboxTimeout as e:
+            count_request(endpoint, 'timeout', language=language)
+            return jsonify(sandbox_timeout_response(e))
         except Exception as e:
-            return jsonify({
-                "success": False,
-                "errors": [{
-                    "line": 1,
-                    "message": f"Server error: {str(e)}",
-                    "severity": "error"
-                }]
-            })
+            count_request(endpoint, 'error', language=language)
+            return jsonify(server_error_response(e))
         finally:
-            # Clean up the temporary file
-            if os.path.exists(temp_filename):
-                os.unlink(temp_filename)
+            if ticket is not None:
+                validation_sessions.end(ticket)
+
+    @app.route('/api/validate/java', methods=['POST'])
+    def validate_java_code():
+        return run_validation('java')
 
     @app.route('/api/validate/python', methods=['POST'])
     def validate_python_code():
-        code = request.json.get('code')
-        if not code:
-            return jsonify({"errors": [{"line": 1, "message": "No code provided", "severity": "error"}]})
-        
-        errors = []
-        
-        # First, check syntax with ast.parse
-        try:
-            ast.parse(code)
-        except SyntaxError as e:
-            errors.append({
-                "line": e.lineno,
-                "message": f"Syntax error: {e.msg}",
-                "severity": "error"
-            })
-            return jsonify({"success": False, "errors": errors})
-        
-        # If syntax is valid, use pylint for more detailed checks
-        with tempfile.NamedTemporaryFile(suffix=".py", delete=False) as temp:
-            temp_filename = temp.name
-            temp.write(code.encode('utf-8'))
-        
-        try:
-            # Run pylint to check the code
-            result = subprocess.run(
-                ['pylint', '--output-format=json', temp_filename],
-                capture_output=True, 
-                text=True
-            )
-            
-            # If pylint is not available, we'll just return the basic syntax check
-            if result.returncode != 0 and 'command not found' in result.stderr:
-                return jsonify({
-                    "success": True,
-                    "errors": [{
-                        "line": 1,
-                        "message": "Basic syntax check passed (pylint not available for detailed analysis)",
-                        "severity": "info"
-                    }]
-                })
-            
-            # Parse pylint JSON output
-            try:
-                pylint_results = json.loads(result.stdout)
-                
-                for issue in pylint_results:
-                    severity = "warning"
-                    if issue.get('type') in ['error', 'fatal']:
-                        severity = "error"
-                    elif issue.get('type') in ['convention', 'refactor']:
-                        severity = "info"
-                    
-                    errors.append({
-                        "line": issue.get('line', 1),
-                        "message": issue.get('message', 'Unknown issue'),
-                        "severity": severity
-                    })
-            except:
-                # If JSON parsing fails, just do basic checks
-                pass
-            
-            # If no errors were found by pylint
-            if not errors:
-                errors.append({
-                    "line": 1,
-                    "message": "Code looks good!",
-                    "severity": "info"
-                })
-            
-            return jsonify({
-                "success": len([e for e in errors if e['severity'] == 'error']) == 0,
-                "errors": errors
-            })
-        
-        except Exception as e:
-            return jsonify({
-                "success": False,
-                "errors": [{
-                    "line": 1,
-                    "message": f"Server error: {str(e)}",
-                    "severity": "error"
-                }]
-            })
-        finally:
-            # Clean up the temporary file
-            if os.path.exists(temp_filename):
-                os.unlink(temp_filename)
\ No newline at end of file
+        return run_validation('python')
+
+    @app.route('/api/validate/cache', methods=['GET'])
+    def validation_cache_stats():
+        return jsonify(validation_cache.stats())
+
+    @app.route('/api/validate/sessions', methods=['GET'])
+    def validation_session_stats():
+        return jsonify(validation_sessions.stats())
+
+    @app.route('/api/validate/sandbox', methods=['GET'])
+    def sandbox_stats():
+        return jsonify(sandbox.stats())
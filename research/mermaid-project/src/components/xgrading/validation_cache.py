@@ -0,0 +1,216 @@
+import hashlib
+import importlib.metadata
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+# Content-addressed cache of /api/validate/* responses.
+#
+# Results are keyed by (language, toolchain version, SHA-256 of the code), so the
+# same code state (undo/redo, shared starter code) is only compiled once. There is
+# a bounded in-process LRU tier and an optional SQLite tier that every server
+# worker process can share. Only responses from a completed tool run are cached:
+# validators raise UncacheableResponse for fallbacks (tool missing, killed, or
+# output that could not be parsed).
+
+VALIDATION_CACHE_SIZE = int(os.environ.get('XGRADING_VALIDATION_CACHE_SIZE', '1024'))
+# Path of the shared on-disk tier; unset disables it
+VALIDATION_CACHE_DB = os.environ.get('XGRADING_VALIDATION_CACHE_DB')
+VALIDATION_CACHE_DB_MAX = int(os.environ.get('XGRADING_VALIDATION_CACHE_DB_MAX', '100000'))
+
+def _java_toolchain_version():
+    try:
+        result = subprocess.run(['javac', '-version'], capture_output=True, text=True)
+        return (result.stdout or result.stderr).strip() or 'javac-unknown'
+    except OSError:
+        return 'javac-unavailable'
+
+def _python_toolchain_version():
+    try:
+        pylint_version = importlib.metadata.version('pylint')
+    except importlib.metadata.PackageNotFoundError:
+        pylint_version = 'unavailable'
+    return f"python-{platform.python_version()} pylint-{pylint_version}"
+
+TOOLCHAIN_VERSIONS = {
+    'java': _java_toolchain_version,
+    'python': _python_toolchain_version,
+}
+
+class UncacheableResponse(Exception):
+    """
+    A validator's response that must not be cached, e.g. because the tool didn't run to completion.
+    """
+    def __init__(self, response):
+        super().__init__(response)
+        self.response = response
+
+class ValidationCache:
+    """
+    Two-tier (memory LRU + optional SQLite) cache of validation responses.
+    """
+    def __init__(self, max_entries=VALIDATION_CACHE_SIZE, db_path=VALIDATION_CACHE_DB,
+                 db_max_entries=VALIDATION_CACHE_DB_MAX):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.db_max_entries = db_max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._local = threading.local()
+        self._db_ready = False
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_errors = 0
+        self._stores = 0
+
+    def toolchain_version(self, language):
+        if language not in self._versions:
+            self._versions[language] = TOOLCHAIN_VERSIONS[language]()
+        return self._versions[language]
+
+    def key(self, language, code):
+        digest = hashlib.sha256(code.encode('utf-8')).hexdigest()
+        return f"{language}:{self.toolchain_version(language)}:{digest}"
+
+    # --- disk tier ---
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            if not self._db_ready:
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS validation_result ('
+                    ' cache_key TEXT PRIMARY KEY,'
+                    ' language TEXT NOT NULL,'
+                    ' response TEXT NOT NULL,'
+                    ' created_at REAL NOT NULL)'
+                )
+                connection.execute(
+                    'CREATE INDEX IF NOT EXISTS ix_validation_result_created_at'
+                    ' ON validation_result (created_at)'
+                )
+                connection.commit()
+                self._db_ready = True
+            self._local.connection = connection
+        return connection
+
+    def _disk_get(self, key):
+        try:
+            row = self._connection().execute(
+                'SELECT response FROM validation_result WHERE cache_key = ?', (key,)
+            ).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            self.disk_errors += 1
+            print(f"Validation cache read failed: {e}")
+            return None
+
+    def _disk_put(self, key, language, response):
+        try:
+            connection = self._connection()
+            connection.execute(
+                'INSERT OR REPLACE INTO validation_result (cache_key, language, response, created_at)'
+                ' VALUES (?, ?, ?, ?)',
+                (key, language, response, time.time())
+            )
+            self._stores += 1
+            if self._stores % 1000 == 0:
+                # Keep the newest db_max_entries results
+                connection.execute(
+                    'DELETE FROM validation_result WHERE cache_key IN ('
+                    ' SELECT cache_key FROM validation_result ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+                    (self.db_max_entries,)
+                )
+            connection.commit()
+        except sqlite3.Error as e:
+            self.disk_errors += 1
+            print(f"Validation cache write failed: {e}")
+
+    # --- memory tier ---
+
+    def _memory_put(self, key, response):
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, language, code):
+        """
+        Look up a cached response.
+
+        Returns:
+            dict: The cached response, or None on a miss
+        """
+        key = self.key(language, code)
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return json.loads(response)
+
+        if self.db_path:
+            response = self._disk_get(key)
+            if response is not None:
+                self._memory_put(key, response)
+                with self._lock:
+                    self.disk_hits += 1
+                return json.loads(response)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, language, code, response):
+        key = self.key(language, code)
+        serialized = json.dumps(response)
+        self._memory_put(key, serialized)
+        if self.db_path:
+            self._disk_put(key, language, serialized)
+
+    def validate(self, language, code, validator):
+        """
+        Return the cached response for the code, running validator(code) on a miss.
+        The validator raises UncacheableResponse for a response that is returned but not cached.
+        """
+        response = self.get(language, code)
+        if response is None:
+            try:
+                response = validator(code)
+            except UncacheableResponse as e:
+                return e.response
+            self.put(language, code, response)
+        return response
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory": {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.memory_hits
+            },
+            "disk": {
+                "enabled": bool(self.db_path),
+                "path": self.db_path,
+                "hits": self.disk_hits,
+                "errors": self.disk_errors
+            },
+            "misses": self.misses,
+            "lookups": lookups,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "toolchains": dict(self._versions)
+        }
+
+validation_cache = ValidationCache()
@@ -0,0 +1,139 @@
+import threading
+import time
+
+# Supersede tracking for live validation.
+#
+# The editor tags each validation request with its session id and an increasing
+# sequence number. When a newer request from the same session arrives, older
+# in-flight requests are cancelled: their javac/pylint processes are killed,
+# queued pool jobs are skipped, and the request answers with a cheap
+# "superseded" reply instead of diagnostics nobody will look at.
+
+# Sessions idle for longer than this (seconds) are forgotten
+SESSION_TTL = 600
+
+class ValidationSuperseded(Exception):
+    """A newer validation request from the same editor session replaced this one."""
+
+class ValidationTicket:
+    """
+    One in-flight validation request. Cancelling it kills any process attached to it.
+    """
+    def __init__(self, session_id, sequence):
+        self.session_id = session_id
+        self.sequence = sequence
+        self._cancelled = threading.Event()
+        self._processes = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def check(self):
+        """
+        Raises:
+            ValidationSuperseded: If a newer request cancelled this one
+        """
+        if self.cancelled:
+            raise ValidationSuperseded(f"Validation {self.sequence} of session {self.session_id} was superseded")
+
+    def attach(self, process):
+        """Kill process (a subprocess.Popen) if this ticket is cancelled while it runs."""
+        with self._lock:
+            self._processes.append(process)
+            if not self.cancelled:
+                return
+        process.kill()
+
+    def detach(self, process):
+        with self._lock:
+            if process in self._processes:
+                self._processes.remove(process)
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled.set()
+            processes, self._processes = self._processes, []
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+
+class ValidationSessions:
+    """
+    Latest sequence number and in-flight tickets for every editor session.
+    """
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+        self.superseded = 0
+
+    def begin(self, session_id, sequence):
+        """
+        Register a validation request and cancel the older ones of its session.
+
+        Returns:
+            ValidationTicket: The ticket for this request
+        Raises:
+            ValidationSuperseded: If a newer request of the session already arrived
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            session = self._sessions.setdefault(session_id, {"sequence": None, "tickets": [], "seen": now})
+            session["seen"] = now
+            if session["sequence"] is not None and sequence <= session["sequence"]:
+                self.superseded += 1
+                raise ValidationSuperseded(f"Validation {sequence} of session {session_id} arrived after {session['sequence']}")
+            session["sequence"] = sequence
+            stale, session["tickets"] = session["tickets"], []
+            ticket = ValidationTicket(session_id, sequence)
+            session["tickets"].append(ticket)
+            self.superseded += len(stale)
+
+        for old_ticket in stale:
+            old_ticket.cancel()
+        return ticket
+
+    def supersede(self, session_id, sequence):
+        """
+        Cancel the session's in-flight requests older than `sequence` without
+        registering a request of its own (the newer revision runs elsewhere).
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+            stale = [ticket for ticket in session["tickets"] if ticket.sequence < sequence]
+            session["tickets"] = [ticket for ticket in session["tickets"] if ticket.sequence >= sequence]
+            self.superseded += len(stale)
+
+        for old_ticket in stale:
+            old_ticket.cancel()
+
+    def end(self, ticket):
+        with self._lock:
+            session = self._sessions.get(ticket.session_id)
+            if session and ticket in session["tickets"]:
+                session["tickets"].remove(ticket)
+
+    def _prune(self, now):
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        for session_id in [s for s, data in self._sessions.items() if now - data["seen"] > self.ttl]:
+            # Far past the sandbox timeout, so a ticket still here was never ended
+            for ticket in self._sessions.pop(session_id)["tickets"]:
+                ticket.cancel()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "in_flight": sum(len(s["tickets"]) for s in self._sessions.values()),
+                "superseded": self.superseded
+            }
+
+validation_sessions = ValidationSessions()
@@ -0,0 +1,470 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from flask import Response, jsonify, request, stream_with_context
+
+from metrics import count_request, stage_timer
+from sandbox import SandboxBusy, SandboxTimeout, sandbox_timeout_response
+from validate import SYNTAX_CHECKS, VALIDATORS, server_error_response
+from validation_cache import validation_cache
+from validation_sessions import ValidationSuperseded, validation_sessions
+
+# Streaming live validation over Server-Sent Events.
+#
+# The editor opens one EventSource per session:
+#
+#   GET  /api/validate/stream/<sessionId>        text/event-stream
+#   POST /api/validate/stream/<sessionId>        {"code", "seq", "language"}
+#
+# Each POSTed revision replaces the previous one (whose javac/pylint run is
+# cancelled through validation_sessions). The stream validates only the newest
+# revision, in two tiers sent as separate events:
+#
+#   event: syntax       fast structural check (bracket balance / ast.parse)
+#   event: diagnostics  the full /api/validate/<language> response
+#
+# Both carry {"seq", "tier", "success", "errors": [{line, message, severity}]}.
+#
+# An open stream holds one request thread, so each server process serves at most
+# max_streams of them. Past that the stream is refused with 503, and the editor
+# falls back to one /api/validate/<language> request per revision. Revisions live
+# in process memory by default. Set XGRADING_VALIDATION_STREAM_DB to keep them in
+# SQLite, so a revision POSTed to any server process reaches the stream. Without
+# it, `flask serve` with more than one worker refuses every stream.
+
+# Seconds between keep-alive comments (also how quickly a closed stream is noticed)
+KEEPALIVE_INTERVAL = 15
+# Close a stream that has not received a revision for this long; EventSource reconnects
+STREAM_IDLE_TIMEOUT = int(os.environ.get('XGRADING_VALIDATION_STREAM_IDLE', '600'))
+# Client reconnect delay (milliseconds) sent in the stream's retry: field
+RECONNECT_DELAY = 2000
+# Path of the shared SQLite channel store; unset keeps revisions in memory
+VALIDATION_STREAM_DB = os.environ.get('XGRADING_VALIDATION_STREAM_DB')
+# Open streams per server process (0: half the request threads under `flask serve`)
+MAX_STREAMS = int(os.environ.get('XGRADING_MAX_STREAMS', '0'))
+# Limit for the development server, which starts a thread per request
+DEV_MAX_STREAMS = 32
+# How often a stream checks the shared store for revisions POSTed to other processes
+STREAM_POLL_INTERVAL = 0.25
+
+class StreamRefused(Exception):
+    """This process can't hold another validation stream; the client should validate per request."""
+
+class ValidationChannel:
+    """
+    The newest revision of one editor session, waiting to be validated.
+
+    The validation ticket is only created when a stream picks the revision up,
+    so a revision no stream ever reads doesn't leave a ticket behind.
+    """
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.revision = None  # (seq, language, code)
+        self.updated = time.monotonic()
+        # Bumped when a stream (re)connects so the replaced stream stops validating
+        self.generation = 0
+        self._condition = threading.Condition()
+
+    def connect(self):
+        with self._condition:
+            self.generation += 1
+            self._condition.notify_all()
+            return self.generation
+
+    def push(self, sequence, language, code):
+        """
+        Make (sequence, language, code) the revision to validate next.
+
+        Raises:
+            ValidationSuperseded: If a newer revision already arrived
+        """
+        with self._condition:
+            if self.revision is not None and sequence <= self.revision[0]:
+                raise ValidationSuperseded(f"Revision {sequence} of session {self.session_id} is not the newest")
+            self.revision = (sequence, language, code)
+            self.updated = time.monotonic()
+            self._condition.notify_all()
+        # Cancels the in-flight validation of the older revision, if any
+        validation_sessions.supersede(self.session_id, sequence)
+
+    def next_revision(self, after, timeout, generation):
+        """
+        Wait up to timeout seconds for a revision newer than `after`.
+
+        Returns:
+            tuple: The revision, None on timeout, or False if a newer stream replaced this one
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: generation != self.generation or (self.revision and self.revision[0] > after),
+                    max(0.0, deadline - time.monotonic())
+                )
+                if generation != self.generation:
+                    return False
+                if not (self.revision and self.revision[0] > after):
+                    return None
+                sequence, language, code = self.revision
+            try:
+                ticket = validation_sessions.begin(self.session_id, sequence)
+            except ValidationSuperseded:
+                # A per-request validation of this session already went further
+                after = sequence
+                continue
+            return sequence, language, code, ticket
+
+    def idle_seconds(self):
+        return time.monotonic() - self.updated
+
+class ValidationChannels:
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            self._prune()
+            channel = self._channels.get(session_id)
+            if channel is None:
+                channel = self._channels[session_id] = ValidationChannel(session_id)
+            return channel
+
+    def _prune(self):
+        now = time.monotonic()
+        for session_id in [s for s, c in self._channels.items() if now - c.updated > STREAM_IDLE_TIMEOUT]:
+            del self._channels[session_id]
+
+    def __len__(self):
+        return len(self._channels)
+
+class SQLiteValidationChannel:
+    """
+    The newest revision of one editor session, in the shared SQLite store.
+
+    As with ValidationChannel, the stream creates the validation ticket when it
+    picks the revision up. A POST can only cancel an older in-flight validation in its own
+    process; one running elsewhere finishes and is then replaced.
+    """
+    def __init__(self, store, session_id):
+        self.store = store
+        self.session_id = session_id
+
+    def connect(self):
+        connection = self.store._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'INSERT INTO validation_channel (session_id, generation, updated) VALUES (?, 1, ?)'
+                ' ON CONFLICT (session_id) DO UPDATE SET generation = generation + 1',
+                (self.session_id, time.time())
+            )
+            generation = connection.execute(
+                'SELECT generation FROM validation_channel WHERE session_id = ?', (self.session_id,)
+            ).fetchone()[0]
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        self.store._notify()
+        return generation
+
+    def push(self, sequence, language, code):
+        """
+        Make (sequence, language, code) the revision to validate next.
+
+        Raises:
+            ValidationSuperseded: If a newer revision already arrived
+        """
+        cursor = self.store._connection().execute(
+            'INSERT INTO validation_channel (session_id, generation, seq, language, code, updated)'
+            ' VALUES (?, 0, ?, ?, ?, ?)'
+            ' ON CONFLICT (session_id) DO UPDATE SET seq = excluded.seq, language = excluded.language,'
+            ' code = excluded.code, updated = excluded.updated'
+            ' WHERE validation_channel.seq IS NULL OR excluded.seq > validation_channel.seq',
+            (self.session_id, sequence, language, code, time.time())
+        )
+        if cursor.rowcount == 0:
+            raise ValidationSuperseded(f"Revision {sequence} of session {self.session_id} is not the newest")
+        validation_sessions.supersede(self.session_id, sequence)
+        self.store._notify()
+        self.store._prune()
+
+    def next_revision(self, after, timeout, generation):
+        """
+        Wait up to timeout seconds for a revision newer than `after`.
+
+        Returns:
+            tuple: The revision, None on timeout, or False if a newer stream replaced this one
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            row = self.store._connection().execute(
+                'SELECT generation, seq, language, code FROM validation_channel WHERE session_id = ?',
+                (self.session_id,)
+            ).fetchone()
+            if row is None or row["generation"] != generation:
+                return False
+            if row["seq"] is not None and row["seq"] > after:
+                try:
+                    ticket = validation_sessions.begin(self.session_id, row["seq"])
+                except ValidationSuperseded:
+                    # A per-request validation of this session already went further
+                    after = row["seq"]
+                    continue
+                return row["seq"], row["language"], row["code"], ticket
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self.store._wait(min(remaining, STREAM_POLL_INTERVAL))
+
+    def idle_seconds(self):
+        row = self.store._connection().execute(
+            'SELECT updated FROM validation_channel WHERE session_id = ?', (self.session_id,)
+        ).fetchone()
+        return time.time() - row["updated"] if row else STREAM_IDLE_TIMEOUT + 1
+
+class SQLiteValidationChannels:
+    """
+    Channels in a SQLite file, shared by every process that opens it.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._db_ready = False
+        self._last_prune = 0.0
+        # Wakes this process's streams early; other processes are seen by polling
+        self._condition = threading.Condition()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            if not self._db_ready:
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS validation_channel ('
+                    ' session_id TEXT PRIMARY KEY,'
+                    ' generation INTEGER NOT NULL,'
+                    ' seq INTEGER,'
+                    ' language TEXT,'
+                    ' code TEXT,'
+                    ' updated REAL NOT NULL)'
+                )
+                connection.execute(
+                    'CREATE INDEX IF NOT EXISTS ix_validation_channel_updated ON validation_channel (updated)'
+                )
+                self._db_ready = True
+            self._local.connection = connection
+        return connection
+
+    def _notify(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    def _wait(self, timeout):
+        with self._condition:
+            self._condition.wait(timeout)
+
+    def _prune(self):
+        now = time.time()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        self._connection().execute(
+            'DELETE FROM validation_channel WHERE updated < ?', (now - STREAM_IDLE_TIMEOUT,)
+        )
+
+    def get(self, session_id):
+        return SQLiteValidationChannel(self, session_id)
+
+    def __len__(self):
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM validation_channel WHERE updated >= ?', (time.time() - STREAM_IDLE_TIMEOUT,)
+        ).fetchone()[0]
+
+class ValidationStreams:
+    """
+    The channel store and the number of streams this process holds open.
+    """
+    def __init__(self, channels, max_streams=MAX_STREAMS or DEV_MAX_STREAMS):
+        self.channels = channels
+        self.max_streams = max_streams
+        # Why streams are refused altogether, if they are
+        self.disabled = None
+        self.open = 0
+        self.refused = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Raises:
+            StreamRefused: If streams are disabled or this process holds max_streams already
+        """
+        with self._lock:
+            if self.disabled or self.open >= self.max_streams:
+                self.refused += 1
+                raise StreamRefused(self.disabled or f"{self.open} validation streams open")
+            self.open += 1
+
+    def release(self):
+        with self._lock:
+            self.open -= 1
+
+    def stats(self):
+        return {
+            "backend": "sqlite" if isinstance(self.channels, SQLiteValidationChannels) else "memory",
+            "channels": len(self.channels),
+            "open": self.open,
+            "max_streams": self.max_streams,
+            "refused": self.refused,
+            "disabled": self.disabled
+        }
+
+validation_streams = ValidationStreams(
+    SQLiteValidationChannels(VALIDATION_STREAM_DB) if VALIDATION_STREAM_DB else ValidationChannels()
+)
+
+def configure_validation_streams(workers, threads):
+    """
+    Size validation streams for `flask serve`, before the workers are started.
+
+    Args:
+        workers (int): Server worker processes
+        threads (int): Request threads per worker
+    """
+    # Leave at least half of the request threads for everything else
+    validation_streams.max_streams = MAX_STREAMS or max(1, threads // 2)
+    if workers > 1 and not isinstance(validation_streams.channels, SQLiteValidationChannels):
+        validation_streams.disabled = "validation streams need XGRADING_VALIDATION_STREAM_DB with several workers"
+        print(f"Live validation streams are off: {validation_streams.disabled}")
+
+def stream_refused_response(e):
+    # EventSource doesn't retry a 503: the editor validates per request instead
+    response = jsonify({"error": str(e), "fallback": "/api/validate/<language>"})
+    response.status_code = 503
+    return response
+
+def sse_event(event, sequence, data):
+    return f"id: {sequence}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+def validation_events(channel, after=-1):
+    """
+    Generate the SSE stream of one editor session.
+
+    Args:
+        channel (ValidationChannel): The session's channel
+        after (int): Last sequence the client already has (from Last-Event-ID)
+    """
+    generation = channel.connect()
+    yield f"retry: {RECONNECT_DELAY}\n\n"
+    while True:
+        revision = channel.next_revision(after, KEEPALIVE_INTERVAL, generation)
+        if revision is False:
+            return
+        if revision is None:
+            if channel.idle_seconds() > STREAM_IDLE_TIMEOUT:
+                return
+            yield ": keep-alive\n\n"
+            continue
+
+        sequence, language, code, ticket = revision
+        after = sequence
+        try:
+            with stage_timer('/api/validate/stream', 'syntax_tier', language=language):
+                errors = SYNTAX_CHECKS[language](code)
+            ticket.check()
+            yield sse_event('syntax', sequence, {
+                "seq": sequence,
+                "tier": "syntax",
+                "success": not errors,
+                "errors": errors
+            })
+
+            with stage_timer('/api/validate/stream', 'compiler_tier', language=language):
+                response = validation_cache.validate(language, code, lambda c: VALIDATORS[language](c, ticket))
+            ticket.check()
+            count_request('/api/validate/stream', 'validated', language=language)
+            yield sse_event('diagnostics', sequence, dict(response, seq=sequence, tier="compiler"))
+        except ValidationSuperseded:
+            # A newer revision is already waiting
+            count_request('/api/validate/stream', 'superseded', language=language)
+        except SandboxBusy as e:
+            # The syntax tier already answered; the next revision gets another chance
+            count_request('/api/validate/stream', 'rejected', language=language)
+            yield sse_event('diagnostics', sequence, {
+                "seq": sequence, "tier": "compiler", "success": False, "busy": True,
+                "retryAfter": e.retry_after, "errors": []
+            })
+        except SandboxTimeout as e:
+            count_request('/api/validate/stream', 'timeout', language=language)
+            yield sse_event('diagnostics', sequence, dict(sandbox_timeout_response(e), seq=sequence, tier="compiler"))
+        except Exception as e:
+            count_request('/api/validate/stream', 'error', language=language)
+            yield sse_event('diagnostics', sequence, dict(server_error_response(e), seq=sequence, tier="compiler"))
+        finally:
+            validation_sessions.end(ticket)
+
+def setup_validation_stream_routes(app):
+    """
+    Set up the streaming validation routes.
+
+    Args:
+        app: The Flask application
+    """
+    @app.route('/api/validate/stream/<session_id>', methods=['GET'])
+    def validation_stream(session_id):
+        try:
+            after = int(request.headers.get('Last-Event-ID', -1))
+        except ValueError:
+            after = -1
+        try:
+            validation_streams.acquire()
+        except StreamRefused as e:
+            count_request('/api/validate/stream', 'refused')
+            return stream_refused_response(e)
+
+        def events():
+            try:
+                yield from validation_events(validation_streams.channels.get(session_id), after)
+            finally:
+                validation_streams.release()
+
+        return Response(
+            stream_with_context(events()),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                # Don't let a reverse proxy buffer the events
+                'X-Accel-Buffering': 'no'
+            }
+        )
+
+    @app.route('/api/validate/stream/<session_id>', methods=['POST'])
+    def push_revision(session_id):
+        data = request.get_json(silent=True) or {}
+        code = data.get('code')
+        language = data.get('language')
+        if language not in VALIDATORS:
+            return jsonify({"accepted": False, "error": f"Unsupported language: {language}"}), 400
+        if not code:
+            return jsonify({"accepted": False, "error": "No code provided"}), 400
+        try:
+            sequence = int(data.get('seq'))
+        except (TypeError, ValueError):
+            return jsonify({"accepted": False, "error": "seq must be an integer"}), 400
+
+        try:
+            validation_streams.channels.get(session_id).push(sequence, language, code)
+        except ValidationSuperseded:
+            return jsonify({"accepted": False, "superseded": True, "seq": sequence})
+        return jsonify({"accepted": True, "seq": sequence}), 202
+
+    @app.route('/api/validate/streams', methods=['GET'])
+    def validation_stream_stats():
+        return jsonify(validation_streams.stats())